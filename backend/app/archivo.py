@@ -0,0 +1,78 @@
+# app/archivo.py
+"""
+Archivo de gestiones terminadas y borradas.
+
+Las gestiones en `archivo_estados` (o con is_deleted) sin cambios hace más de
+`archivo_dias` días pasan de `gestiones` a `gestiones_archivo` en lotes, cada
+lote en una transacción (ARCHIVAR_GESTIONES). Así la tabla caliente que leen
+list/count/búsqueda queda del tamaño del trabajo activo; con
+`incluir_archivo=true` los endpoints leen las dos.
+
+Se corre como job (POST /jobs/archivar_gestiones) o programado desde cron /
+Cloud Scheduler:
+
+    python -m app.archivo [--dias 180]
+"""
+import argparse
+import json
+import logging
+import sys
+from typing import Any, Dict, List, Optional
+
+from google.cloud.bigquery import ArrayQueryParameter
+
+from .bq import fqtn, run_query
+from .config import settings
+from .deps import qparams
+from . import sql_gestiones as Q
+
+log = logging.getLogger(__name__)
+
+
+def fmt_tables(sql_text: str) -> str:
+    return sql_text.format(
+        gestiones=fqtn("infra_gestion.gestiones"),
+        archivo=fqtn("infra_gestion.gestiones_archivo"),
+    )
+
+
+def archivar_gestiones(user: Optional[Dict[str, Any]] = None, dias: Optional[int] = None) -> Dict[str, Any]:
+    """Un solo job (script): hasta `archivo_max_lotes` lotes de `archivo_lote` gestiones."""
+    dias = settings.archivo_dias if dias is None else dias
+    cfg = qparams(
+        [
+            ("dias", "INT64", dias),
+            ("lote", "INT64", settings.archivo_lote),
+            ("max_lotes", "INT64", settings.archivo_max_lotes),
+        ],
+        [ArrayQueryParameter("estados", "STRING", settings.archivo_estados)],
+    )
+    rows = run_query(fmt_tables(Q.ARCHIVAR_GESTIONES), cfg, user=user, write=True)
+    r = rows[0] if rows else {}
+    movidas, lotes = int(r.get("movidas") or 0), int(r.get("lotes") or 0)
+    log.info("archivo: %d gestiones movidas en %d lotes (corte %s)", movidas, lotes, r.get("corte"))
+    return {
+        "movidas": movidas,
+        "lotes": lotes,
+        "corte": r.get("corte"),
+        # quedó trabajo pendiente: la próxima corrida sigue
+        "incompleto": lotes >= settings.archivo_max_lotes,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    logging.basicConfig(level=logging.INFO)
+    p = argparse.ArgumentParser(prog="python -m app.archivo", description=__doc__.splitlines()[1])
+    p.add_argument("--dias", type=int, default=None, help=f"antigüedad mínima (default {settings.archivo_dias})")
+    args = p.parse_args(argv)
+    try:
+        res = archivar_gestiones(dias=args.dias)
+    except Exception as e:
+        log.error("archivo: falló: %s", e)
+        return 2
+    print(json.dumps(res, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
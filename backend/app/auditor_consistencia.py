@@ -0,0 +1,257 @@
+# app/auditor_consistencia.py
+"""
+Auditor de consistencia entre gestiones y gestiones_eventos.
+
+El alta y el cambio de estado escriben la fila y el evento en jobs separados:
+si falla el segundo quedan gestiones cuyo estado no coincide con su historia.
+Este auditor recorre todo el historial (tabla caliente + gestiones_archivo) y
+reporta:
+
+- huerfanos: eventos de un id_gestion que no existe en gestiones.
+- sin_creacion: gestiones sin evento CREACION.
+- estado_distinto: estado de la fila != estado_nuevo del último
+  CREACION/CAMBIO_ESTADO (por fecha_evento, id_evento).
+
+Si las tablas están clusterizadas por id_gestion (se verifica en la metadata,
+ver app/sql_consistencia.py) recorre por rangos de id_gestion (cotas por
+cuantiles aproximados): un pool de threads lee de BigQuery ambas tablas por
+rango (`consistencia_hilos`) y cada rango leído se compara en un pool de
+procesos (`consistencia_procesos`), así la lectura del rango siguiente se
+superpone con la comparación del anterior. Sin ese clustering cada rango sería
+un scan completo: se lee cada tabla una sola vez, las filas vienen con su rango
+por FARM_FINGERPRINT(id_gestion) y se reparten en memoria entre los procesos.
+
+Se corre como job (POST /jobs/consistencia, descarga el detalle en JSON) o desde
+la línea de comandos:
+
+    python -m app.auditor_consistencia [--rangos 32] [--salida reporte.json]
+
+Código de salida: 0 consistente, 1 con hallazgos, 2 error.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from google.api_core.exceptions import NotFound
+
+from .bq import bq_client, fqtn, run_query
+from .config import settings
+from .deps import qparams
+from . import sql_consistencia as QC
+from . import sql_gestiones as QG
+
+log = logging.getLogger(__name__)
+
+HALLAZGOS = ("huerfanos", "sin_creacion", "estado_distinto")
+_EVENTOS_ESTADO = ("CREACION", "CAMBIO_ESTADO")
+
+
+def _comparar(
+    rango: int,
+    gestiones: List[Tuple[str, Optional[str], bool]],
+    eventos: List[Tuple[str, str, Any, str, Optional[str]]],
+) -> Dict[str, Any]:
+    """Corre en un proceso del pool: solo tipos simples (picklables) de entrada y salida."""
+    filas = {g[0]: g for g in gestiones}
+    # fecha NULL (datos viejos) primero: cuenta como el evento más antiguo
+    eventos.sort(key=lambda e: (e[0], e[2] is not None, e[2] or 0, e[1]))
+
+    out: Dict[str, Any] = {"rango": rango, "gestiones": len(gestiones), "eventos": len(eventos)}
+    for h in HALLAZGOS:
+        out[h] = []
+
+    con_creacion = set()
+    i, n = 0, len(eventos)
+    while i < n:
+        id_gestion = eventos[i][0]
+        j = i
+        ultimo = None
+        while j < n and eventos[j][0] == id_gestion:
+            _, id_evento, fecha, tipo, estado_nuevo = eventos[j]
+            if tipo == "CREACION":
+                con_creacion.add(id_gestion)
+            if tipo in _EVENTOS_ESTADO and estado_nuevo is not None:
+                ultimo = (estado_nuevo, id_evento, fecha)
+            j += 1
+
+        fila = filas.get(id_gestion)
+        if fila is None:
+            out["huerfanos"].append({"id_gestion": id_gestion, "eventos": j - i})
+        elif ultimo is not None and fila[1] != ultimo[0]:
+            out["estado_distinto"].append({
+                "id_gestion": id_gestion,
+                "estado": fila[1],
+                "estado_eventos": ultimo[0],
+                "id_evento": ultimo[1],
+                "fecha_evento": ultimo[2].isoformat() if ultimo[2] is not None else None,
+                "borrada": bool(fila[2]),
+            })
+        i = j
+
+    for id_gestion, estado, borrada in gestiones:
+        if id_gestion not in con_creacion:
+            out["sin_creacion"].append({"id_gestion": id_gestion, "estado": estado, "borrada": bool(borrada)})
+    return out
+
+
+def _clusterizada(tabla: str) -> bool:
+    """True si el primer campo de clustering es id_gestion (NotFound si no existe)."""
+    campos = bq_client().get_table(tabla).clustering_fields or []
+    return campos[:1] == ["id_gestion"]
+
+
+def _tablas() -> Tuple[Dict[str, str], bool]:
+    """
+    (sql por consulta, podable). Incluye el archivo si existe; `podable` si todas
+    las tablas están clusterizadas por id_gestion y el recorte por rango poda.
+    """
+    tablas = {
+        "gestiones": fqtn("infra_gestion.gestiones"),
+        "archivo": fqtn("infra_gestion.gestiones_archivo"),
+        "eventos": fqtn("infra_gestion.gestiones_eventos"),
+    }
+    sql = {
+        "gestiones_rango": QC.GESTIONES_RANGO,
+        "eventos_rango": QC.EVENTOS_RANGO,
+        "limites": QC.LIMITES_RANGOS,
+        "gestiones_hash": QC.GESTIONES_HASH,
+        "eventos_hash": QC.EVENTOS_HASH,
+    }
+    try:
+        podable = _clusterizada(tablas["archivo"])
+        sql = {k: v.replace("`{gestiones}`", QG.GESTIONES_CON_ARCHIVO) for k, v in sql.items()}
+    except NotFound:
+        podable = True
+    podable = podable and _clusterizada(tablas["gestiones"]) and _clusterizada(tablas["eventos"])
+    return {k: v.format(**tablas) for k, v in sql.items()}, podable
+
+
+def _rangos(sql_limites: str, rangos: int) -> List[Tuple[Optional[str], Optional[str]]]:
+    rows = run_query(sql_limites, qparams([("rangos", "INT64", rangos)]))
+    limites = (rows[0]["limites"] if rows else None) or []
+    # sin cota en los extremos: así entran ids (y huérfanos) fuera de [min, max]
+    cortes = sorted(set(limites[1:-1]))
+    cotas: List[Optional[str]] = [None, *cortes, None]
+    return list(zip(cotas[:-1], cotas[1:]))
+
+
+def _leer(sql_gestiones: str, sql_eventos: str, desde: Optional[str], hasta: Optional[str]):
+    cfg = qparams([("desde", "STRING", desde), ("hasta", "STRING", hasta)])
+    gestiones = [(r["id_gestion"], r["estado"], r["is_deleted"]) for r in run_query(sql_gestiones, cfg)]
+    eventos = [
+        (r["id_gestion"], r["id_evento"], r["fecha_evento"], r["tipo_evento"], r["estado_nuevo"])
+        for r in run_query(sql_eventos, cfg)
+    ]
+    return gestiones, eventos
+
+
+def _leer_hash(sql: Dict[str, str], rangos: int):
+    """Un scan por tabla; devuelve las filas ya repartidas por rango (FARM_FINGERPRINT)."""
+    cfg = qparams([("rangos", "INT64", rangos)])
+    gestiones: List[list] = [[] for _ in range(rangos)]
+    eventos: List[list] = [[] for _ in range(rangos)]
+    # id_gestion NULL -> rango NULL: van al 0, como cualquier otro id
+    for r in run_query(sql["gestiones_hash"], cfg):
+        gestiones[r["rango"] or 0].append((r["id_gestion"], r["estado"], r["is_deleted"]))
+    for r in run_query(sql["eventos_hash"], cfg):
+        eventos[r["rango"] or 0].append(
+            (r["id_gestion"], r["id_evento"], r["fecha_evento"], r["tipo_evento"], r["estado_nuevo"])
+        )
+    return gestiones, eventos
+
+
+def auditar(
+    rangos: Optional[int] = None,
+    progreso: Optional[Callable[[int, int], None]] = None,
+    verificar: Optional[Callable[[], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Recorre todo y devuelve {"resumen": {...}, "detalle": {hallazgo: [...]}}.
+    `progreso(hechos, total)` por rango comparado; `verificar()` puede cortar
+    (cancelación de job) entre rangos.
+    """
+    t0 = time.perf_counter()
+    rangos = max(1, rangos or settings.consistencia_rangos)
+    sql, podable = _tablas()
+    if podable:
+        cotas = _rangos(sql["limites"], rangos)
+        total = len(cotas)
+    else:
+        log.warning("consistencia: tablas sin clustering por id_gestion, un scan por tabla")
+        total = rangos
+
+    resumen: Dict[str, Any] = {"rangos": total, "particion": "id_gestion" if podable else "hash", "gestiones": 0, "eventos": 0}
+    detalle: Dict[str, List[Dict[str, Any]]] = {h: [] for h in HALLAZGOS}
+
+    lectores = ThreadPoolExecutor(max_workers=settings.consistencia_hilos, thread_name_prefix="consistencia")
+    # spawn: el proceso padre tiene threads (uvicorn, BigQuery) y fork con locks tomados se cuelga
+    comparadores = ProcessPoolExecutor(
+        max_workers=settings.consistencia_procesos,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+    try:
+        comparaciones = []
+        if podable:
+            lecturas = {
+                lectores.submit(_leer, sql["gestiones_rango"], sql["eventos_rango"], desde, hasta): i
+                for i, (desde, hasta) in enumerate(cotas)
+            }
+            for f in as_completed(lecturas):
+                if verificar:
+                    verificar()
+                gestiones, eventos = f.result()
+                comparaciones.append(comparadores.submit(_comparar, lecturas[f], gestiones, eventos))
+        else:
+            por_rango = _leer_hash(sql, rangos)
+            for i, (gestiones, eventos) in enumerate(zip(*por_rango)):
+                if verificar:
+                    verificar()
+                comparaciones.append(comparadores.submit(_comparar, i, gestiones, eventos))
+
+        for hechos, f in enumerate(as_completed(comparaciones), start=1):
+            r = f.result()
+            resumen["gestiones"] += r["gestiones"]
+            resumen["eventos"] += r["eventos"]
+            for h in HALLAZGOS:
+                detalle[h].extend(r[h])
+            if progreso:
+                progreso(hechos, total)
+    finally:
+        lectores.shutdown(wait=True, cancel_futures=True)
+        comparadores.shutdown(wait=True, cancel_futures=True)
+
+    for h in HALLAZGOS:
+        detalle[h].sort(key=lambda x: x["id_gestion"])
+        resumen[h] = len(detalle[h])
+    resumen["duracion_s"] = round(time.perf_counter() - t0, 1)
+    log.info("consistencia: %s", resumen)
+    return {"resumen": resumen, "detalle": detalle}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    logging.basicConfig(level=logging.INFO)
+    p = argparse.ArgumentParser(prog="python -m app.auditor_consistencia", description=__doc__.splitlines()[1])
+    p.add_argument("--rangos", type=int, default=None, help=f"rangos de id_gestion (default {settings.consistencia_rangos})")
+    p.add_argument("--salida", default=None, help="archivo JSON con el detalle de los hallazgos")
+    args = p.parse_args(argv)
+
+    try:
+        reporte = auditar(args.rangos)
+    except Exception as e:
+        log.error("consistencia: falló: %s", e)
+        return 2
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(reporte, f, ensure_ascii=False, indent=2)
+    print(json.dumps(reporte["resumen"], ensure_ascii=False))
+    return 1 if any(reporte["resumen"][h] for h in HALLAZGOS) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
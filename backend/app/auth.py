@@ -1,12 +1,19 @@
 # app/auth.py
 from fastapi import Header, HTTPException
-from google.oauth2 import id_token
+from google.auth import jwt
 from google.auth.transport import requests
 from typing import Optional, Dict, Any
+import json
+import re
+import threading
+import time
 
 from .config import settings
-from .bq import bq_client, fqtn
+from .bq import fqtn, run_query
 from .deps import qparams
+from . import sql_usuarios as Q
+from .tracing import phase
+from . import sessions
 
 
 def _get_bq_user(email: str) -> Optional[Dict[str, Any]]:
@@ -14,57 +21,73 @@ def _get_bq_user(email: str) -> Optional[Dict[str, Any]]:
     Busca el usuario en BigQuery (tabla usuarios_roles).
     Debe existir y estar activo para autorizar.
     """
-    table = fqtn("infra_gestion.usuarios_roles")
-
-    # Normalizamos 'activo' a BOOL:
-    # - si activo ya es BOOL -> SAFE_CAST(activo AS BOOL) funciona
-    # - si activo es STRING ("true"/"false") -> SAFE_CAST da NULL, entonces usamos LOWER(...) = "true"
-    q = f"""
-    SELECT
-      email,
-      nombre,
-      rol,
-      CASE
-        WHEN SAFE_CAST(activo AS BOOL) IS NOT NULL THEN SAFE_CAST(activo AS BOOL)
-        WHEN LOWER(CAST(activo AS STRING)) = "true" THEN TRUE
-        ELSE FALSE
-      END AS activo
-    FROM `{table}`
-    WHERE LOWER(email) = LOWER(@email)
-    LIMIT 1
-    """
-
-    job = bq_client().query(q, job_config=qparams([("email", "STRING", email)]))
-    rows = list(job.result())
+    # prioritario: toda request (incluidas las escrituras) espera este lookup
+    rows = run_query(
+        Q.GET_USUARIO_AUTH.format(usuarios_roles=fqtn("infra_gestion.usuarios_roles")),
+        qparams([("email", "STRING", email)]),
+        prioritario=True,
+    )
     return dict(rows[0]) if rows else None
 
 
-def require_user(authorization: str = Header(default="")) -> Dict[str, Any]:
+_GOOGLE_CERTS_URL = "https://www.googleapis.com/oauth2/v1/certs"
+_GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+
+_certs_lock = threading.Lock()
+_certs: Dict[str, str] = {}
+_certs_expira = 0.0
+_http = requests.Request()
+
+
+def google_certs(forzar: bool = False) -> Dict[str, str]:
     """
-    Valida token de Google (id_token) y luego verifica permisos en usuarios_roles.
-    Devuelve un dict con {email, nombre, rol}.
+    Certificados de firma de Google, cacheados según su Cache-Control.
+    verify_oauth2_token los descargaba en cada request.
     """
+    global _certs, _certs_expira
+    with _certs_lock:
+        if _certs and not forzar and time.monotonic() < _certs_expira:
+            return _certs
+
+        resp = _http(url=_GOOGLE_CERTS_URL, method="GET")
+        if resp.status != 200:
+            raise RuntimeError(f"No se pudieron obtener los certs de Google (HTTP {resp.status})")
+
+        m = re.search(r"max-age=(\d+)", resp.headers.get("cache-control", ""))
+        _certs = json.loads(resp.data.decode("utf-8"))
+        _certs_expira = time.monotonic() + (int(m.group(1)) if m else 3600)
+        return _certs
+
+
+def _verificar_google(token: str) -> Dict[str, Any]:
+    """Equivalente a id_token.verify_oauth2_token pero con los certs cacheados."""
+    try:
+        claims = jwt.decode(token, certs=google_certs(), audience=settings.google_client_id)
+    except ValueError as e:
+        # rotación de claves: kid nuevo que todavía no está en el cache
+        if "Certificate for key id" not in str(e):
+            raise
+        claims = jwt.decode(token, certs=google_certs(forzar=True), audience=settings.google_client_id)
+
+    if claims.get("iss") not in _GOOGLE_ISSUERS:
+        raise ValueError("Wrong issuer")
+    return claims
+
+
+def _bearer(authorization: str) -> str:
     if not isinstance(authorization, str) or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Missing Bearer token")
 
     token = authorization.split(" ", 1)[1].strip()
     if not token:
         raise HTTPException(status_code=401, detail="Empty token")
+    return token
 
-    try:
-        claims = id_token.verify_oauth2_token(
-            token,
-            requests.Request(),
-            settings.google_client_id,
-        )
-    except Exception:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
-    email = (claims.get("email") or "").lower().strip()
-    if not email:
-        raise HTTPException(status_code=401, detail="Token without email")
 
-    user = _get_bq_user(email)
+def usuario_autorizado(email: str) -> Dict[str, Any]:
+    """Lookup en usuarios_roles: debe existir y estar activo."""
+    with phase("auth_usuario"):
+        user = _get_bq_user(email)
     if not user:
         raise HTTPException(status_code=403, detail="Not authorized (user not found)")
 
@@ -76,3 +99,56 @@ def require_user(authorization: str = Header(default="")) -> Dict[str, Any]:
         "nombre": user.get("nombre"),
         "rol": user["rol"],
     }
+
+
+def require_google_user(authorization: str = Header(default="")) -> Dict[str, Any]:
+    """
+    Valida token de Google (id_token) y luego verifica permisos en usuarios_roles.
+    Devuelve un dict con {email, nombre, rol}.
+    """
+    token = _bearer(authorization)
+    try:
+        with phase("auth_token"):
+            claims = _verificar_google(token)
+    except Exception:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    email = (claims.get("email") or "").lower().strip()
+    if not email:
+        raise HTTPException(status_code=401, detail="Token without email")
+
+    return usuario_autorizado(email)
+
+
+def _sesion(authorization: str, refresh: bool) -> Dict[str, Any]:
+    token = _bearer(authorization)
+    if not sessions.es_token_sesion(token):
+        raise HTTPException(status_code=401, detail="Session token required")
+    try:
+        with phase("auth_sesion"):
+            return sessions.verificar(token, refresh=refresh)
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=401, detail="Invalid session")
+
+
+def require_session(authorization: str = Header(default="")) -> Dict[str, Any]:
+    """Claims de un token de sesión propio (ver app/sessions.py)."""
+    return _sesion(authorization, refresh=False)
+
+
+def require_session_refresh(authorization: str = Header(default="")) -> Dict[str, Any]:
+    """Como require_session, pero acepta tokens revocados por cambio de rol / baja."""
+    return _sesion(authorization, refresh=True)
+
+
+def require_user(authorization: str = Header(default="")) -> Dict[str, Any]:
+    """
+    Token de sesión (POST /auth/session): solo verificación de firma en memoria.
+    Si no, id_token de Google + usuarios_roles, como antes.
+    Devuelve un dict con {email, nombre, rol}.
+    """
+    token = _bearer(authorization)
+    if sessions.es_token_sesion(token):
+        claims = require_session(authorization)
+        return {"email": claims["email"], "nombre": claims.get("nombre"), "rol": claims["rol"]}
+    return require_google_user(authorization)
@@ -1,18 +1,181 @@
 # app/bq.py
+import socket
+import threading
+import time
+
+import google.auth
+from google.api_core.exceptions import GoogleAPICallError
+from google.auth.transport.requests import AuthorizedSession
+from fastapi import HTTPException
 from google.cloud import bigquery
+from requests.adapters import HTTPAdapter
+from typing import Any, Dict, List, Optional
+from urllib3.connection import HTTPConnection
+
 from .config import settings
+from .cost_guard import guard
+from .scheduler import scheduler
+from .singleflight import clave, singleflight
+from .tracing import phase, registrar
 
 _client = None
+_client_lock = threading.Lock()
+_adapter: Optional[HTTPAdapter] = None
+
+
+class _PooledAdapter(HTTPAdapter):
+    """HTTPAdapter con socket options (TCP keep-alive) para el pool de urllib3."""
+
+    def __init__(self, socket_options=None, **kwargs):
+        self._socket_options = socket_options
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self._socket_options:
+            kwargs["socket_options"] = self._socket_options
+        super().init_poolmanager(*args, **kwargs)
+
+
+def _socket_options() -> list:
+    opts = list(HTTPConnection.default_socket_options)
+    if settings.bq_http_keepalive_s <= 0:
+        return opts
+    opts.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+    # TCP_KEEPIDLE/INTVL solo existen en Linux; en otros SO queda el default del kernel
+    if hasattr(socket, "TCP_KEEPIDLE"):
+        opts.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, int(settings.bq_http_keepalive_s)))
+    if hasattr(socket, "TCP_KEEPINTVL"):
+        opts.append((socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, max(1, int(settings.bq_http_keepalive_s) // 3)))
+    return opts
+
+
+def _crear_client() -> bigquery.Client:
+    global _adapter
+    credentials, project = google.auth.default(scopes=bigquery.Client.SCOPE)
+
+    # El adapter por defecto de requests tiene pool_maxsize=10: con más threads
+    # concurrentes se descartan conexiones y cada job nuevo paga un handshake TLS.
+    session = AuthorizedSession(credentials)
+    adapter = _PooledAdapter(
+        socket_options=_socket_options(),
+        pool_connections=settings.bq_http_pool_hosts,
+        pool_maxsize=settings.bq_http_pool_size,
+    )
+    session.mount("https://", adapter)
+    _adapter = adapter
+
+    # Si settings.gcp_project está vacío, BigQuery usa el proyecto por defecto de credenciales
+    return bigquery.Client(
+        project=settings.gcp_project or project,
+        credentials=credentials,
+        _http=session,
+    )
 
 
 def bq_client() -> bigquery.Client:
+    """Cliente único por proceso; seguro ante primer uso concurrente desde el threadpool."""
     global _client
     if _client is None:
-        # Si settings.gcp_project está vacío, BigQuery usa el proyecto por defecto de credenciales
-        _client = bigquery.Client(project=settings.gcp_project or None)
+        with _client_lock:
+            if _client is None:
+                _client = _crear_client()
     return _client
 
 
+def estado_http_pool() -> Dict[str, Any]:
+    """Estadísticas del pool de conexiones HTTP del cliente BigQuery."""
+    out: Dict[str, Any] = {
+        "pool_maxsize": settings.bq_http_pool_size,
+        "pool_hosts": settings.bq_http_pool_hosts,
+        "keepalive_s": settings.bq_http_keepalive_s,
+        "hosts": [],
+    }
+    if _adapter is None:
+        return out
+
+    pools = _adapter.poolmanager.pools
+    for key in list(pools.keys()):
+        pool = pools.get(key)
+        if pool is None:
+            continue
+        creadas = pool.num_connections
+        requests_ = pool.num_requests
+        out["hosts"].append({
+            "host": pool.host,
+            "conexiones_creadas": creadas,
+            "requests": requests_,
+            # la cola de urllib3 viene pre-llenada con None: solo cuentan conexiones reales
+            "idle": sum(1 for c in list(pool.pool.queue) if c is not None) if pool.pool is not None else 0,
+            "reuso": round(1 - creadas / requests_, 3) if requests_ else None,
+        })
+    return out
+
+
+def _ejecutar(
+    client: bigquery.Client,
+    query: str,
+    cfg: bigquery.QueryJobConfig,
+    user: Optional[Dict[str, Any]],
+    write: bool,
+    prioritario: bool,
+) -> List[bigquery.Row]:
+    if not write:
+        with phase("bq_costo"):
+            guard.admitir(client, query, cfg, user)
+
+    t_cola = time.perf_counter()
+    with scheduler.turno(user, prioritario=write or prioritario):
+        registrar("bq_cola", time.perf_counter() - t_cola)
+        with phase("bq", write=write):
+            job = client.query(query, job_config=cfg)
+            try:
+                rows = list(job.result())
+            except GoogleAPICallError as e:
+                # el reason no está en str(e) ("400 Query exceeded limit for bytes billed: ..."), sí en errors
+                if any(err.get("reason") == "bytesBilledLimitExceeded" for err in (e.errors or [])):
+                    raise HTTPException(
+                        status_code=400,
+                        detail="Consulta demasiado costosa. Agregá filtros para acotarla.",
+                    )
+                raise
+    guard.registrar(job, user)
+    return rows
+
+
+def _error_propio(e: BaseException) -> bool:
+    # 429 por cupo/budget del usuario líder: no se contagia a los demás
+    return isinstance(e, HTTPException) and e.status_code == 429
+
+
+def run_query(
+    query: str,
+    job_config: Optional[bigquery.QueryJobConfig] = None,
+    *,
+    user: Optional[Dict[str, Any]] = None,
+    write: bool = False,
+    prioritario: bool = False,
+) -> List[bigquery.Row]:
+    """
+    Punto único de ejecución contra BigQuery.
+    Las lecturas pasan por el guard de costo (dry-run + budgets); las escrituras
+    no se rechazan pero sí se contabilizan. Todo job toma turno en el scheduler:
+    escrituras y lecturas `prioritario` (las que preceden a una escritura) pasan
+    antes que listados/búsquedas. Lecturas idénticas en vuelo se coalescen en un
+    solo job (single-flight). Devuelve las filas materializadas.
+    """
+    client = bq_client()
+    cfg = job_config or bigquery.QueryJobConfig()
+    if write:
+        return _ejecutar(client, query, cfg, user, write, prioritario)
+
+    rows = singleflight.do(
+        clave(query, cfg),
+        lambda: _ejecutar(client, query, cfg, user, write, prioritario),
+        reintentar_si=_error_propio,
+    )
+    return list(rows)
+
+
 def fqtn(table: str) -> str:
     """
     Fully Qualified Table Name (FQTN).
@@ -0,0 +1,165 @@
+# app/catalogos_cache.py
+"""
+Catálogos y geo_localidades en memoria, con TTL.
+Son tablas chicas que cambian poco: se cargan completas (una query cada una)
+y los endpoints / el alta de gestiones las leen sin ir a BigQuery.
+Vencido el TTL se sigue sirviendo la copia anterior mientras un thread la
+recarga; si una carga falla, ese catálogo no se reintenta por
+`catalogos_reintento_s` (sin copia previa se responde 503 en ese lapso).
+"""
+import hashlib
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from fastapi import HTTPException
+
+from .bq import fqtn, run_query
+from .config import settings
+from . import sql_catalogos as C
+
+log = logging.getLogger(__name__)
+
+CATALOGOS = {
+    "estados": (C.CAT_ESTADOS, "cat_estado"),
+    "urgencias": (C.CAT_URGENCIAS, "cat_urgencia"),
+    "ministerios": (C.CAT_MINISTERIOS, "cat_ministerio_agencia"),
+    "categorias": (C.CAT_CATEGORIAS, "cat_categoria_general"),
+    "tipos-gestion": (C.CAT_TIPOS_GESTION, "cat_tipo_gestion"),
+    "canales-origen": (C.CAT_CANALES_ORIGEN, "cat_canal_origen"),
+    "geo": (C.GEO_LOCALIDADES, "geo_localidades"),
+}
+
+# columna id en gestiones -> (catálogo, columna de nombre que se agrega)
+ETIQUETAS = {
+    "ministerio_agencia_id": ("ministerios", "ministerio_nombre"),
+    "categoria_general_id": ("categorias", "categoria_nombre"),
+    "tipo_gestion": ("tipos-gestion", "tipo_gestion_nombre"),
+    "canal_origen": ("canales-origen", "canal_origen_nombre"),
+}
+
+
+def _norm(s: Optional[str]) -> str:
+    # mismo criterio que UPPER(TRIM(...)) en SQL
+    return (s or "").strip().upper()
+
+
+class CacheCatalogos:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._datos: Dict[str, List[Dict[str, Any]]] = {}
+        self._cargado: Dict[str, float] = {}
+        # id -> nombre por catálogo, y hash del contenido (cambia solo si cambian los datos)
+        self._nombres: Dict[str, Dict[str, str]] = {}
+        self._hashes: Dict[str, str] = {}
+        self._refrescando: Set[str] = set()
+        self._fallo: Dict[str, float] = {}  # monotonic de la última carga fallida
+
+    def _cargar(self, nombre: str) -> List[Dict[str, Any]]:
+        sql, tabla = CATALOGOS[nombre]
+        try:
+            rows = [dict(r) for r in run_query(sql.format(**{tabla: fqtn(tabla)}))]
+        except Exception:
+            with self._lock:
+                self._fallo[nombre] = time.monotonic()
+            raise
+        nombres = None
+        if nombre != "geo":
+            nombres = {str(r["id"]): r.get("nombre") for r in rows if r.get("id") is not None}
+            digest = hashlib.sha1(repr(sorted(nombres.items())).encode("utf-8")).hexdigest()[:8]
+        with self._lock:
+            self._datos[nombre] = rows
+            self._cargado[nombre] = time.monotonic()
+            self._fallo.pop(nombre, None)
+            if nombres is not None:
+                self._nombres[nombre] = nombres
+                self._hashes[nombre] = digest
+        return rows
+
+    def _refrescar(self, nombre: str) -> None:
+        try:
+            self._cargar(nombre)
+        except Exception as e:
+            log.warning("catalogos: recarga de %s falló: %s", nombre, e)
+        finally:
+            with self._lock:
+                self._refrescando.discard(nombre)
+
+    def get(self, nombre: str) -> List[Dict[str, Any]]:
+        ahora = time.monotonic()
+        with self._lock:
+            rows = self._datos.get(nombre)
+            vencido = ahora - self._cargado.get(nombre, 0.0) > settings.catalogos_ttl_s
+            fallo = self._fallo.get(nombre)
+            en_espera = fallo is not None and ahora - fallo < settings.catalogos_reintento_s
+            refrescar = rows is not None and vencido and not en_espera and nombre not in self._refrescando
+            if refrescar:
+                self._refrescando.add(nombre)
+        if rows is None:
+            if en_espera:
+                raise HTTPException(status_code=503, detail="Catálogo no disponible, reintentá en unos segundos.")
+            return self._cargar(nombre)
+        if refrescar:
+            threading.Thread(target=self._refrescar, args=(nombre,), name=f"catalogo-{nombre}", daemon=True).start()
+        return rows
+
+    def precargar(self, incluir_geo: bool = True) -> None:
+        for nombre in CATALOGOS:
+            if nombre != "geo" or incluir_geo:
+                self._cargar(nombre)
+
+    # -------------------------
+    # etiquetas (id -> nombre)
+    # -------------------------
+    def diccionarios(self) -> Tuple[str, Dict[str, Dict[str, str]]]:
+        """
+        (versión, {columna_id: {id: nombre}}) para las columnas de ETIQUETAS.
+        La versión es un hash del contenido: igual entre procesos y recargas
+        mientras los catálogos no cambien.
+        """
+        for catalogo, _ in ETIQUETAS.values():
+            try:
+                self.get(catalogo)  # carga si falta; vencido se recarga en background
+            except Exception:
+                # sin catálogo fresco se sigue con lo que haya: los ids siempre van
+                pass
+        with self._lock:
+            dicts = {col: self._nombres.get(cat, {}) for col, (cat, _) in ETIQUETAS.items()}
+            version = "-".join(self._hashes.get(cat, "0") for cat, _ in ETIQUETAS.values())
+        return version, dicts
+
+    def enriquecer(self, filas: Iterable[Dict[str, Any]]) -> str:
+        """
+        Agrega *_nombre a cada fila (in place) con una pasada sobre la página,
+        sin joins contra cat_*. Ids que no están en el catálogo (inactivos) -> None.
+        Devuelve la versión de los diccionarios usados.
+        """
+        version, dicts = self.diccionarios()
+        pares = [(col, ETIQUETAS[col][1], dicts[col]) for col in ETIQUETAS]
+        for f in filas:
+            for col, destino, d in pares:
+                v = f.get(col)
+                f[destino] = d.get(str(v)) if v is not None else None
+        return version
+
+    # -------------------------
+    # geo_localidades
+    # -------------------------
+    def departamentos(self) -> List[str]:
+        return sorted({
+            r["departamento"] for r in self.get("geo")
+            if r.get("departamento") and r["departamento"].strip()
+        })
+
+    def localidades(self, departamento: str) -> List[str]:
+        d = _norm(departamento)
+        return sorted(
+            r["localidad"] for r in self.get("geo")
+            if _norm(r.get("departamento")) == d and r.get("localidad") and r["localidad"].strip()
+        )
+
+    # búsqueda tolerante a acentos / tipeo: ver geo_matcher.py
+
+
+catalogos = CacheCatalogos()
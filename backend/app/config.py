@@ -1,3 +1,4 @@
+import json
 import os
 from pydantic import BaseModel
 
@@ -8,4 +9,125 @@ class Settings(BaseModel):
     google_client_id: str = "354063050046-fkp06ao8aauems1gcj4hlngljf56o3cj.apps.googleusercontent.com"
     allow_insecure_local: bool = os.getenv("ALLOW_INSECURE_LOCAL", "true").lower() == "true"
 
+    # Tokens de sesión (POST /auth/session). Compartir SESSION_SECRET entre workers.
+    session_secret: str = os.getenv("SESSION_SECRET", "")
+    session_ttl_s: int = int(os.getenv("SESSION_TTL_S", "900"))
+    session_max_s: int = int(os.getenv("SESSION_MAX_S", str(12 * 3600)))
+    # SQLite compartido por los workers para las revocaciones (cambio de rol, baja, logout).
+    # Vacío: cada proceso solo ve las suyas y en los demás el token vale hasta su exp.
+    session_revocaciones_path: str = os.getenv("SESSION_REVOCACIONES_PATH", "")
+
+    # SSE /gestiones/stream
+    sse_heartbeat_s: float = float(os.getenv("SSE_HEARTBEAT_S", "15"))
+
+    # GET /gestiones/changes: no se devuelven filas más nuevas que este margen
+    changes_margen_s: float = float(os.getenv("CHANGES_MARGEN_S", "10"))
+
+    # Guard de costo (bytes). 0 = sin límite.
+    bq_max_bytes_query: int = int(os.getenv("BQ_MAX_BYTES_QUERY", str(2 * 1024 ** 3)))
+    # lecturas internas (user=None: réplica, similares, sugerencias, auditor): leen tablas
+    # completas a propósito, el tope por query de usuario no aplica. 0 = sin límite.
+    bq_max_bytes_sistema: int = int(os.getenv("BQ_MAX_BYTES_SISTEMA", "0"))
+    bq_budget_usuario_bytes: int = int(os.getenv("BQ_BUDGET_USUARIO_BYTES", str(50 * 1024 ** 3)))
+    # JSON por rol, ej: {"Consulta": 107374182400}
+    bq_budget_rol_bytes: dict = json.loads(os.getenv("BQ_BUDGET_ROL_BYTES", "{}"))
+    bq_estimacion_ttl_s: float = float(os.getenv("BQ_ESTIMACION_TTL_S", "3600"))
+
+    # Scheduler de jobs BigQuery
+    bq_max_concurrentes: int = int(os.getenv("BQ_MAX_CONCURRENTES", "8"))
+    bq_max_por_usuario: int = int(os.getenv("BQ_MAX_POR_USUARIO", "2"))  # corriendo; el resto espera en cola
+    bq_espera_max_s: float = float(os.getenv("BQ_ESPERA_MAX_S", "20"))
+
+    # Pool HTTP del cliente BigQuery (>= threads que pueden usarlo a la vez)
+    bq_http_pool_size: int = int(os.getenv("BQ_HTTP_POOL_SIZE", "40"))
+    bq_http_pool_hosts: int = int(os.getenv("BQ_HTTP_POOL_HOSTS", "4"))
+    bq_http_keepalive_s: float = float(os.getenv("BQ_HTTP_KEEPALIVE_S", "60"))
+
+    # Catálogos / geo en memoria + warm-up al arrancar
+    catalogos_ttl_s: float = float(os.getenv("CATALOGOS_TTL_S", "600"))
+    # tras una carga fallida no se reintenta ese catálogo antes de esto
+    catalogos_reintento_s: float = float(os.getenv("CATALOGOS_REINTENTO_S", "30"))
+    warmup_enabled: bool = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+
+    # GET /auditoria: ventana máxima de búsqueda
+    auditoria_max_dias: int = int(os.getenv("AUDITORIA_MAX_DIAS", "92"))
+
+    # GET /reportes/tiempos-estado
+    reportes_max_dias: int = int(os.getenv("REPORTES_MAX_DIAS", "366"))
+
+    # Jobs en background (/jobs)
+    jobs_dir: str = os.getenv("JOBS_DIR", "/tmp/infra_gestion_jobs")
+    jobs_max_workers: int = int(os.getenv("JOBS_MAX_WORKERS", "2"))
+    jobs_max_por_usuario: int = int(os.getenv("JOBS_MAX_POR_USUARIO", "2"))
+    jobs_retencion_h: float = float(os.getenv("JOBS_RETENCION_H", "48"))
+    # cada cuánto se purgan los vencidos y se refrescan/latean los jobs en disco
+    jobs_mantenimiento_s: float = float(os.getenv("JOBS_MANTENIMIENTO_S", "60"))
+
+    # Réplica local de gestiones (SQLite) para list/get/búsqueda
+    replica_enabled: bool = os.getenv("REPLICA_ENABLED", "false").lower() == "true"
+    replica_dir: str = os.getenv("REPLICA_DIR", "/tmp")
+    replica_sync_s: float = float(os.getenv("REPLICA_SYNC_S", "5"))
+    # más atrasada que esto -> se lee de BigQuery
+    replica_max_lag_s: float = float(os.getenv("REPLICA_MAX_LAG_S", "60"))
+    # cada cuánto se sacan de la réplica las gestiones que pasaron al archivo
+    replica_archivo_s: float = float(os.getenv("REPLICA_ARCHIVO_S", "300"))
+
+    # Tracing: header Server-Timing por request; spans OpenTelemetry opcionales
+    tracing_enabled: bool = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+    otel_enabled: bool = os.getenv("OTEL_ENABLED", "false").lower() == "true"
+    otel_exporter: str = os.getenv("OTEL_EXPORTER", "archivo")  # otlp | archivo
+    otel_archivo: str = os.getenv("OTEL_ARCHIVO", "/tmp/infra_gestion_spans.jsonl")
+
+    # GET /gestiones/mapa
+    mapa_celdas_por_tile: int = int(os.getenv("MAPA_CELDAS_POR_TILE", "4"))
+    mapa_zoom_puntos: int = int(os.getenv("MAPA_ZOOM_PUNTOS", "14"))
+    mapa_max_puntos: int = int(os.getenv("MAPA_MAX_PUNTOS", "2000"))
+    # tope de celdas del bbox en modo clusters: se agranda la celda hasta entrar
+    mapa_max_celdas: int = int(os.getenv("MAPA_MAX_CELDAS", "1024"))
+
+    # Posibles duplicados: índice de trigramas del detalle, por localidad
+    similares_enabled: bool = os.getenv("SIMILARES_ENABLED", "true").lower() == "true"
+    similares_dias: int = int(os.getenv("SIMILARES_DIAS", "365"))
+    similares_umbral: float = float(os.getenv("SIMILARES_UMBRAL", "0.45"))  # Jaccard mínimo
+    similares_max: int = int(os.getenv("SIMILARES_MAX", "5"))
+    # re-carga completa (trae las altas de otros workers)
+    similares_ttl_s: float = float(os.getenv("SIMILARES_TTL_S", "900"))
+    # tras una carga fallida no se reintenta antes de esto (ni en línea: va en background)
+    similares_reintento_s: float = float(os.getenv("SIMILARES_REINTENTO_S", "60"))
+
+    # Geo: tolerancia a errores de tipeo en departamento/localidad
+    geo_max_distancia: int = int(os.getenv("GEO_MAX_DISTANCIA", "2"))
+    # se corrige sola solo si hay un único candidato a esta distancia o menos
+    geo_autocorregir_distancia: int = int(os.getenv("GEO_AUTOCORREGIR_DISTANCIA", "1"))
+    geo_max_sugerencias: int = int(os.getenv("GEO_MAX_SUGERENCIAS", "5"))
+
+    # Archivo: gestiones terminadas/borradas sin cambios hace más de N días
+    archivo_estados: list = [e.strip() for e in os.getenv("ARCHIVO_ESTADOS", "FINALIZADA,ARCHIVADO").split(",") if e.strip()]
+    archivo_dias: int = int(os.getenv("ARCHIVO_DIAS", "180"))
+    archivo_lote: int = int(os.getenv("ARCHIVO_LOTE", "5000"))
+    archivo_max_lotes: int = int(os.getenv("ARCHIVO_MAX_LOTES", "20"))
+
+    # Auditor de consistencia gestiones vs eventos
+    consistencia_rangos: int = int(os.getenv("CONSISTENCIA_RANGOS", "32"))
+    consistencia_hilos: int = int(os.getenv("CONSISTENCIA_HILOS", "4"))  # lecturas BigQuery en paralelo
+    consistencia_procesos: int = int(os.getenv("CONSISTENCIA_PROCESOS", str(os.cpu_count() or 2)))
+
+    # GET /gestiones/sugerencias (type-ahead del buscador)
+    sugerencias_min_chars: int = int(os.getenv("SUGERENCIAS_MIN_CHARS", "2"))
+    sugerencias_max_escaneo: int = int(os.getenv("SUGERENCIAS_MAX_ESCANEO", "5000"))
+    sugerencias_ttl_s: float = float(os.getenv("SUGERENCIAS_TTL_S", "900"))
+
+    # Journal local de escrituras: altas y cambios de estado responden 202 y un
+    # committer en background los aplica a BigQuery (un archivo compartido por workers)
+    journal_enabled: bool = os.getenv("JOURNAL_ENABLED", "false").lower() == "true"
+    # obligatorio con JOURNAL_ENABLED: lo aceptado con 202 vive acá hasta llegar a
+    # BigQuery, tiene que ser un volumen persistente (no /tmp del contenedor)
+    journal_path: str = os.getenv("JOURNAL_PATH", "")
+    journal_lote: int = int(os.getenv("JOURNAL_LOTE", "200"))
+    journal_espera_lote_s: float = float(os.getenv("JOURNAL_ESPERA_LOTE_S", "0.5"))  # junta escrituras antes de aplicar
+    journal_intervalo_s: float = float(os.getenv("JOURNAL_INTERVALO_S", "5"))
+    journal_max_intentos: int = int(os.getenv("JOURNAL_MAX_INTENTOS", "5"))  # solo errores permanentes (400)
+    journal_lease_s: float = float(os.getenv("JOURNAL_LEASE_S", "120"))
+    journal_retencion_h: float = float(os.getenv("JOURNAL_RETENCION_H", "48"))
+
 settings = Settings()
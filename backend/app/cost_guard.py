@@ -0,0 +1,162 @@
+# app/cost_guard.py
+"""
+Admisión de queries por costo.
+
+- Antes de ejecutar una lectura se estima con dry-run (gratis) y la estimación
+  se cachea por "forma" de query: SQL + qué parámetros vienen con valor.
+- Lecturas que superan `bq_max_bytes_query` se rechazan (400); las admitidas
+  corren con `maximum_bytes_billed` para que BigQuery corte si la estimación
+  cacheada quedó corta. Las internas (sin usuario: seeds de réplica,
+  similares, sugerencias, shards del auditor) usan `bq_max_bytes_sistema`,
+  por default sin tope: son full scans a propósito y un 400 en un thread de
+  fondo las apagaría sin que nadie lo vea.
+- Se acumulan bytes facturados por usuario y por rol (día UTC) contra los
+  budgets diarios; al agotarse se responde 429.
+
+Contadores en memoria, por proceso.
+"""
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from google.cloud import bigquery
+
+from .config import settings
+
+
+def _fmt_bytes(n: int) -> str:
+    for unidad in ("B", "KB", "MB", "GB"):
+        if n < 1024:
+            return f"{n:.0f} {unidad}"
+        n /= 1024
+    return f"{n:.1f} TB"
+
+
+def _forma(query: str, cfg: bigquery.QueryJobConfig) -> Tuple[str, Tuple[str, ...]]:
+    """Clave de cache: el texto SQL + los nombres de parámetros con valor."""
+    con_valor = tuple(sorted(
+        p.name for p in (cfg.query_parameters or [])
+        if getattr(p, "value", None) not in (None, "")
+    ))
+    return query, con_valor
+
+
+def _segundos_hasta_manana() -> int:
+    ahora = datetime.now(timezone.utc)
+    manana = (ahora + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return int((manana - ahora).total_seconds()) + 1
+
+
+class CostGuard:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._estimaciones: Dict[Tuple, Tuple[int, float]] = {}
+        self._dia = None
+        self._por_usuario: Dict[str, int] = {}
+        self._por_rol: Dict[str, int] = {}
+        self.dry_runs = 0
+        self.rechazadas = 0
+
+    def _rotar_dia(self) -> None:
+        hoy = datetime.now(timezone.utc).date()
+        if self._dia != hoy:
+            self._dia = hoy
+            self._por_usuario = {}
+            self._por_rol = {}
+
+    def estimar(self, client: bigquery.Client, query: str, cfg: bigquery.QueryJobConfig) -> int:
+        key = _forma(query, cfg)
+        with self._lock:
+            hit = self._estimaciones.get(key)
+        if hit and time.monotonic() - hit[1] < settings.bq_estimacion_ttl_s:
+            return hit[0]
+
+        dry = bigquery.QueryJobConfig(
+            dry_run=True,
+            use_query_cache=False,
+            query_parameters=cfg.query_parameters,
+        )
+        est = int(client.query(query, job_config=dry).total_bytes_processed or 0)
+        with self._lock:
+            self.dry_runs += 1
+            self._estimaciones[key] = (est, time.monotonic())
+        return est
+
+    def admitir(
+        self,
+        client: bigquery.Client,
+        query: str,
+        cfg: bigquery.QueryJobConfig,
+        user: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        limite = settings.bq_max_bytes_query if user else settings.bq_max_bytes_sistema
+        budget_usuario = settings.bq_budget_usuario_bytes
+        budget_rol = settings.bq_budget_rol_bytes.get((user or {}).get("rol") or "", 0)
+        if not (limite or (user and (budget_usuario or budget_rol))):
+            return
+
+        est = self.estimar(client, query, cfg)
+
+        if limite and est > limite:
+            with self._lock:
+                self.rechazadas += 1
+            raise HTTPException(
+                status_code=400,
+                detail=f"Consulta demasiado costosa (~{_fmt_bytes(est)}). Agregá filtros para acotarla.",
+            )
+
+        if user:
+            email = (user.get("email") or "").lower()
+            with self._lock:
+                self._rotar_dia()
+                gastado_u = self._por_usuario.get(email, 0)
+                gastado_r = self._por_rol.get(user.get("rol") or "", 0)
+            excedido = (
+                (budget_usuario and gastado_u + est > budget_usuario)
+                or (budget_rol and gastado_r + est > budget_rol)
+            )
+            if excedido:
+                with self._lock:
+                    self.rechazadas += 1
+                raise HTTPException(
+                    status_code=429,
+                    detail="Budget diario de consultas agotado",
+                    headers={"Retry-After": str(_segundos_hasta_manana())},
+                )
+
+        if limite and not cfg.maximum_bytes_billed:
+            cfg.maximum_bytes_billed = limite
+
+    def registrar(self, job: bigquery.QueryJob, user: Optional[Dict[str, Any]] = None) -> None:
+        facturado = int(job.total_bytes_billed or 0)
+        if not user or not facturado:
+            return
+        email = (user.get("email") or "").lower()
+        rol = user.get("rol") or ""
+        with self._lock:
+            self._rotar_dia()
+            self._por_usuario[email] = self._por_usuario.get(email, 0) + facturado
+            self._por_rol[rol] = self._por_rol.get(rol, 0) + facturado
+
+    def reporte(self) -> Dict[str, Any]:
+        with self._lock:
+            self._rotar_dia()
+            usuarios = sorted(self._por_usuario.items(), key=lambda kv: -kv[1])
+            roles = sorted(self._por_rol.items(), key=lambda kv: -kv[1])
+            return {
+                "dia": self._dia.isoformat(),
+                "limite_query_bytes": settings.bq_max_bytes_query,
+                "limite_sistema_bytes": settings.bq_max_bytes_sistema,
+                "budget_usuario_bytes": settings.bq_budget_usuario_bytes,
+                "budget_rol_bytes": settings.bq_budget_rol_bytes,
+                "usuarios": [{"email": e, "bytes_facturados": b} for e, b in usuarios],
+                "roles": [{"rol": r, "bytes_facturados": b} for r, b in roles],
+                "estimaciones_cacheadas": len(self._estimaciones),
+                "dry_runs": self.dry_runs,
+                "rechazadas": self.rechazadas,
+            }
+
+
+guard = CostGuard()
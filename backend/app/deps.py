@@ -1,19 +1,62 @@
 # app/deps.py
 from fastapi import Depends, Header, HTTPException
-from google.cloud.bigquery import QueryJobConfig, ScalarQueryParameter
-from typing import Iterable, Tuple, Any, Dict, Callable
+import base64
+import json
+from datetime import datetime
+from google.cloud.bigquery import (
+    ArrayQueryParameter,
+    QueryJobConfig,
+    ScalarQueryParameter,
+    StructQueryParameter,
+)
+from typing import Iterable, Tuple, Any, Dict, Callable, Mapping, Sequence
 
 
-def qparams(params: Iterable[Tuple[str, str, Any]]) -> QueryJobConfig:
+def qparams(params: Iterable[Tuple[str, str, Any]], arrays: Iterable[ArrayQueryParameter] = ()) -> QueryJobConfig:
     """
     Único helper: arma QueryJobConfig con parámetros tipados.
     params: iterable de (name, bq_type, value)
+    arrays: parámetros ARRAY ya armados (ver qstructs)
     """
     return QueryJobConfig(
-        query_parameters=[ScalarQueryParameter(n, t, v) for n, t, v in params]
+        query_parameters=[ScalarQueryParameter(n, t, v) for n, t, v in params] + list(arrays)
     )
 
 
+def qstructs(
+    name: str,
+    campos: Sequence[Tuple[str, str]],
+    filas: Iterable[Mapping[str, Any]],
+) -> ArrayQueryParameter:
+    """
+    ARRAY<STRUCT<...>> para usar con UNNEST(@name).
+    campos: [(nombre, bq_type)]; filas: dicts con esas claves. No admite array vacío
+    (BigQuery no puede inferir el tipo del STRUCT).
+    """
+    return ArrayQueryParameter(name, "STRUCT", [
+        StructQueryParameter(None, *[ScalarQueryParameter(c, t, f.get(c)) for c, t in campos])
+        for f in filas
+    ])
+
+
+def encode_cursor(*valores: Any) -> str:
+    """Cursor opaco para keyset pagination (ej. (ts, id))."""
+    raw = json.dumps(valores, default=lambda o: o.isoformat(), ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Inversa de encode_cursor(ts, id). Cualquier cursor que no sea eso -> 400."""
+    try:
+        pad = "=" * (-len(cursor) % 4)
+        ts, id_ = json.loads(base64.urlsafe_b64decode(cursor + pad).decode("utf-8"))
+        if not isinstance(ts, str) or not isinstance(id_, str):
+            raise ValueError("cursor con tipos inválidos")
+        return datetime.fromisoformat(ts), id_
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
 def _require_user(authorization: str = Header(default="")) -> Dict[str, Any]:
     """
     Wrapper para evitar import circular.
@@ -0,0 +1,127 @@
+# app/geo_matcher.py
+"""
+Resolución tolerante de departamento/localidad contra geo_localidades (en
+memoria, desde catalogos_cache).
+
+- Claves normalizadas con texto.normalizar: "Cordoba", "CÓRDOBA" y " córdoba "
+  son la misma localidad, sin ir a BigQuery.
+- Errores de tipeo: índice SymSpell (cada nombre indexado por sus variantes con
+  hasta `geo_max_distancia` letras borradas). Una consulta genera sus propias
+  variantes, junta los nombres que comparten alguna y confirma con distancia de
+  edición: candidatos en microsegundos, sin recorrer todo el catálogo.
+- `resolver` devuelve la fila si el match es exacto (normalizado) o si hay un
+  único candidato a `geo_autocorregir_distancia` o menos; si no, sugerencias
+  ordenadas para que el usuario elija.
+
+El índice se rearma solo cuando catalogos_cache recarga geo (TTL).
+"""
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .catalogos_cache import catalogos
+from .config import settings
+from .texto import borrados, distancia, normalizar
+
+Fila = Dict[str, Any]
+
+
+def _max_para(q: str) -> int:
+    # nombres cortos: con 2 errores cualquier cosa se parece a cualquier cosa
+    return min(settings.geo_max_distancia, max(1, len(q) // 4))
+
+
+class _Indice:
+    def __init__(self, filas: List[Fila]):
+        self.fuente = filas
+        self.exactos: Dict[Tuple[str, str], Fila] = {}
+        self.por_localidad: Dict[str, List[Fila]] = {}
+        for r in filas:
+            if not r.get("activo"):
+                continue
+            d, l = normalizar(r.get("departamento")), normalizar(r.get("localidad"))
+            if not d or not l:
+                continue
+            self.exactos.setdefault((d, l), r)
+            self.por_localidad.setdefault(l, []).append(r)
+
+        self.deptos = {d for d, _ in self.exactos}
+        self.borrados_loc: Dict[str, Set[str]] = {}
+        for l in self.por_localidad:
+            for v in borrados(l, settings.geo_max_distancia):
+                self.borrados_loc.setdefault(v, set()).add(l)
+        self.borrados_depto: Dict[str, Set[str]] = {}
+        for d in self.deptos:
+            for v in borrados(d, settings.geo_max_distancia):
+                self.borrados_depto.setdefault(v, set()).add(d)
+
+
+class GeoMatcher:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._idx: Optional[_Indice] = None
+
+    def _indice(self) -> _Indice:
+        filas = catalogos.get("geo")
+        idx = self._idx
+        if idx is None or idx.fuente is not filas:
+            with self._lock:
+                idx = self._idx
+                if idx is None or idx.fuente is not filas:
+                    idx = self._idx = _Indice(filas)
+        return idx
+
+    def precargar(self) -> None:
+        self._indice()
+
+    @staticmethod
+    def _candidatos(q: str, indice: Dict[str, Set[str]]) -> Dict[str, int]:
+        """nombre normalizado -> distancia, para los que quedan dentro del máximo."""
+        maximo = _max_para(q)
+        out: Dict[str, int] = {}
+        for v in borrados(q, maximo):
+            for nombre in indice.get(v, ()):
+                if nombre not in out:
+                    out[nombre] = distancia(q, nombre, maximo)
+        return {n: d for n, d in out.items() if d <= maximo}
+
+    def resolver(self, departamento: Optional[str], localidad: Optional[str]) -> Dict[str, Any]:
+        """
+        {"geo": fila | None, "corregido": bool, "sugerencias": [...]}.
+        `corregido` indica que la fila no coincide exacto con lo escrito (acentos
+        aparte): el alta guarda los nombres oficiales de la fila.
+        """
+        idx = self._indice()
+        dn, ln = normalizar(departamento), normalizar(localidad)
+        geo = idx.exactos.get((dn, ln))
+        if geo is not None:
+            return {"geo": geo, "corregido": False, "sugerencias": []}
+
+        deptos = {dn: 0} if dn in idx.deptos else self._candidatos(dn, idx.borrados_depto)
+        locs = {ln: 0} if ln in idx.por_localidad else self._candidatos(ln, idx.borrados_loc)
+        # localidad bien escrita en otro departamento: se sugiere, con penalidad
+        fuera = settings.geo_max_distancia + 1
+
+        candidatos = []
+        for l, dl in locs.items():
+            for r in idx.por_localidad[l]:
+                dd = deptos.get(normalizar(r.get("departamento")), fuera)
+                candidatos.append((dd + dl, dd, dl, r))
+        candidatos.sort(key=lambda c: (c[0], c[2], c[3].get("departamento") or "", c[3].get("localidad") or ""))
+
+        geo = None
+        if candidatos:
+            total, dd, _, mejor = candidatos[0]
+            unico = len(candidatos) == 1 or candidatos[1][0] > total
+            if dd != fuera and total <= settings.geo_autocorregir_distancia and unico:
+                geo = mejor
+
+        sugerencias = [{
+            "id_geo": r.get("id_geo"),
+            "departamento": r.get("departamento"),
+            "localidad": r.get("localidad"),
+            "distancia": total,
+        } for total, _, _, r in candidatos[:settings.geo_max_sugerencias]]
+        return {"geo": geo, "corregido": geo is not None, "sugerencias": [] if geo else sugerencias}
+
+
+geo_matcher = GeoMatcher()
@@ -0,0 +1,370 @@
+# app/jobs.py
+"""
+Jobs en background para operaciones largas (exports, cargas masivas, refresh
+de reportes): el request encola y responde enseguida; el cliente consulta el
+estado y descarga el resultado cuando termina.
+
+- Pool de threads acotado (`jobs_max_workers`): el trabajo es I/O contra
+  BigQuery, y el cliente / scheduler / guard de costo son por proceso.
+- Cupo de jobs activos (en cola + corriendo) por usuario (`jobs_max_por_usuario`);
+  al excederlo, 429.
+- Estado y resultado en disco (`jobs_dir/<id>/`), así sobreviven un reinicio
+  del worker. Cada job lleva su dueño (host:pid:token); el dueño "late"
+  tocando el estado.json de sus jobs activos en cada mantenimiento. Un job
+  activo de otro proceso se da por interrumpido solo si su pid ya no existe
+  (mismo host) o dejó de latir: con JOBS_DIR compartido, un worker que arranca
+  no pisa los jobs de los demás.
+- Mantenimiento periódico (`jobs_mantenimiento_s`): purga los terminados más
+  viejos que `jobs_retencion_h` y refresca los de otros workers.
+- Cancelación cooperativa: en cola se descarta; corriendo, el handler corta en
+  el próximo `ctx.verificar()`. Si el job es de otro worker se deja la marca
+  `cancelar` en su directorio y la aplica su dueño en el próximo mantenimiento.
+
+Los tipos de job se registran con `runner.registrar(tipo, fn)`; fn recibe
+(ctx, params) y devuelve un dict (resumen) que queda en el estado.
+"""
+import json
+import logging
+import os
+import shutil
+import socket
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+from uuid import UUID, uuid4
+
+from fastapi import HTTPException
+
+from .config import settings
+
+log = logging.getLogger(__name__)
+
+ACTIVOS = ("en_cola", "corriendo")
+
+_HOST = socket.gethostname()
+# el token distingue encarnaciones con el mismo pid (ej. pid 1 en un contenedor que reinicia)
+_DUENO = f"{_HOST}:{os.getpid()}:{uuid4().hex[:8]}"
+
+
+class JobCancelado(Exception):
+    pass
+
+
+def _ahora() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class Contexto:
+    """Lo que ve un handler: usuario, progreso, cancelación y archivo de resultado."""
+
+    def __init__(self, runner: "JobRunner", id_job: str, user: Dict[str, Any]):
+        self._runner = runner
+        self.id_job = id_job
+        self.user = user
+        self._cancelar = threading.Event()
+        self._ultimo_guardado = 0.0
+
+    @property
+    def cancelado(self) -> bool:
+        return self._cancelar.is_set()
+
+    def verificar(self) -> None:
+        if self._cancelar.is_set():
+            raise JobCancelado()
+
+    def progreso(self, hechos: int, total: Optional[int] = None, mensaje: Optional[str] = None) -> None:
+        # en memoria siempre; a disco como mucho una vez por segundo
+        ahora = time.monotonic()
+        persistir = ahora - self._ultimo_guardado >= 1.0
+        if persistir:
+            self._ultimo_guardado = ahora
+        self._runner._actualizar(self.id_job, persistir, progreso={
+            "hechos": hechos, "total": total, "mensaje": mensaje,
+        })
+
+    def archivo(self, nombre: str, media_type: str) -> Path:
+        """Ruta donde el handler escribe el resultado descargable."""
+        self._runner._actualizar(self.id_job, True, resultado={"archivo": nombre, "media_type": media_type})
+        return self._runner._dir(self.id_job) / nombre
+
+
+Handler = Callable[[Contexto, Dict[str, Any]], Optional[Dict[str, Any]]]
+
+
+class JobRunner:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._ctx: Dict[str, Contexto] = {}
+        self._futures: Dict[str, Future] = {}
+        self._tipos: Dict[str, Handler] = {}
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._cargado = False
+        self._thread: Optional[threading.Thread] = None
+
+    # -------------------------
+    # registro / disco
+    # -------------------------
+    def registrar(self, tipo: str, fn: Handler) -> None:
+        self._tipos[tipo] = fn
+
+    def tipos(self) -> List[str]:
+        return sorted(self._tipos)
+
+    def _dir(self, id_job: str) -> Path:
+        return Path(settings.jobs_dir) / id_job
+
+    def _guardar(self, job: Dict[str, Any]) -> None:
+        d = self._dir(job["id_job"])
+        d.mkdir(parents=True, exist_ok=True)
+        tmp = d / "estado.json.tmp"
+        tmp.write_text(json.dumps(job, ensure_ascii=False, default=str), encoding="utf-8")
+        tmp.replace(d / "estado.json")
+
+    def _leer(self, id_job: str) -> Optional[Dict[str, Any]]:
+        try:
+            UUID(id_job)
+            return json.loads((self._dir(id_job) / "estado.json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _dueno_vivo(dueno: Optional[str], mtime: float, vencido: float) -> bool:
+        """¿Sigue vivo el proceso dueño de un job activo que no corre acá?"""
+        if dueno == _DUENO:
+            # nuestro pero sin contexto: no puede seguir corriendo
+            return False
+        host, _, resto = (dueno or "").partition(":")
+        pid = resto.partition(":")[0]
+        if host == _HOST and pid.isdigit():
+            if int(pid) == os.getpid():
+                return False
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                return False
+            except PermissionError:
+                pass
+        return mtime >= vencido
+
+    def _mantener(self) -> List[str]:
+        """
+        Recorre el disco (con el lock tomado): latido de los jobs propios,
+        refresco de los ajenos, interrupción de los huérfanos y purga de los
+        vencidos. Devuelve los jobs propios con cancelación pedida desde otro worker.
+        """
+        base = Path(settings.jobs_dir)
+        base.mkdir(parents=True, exist_ok=True)
+        ahora = time.time()
+        limite = ahora - settings.jobs_retencion_h * 3600
+        vencido = ahora - 3 * settings.jobs_mantenimiento_s
+        vistos, cancelar = set(), []
+        for f in base.glob("*/estado.json"):
+            id_job = f.parent.name
+            vistos.add(id_job)
+            if id_job in self._ctx:
+                try:
+                    os.utime(f)
+                except OSError:
+                    pass
+                if (f.parent / "cancelar").exists():
+                    cancelar.append(id_job)
+                continue
+            try:
+                job = json.loads(f.read_text(encoding="utf-8"))
+                mtime = f.stat().st_mtime
+            except (OSError, ValueError):
+                continue
+            if job.get("estado") in ACTIVOS:
+                if not self._dueno_vivo(job.get("dueno"), mtime, vencido):
+                    job.update(estado="error", error="Interrumpido: el worker que lo corría terminó", fin=_ahora())
+                    self._guardar(job)
+            elif mtime < limite:
+                shutil.rmtree(f.parent, ignore_errors=True)
+                self._jobs.pop(id_job, None)
+                continue
+            self._jobs[id_job] = job
+        for id_job in [i for i in self._jobs if i not in vistos and i not in self._ctx]:
+            del self._jobs[id_job]
+        return cancelar
+
+    def _cargar(self) -> None:
+        """Primera lectura del disco; después lo mantiene `_loop`."""
+        if self._cargado:
+            return
+        self._mantener()
+        self._cargado = True
+
+    def iniciar(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            self._cargar()
+        self._thread = threading.Thread(target=self._loop, name="jobs", daemon=True)
+        self._thread.start()
+
+    def _loop(self) -> None:
+        while True:
+            time.sleep(settings.jobs_mantenimiento_s)
+            try:
+                with self._lock:
+                    cancelar = self._mantener()
+                for id_job in cancelar:
+                    self._cancelar_local(id_job)
+            except Exception as e:
+                log.warning("jobs: mantenimiento falló: %s", e)
+
+    def _actualizar(self, id_job: str, persistir: bool, **campos: Any) -> Dict[str, Any]:
+        with self._lock:
+            job = self._jobs[id_job]
+            job.update(campos)
+            copia = dict(job)
+        if persistir:
+            self._guardar(copia)
+        return copia
+
+    # -------------------------
+    # API
+    # -------------------------
+    def enviar(self, tipo: str, params: Dict[str, Any], user: Dict[str, Any]) -> Dict[str, Any]:
+        if tipo not in self._tipos:
+            raise HTTPException(status_code=404, detail=f"Tipo de job desconocido: {tipo}")
+        email = (user.get("email") or "").lower()
+
+        with self._lock:
+            self._cargar()
+            activos = sum(
+                1 for j in self._jobs.values()
+                if j["usuario"] == email and j["estado"] in ACTIVOS
+            )
+            if activos >= settings.jobs_max_por_usuario:
+                raise HTTPException(
+                    status_code=429,
+                    detail=f"Máximo {settings.jobs_max_por_usuario} jobs activos por usuario",
+                    headers={"Retry-After": "30"},
+                )
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=settings.jobs_max_workers, thread_name_prefix="job")
+
+            id_job = str(uuid4())
+            job = {
+                "id_job": id_job,
+                "tipo": tipo,
+                "usuario": email,
+                "dueno": _DUENO,
+                "estado": "en_cola",
+                "creado": _ahora(),
+                "inicio": None,
+                "fin": None,
+                "progreso": {"hechos": 0, "total": None, "mensaje": None},
+                "resumen": None,
+                "resultado": None,
+                "error": None,
+            }
+            self._jobs[id_job] = job
+            ctx = self._ctx[id_job] = Contexto(self, id_job, user)
+
+        # params no se persisten (pueden ser grandes, ej. una carga masiva)
+        self._guardar(dict(job))
+        fut = self._pool.submit(self._correr, ctx, self._tipos[tipo], params)
+        with self._lock:
+            if self._jobs[id_job]["estado"] in ACTIVOS:
+                self._futures[id_job] = fut
+        return dict(job)
+
+    def _correr(self, ctx: Contexto, fn: Handler, params: Dict[str, Any]) -> None:
+        id_job = ctx.id_job
+        try:
+            ctx.verificar()
+            self._actualizar(id_job, True, estado="corriendo", inicio=_ahora())
+            resumen = fn(ctx, params)
+            self._actualizar(id_job, True, estado="ok", resumen=resumen, fin=_ahora())
+        except JobCancelado:
+            self._actualizar(id_job, True, estado="cancelado", fin=_ahora())
+        except HTTPException as e:
+            self._actualizar(id_job, True, estado="error", error=e.detail, fin=_ahora())
+        except Exception as e:
+            log.exception("job %s (%s) falló", id_job, self._jobs[id_job]["tipo"])
+            self._actualizar(id_job, True, estado="error", error=str(e), fin=_ahora())
+        finally:
+            with self._lock:
+                self._ctx.pop(id_job, None)
+                self._futures.pop(id_job, None)
+
+    def obtener(self, id_job: str, user: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            self._cargar()
+            job = self._jobs.get(id_job)
+            job = dict(job) if job else None
+            propio = id_job in self._ctx
+        if not propio:
+            # puede correrlo otro worker (JOBS_DIR compartido): manda el disco
+            job = self._leer(id_job)
+        if not job:
+            raise HTTPException(status_code=404, detail="Job no encontrado")
+        if job["usuario"] != (user.get("email") or "").lower() and user.get("rol") != "Admin":
+            raise HTTPException(status_code=404, detail="Job no encontrado")
+        return job
+
+    def listar(self, user: Dict[str, Any], todos: bool = False) -> List[Dict[str, Any]]:
+        email = (user.get("email") or "").lower()
+        with self._lock:
+            self._cargar()
+            jobs = [
+                dict(j) for j in self._jobs.values()
+                if (todos and user.get("rol") == "Admin") or j["usuario"] == email
+            ]
+        return sorted(jobs, key=lambda j: j["creado"], reverse=True)
+
+    def archivo_resultado(self, id_job: str, user: Dict[str, Any]):
+        job = self.obtener(id_job, user)
+        if job["estado"] != "ok" or not job.get("resultado"):
+            raise HTTPException(status_code=409, detail=f"El job no tiene resultado (estado: {job['estado']})")
+        ruta = self._dir(id_job) / job["resultado"]["archivo"]
+        if not ruta.exists():
+            raise HTTPException(status_code=410, detail="El resultado ya no está disponible")
+        return ruta, job["resultado"]["media_type"]
+
+    def cancelar(self, id_job: str, user: Dict[str, Any]) -> Dict[str, Any]:
+        job = self.obtener(id_job, user)
+        if job["estado"] not in ACTIVOS:
+            return job
+        with self._lock:
+            propio = id_job in self._ctx
+        if not propio:
+            # lo corre otro worker: la marca la aplica su dueño en el próximo mantenimiento
+            (self._dir(id_job) / "cancelar").touch()
+            return {**job, "cancelacion_pedida": True}
+        return self._cancelar_local(id_job)
+
+    def _cancelar_local(self, id_job: str) -> Dict[str, Any]:
+        with self._lock:
+            ctx = self._ctx.get(id_job)
+            fut = self._futures.get(id_job)
+        if ctx:
+            ctx._cancelar.set()
+        if fut and fut.cancel():
+            # nunca arrancó: _correr no va a limpiar
+            with self._lock:
+                self._ctx.pop(id_job, None)
+                self._futures.pop(id_job, None)
+            return self._actualizar(id_job, True, estado="cancelado", fin=_ahora())
+        return self._actualizar(id_job, False, cancelacion_pedida=True)
+
+    def estado(self) -> Dict[str, Any]:
+        with self._lock:
+            por_estado: Dict[str, int] = {}
+            for j in self._jobs.values():
+                por_estado[j["estado"]] = por_estado.get(j["estado"], 0) + 1
+        return {
+            "max_workers": settings.jobs_max_workers,
+            "max_por_usuario": settings.jobs_max_por_usuario,
+            "tipos": self.tipos(),
+            "por_estado": por_estado,
+        }
+
+
+runner = JobRunner()
@@ -0,0 +1,429 @@
+# app/journal.py
+"""
+Journal local de escrituras (JOURNAL_ENABLED). Con BigQuery lento o caído el
+alta y el cambio de estado no esperan al job: se validan, se les asigna id, se
+guardan en un journal SQLite durable (WAL + synchronous=FULL) y responden 202.
+
+- Cada entrada guarda los parámetros ya armados por el router (gestión o cambio
+  de estado + su evento) como [nombre, tipo, valor]: aplicarla es la misma
+  escritura que haría el request, pero en diferido.
+- Un committer en background las aplica en orden (seq), en lotes de hasta
+  `journal_lote` en un único script con transacción (JOURNAL_LOTE). Las
+  sentencias son idempotentes (NOT EXISTS por id_gestion / id_evento):
+  reintentar un lote que llegó a aplicarse no duplica nada.
+- Errores transitorios (5xx, timeouts, cupo del scheduler): se reintenta con
+  backoff sin límite, nada se pierde. Un lote que falla se reintenta de a una
+  entrada para aislar la que rompe; si esa falla con error permanente (400)
+  `journal_max_intentos` veces queda `fallida` (junto con lo pendiente de la
+  misma gestión) y la cola sigue.
+- Lo especulativo (réplica, stream, similares/sugerencias) se aplica al encolar.
+  Cada worker revisa en su loop las escrituras que quedaron `fallidas`
+  (`descartada_at`) y llama a los oyentes de `al_descartar`, que lo vuelven a
+  lo que hay en BigQuery más lo pendiente.
+- Un solo archivo para todos los workers: aplica solo el que tiene el lease
+  (`journal_lease_s`), así el orden es global.
+
+GET /gestiones/pendientes muestra lo que falta aplicar; los routers consultan
+`superponer` para ver lo propio antes de que llegue a BigQuery.
+"""
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from google.api_core.exceptions import BadRequest
+
+from .config import settings
+
+log = logging.getLogger(__name__)
+
+Param = Tuple[str, str, Any]
+
+_DDL = """
+CREATE TABLE IF NOT EXISTS escrituras (
+  seq INTEGER PRIMARY KEY AUTOINCREMENT,
+  tipo TEXT NOT NULL,                      -- alta | estado
+  id_gestion TEXT NOT NULL,
+  usuario TEXT,
+  datos TEXT NOT NULL,                     -- JSON {fila: [[n, t, v]], evento: [[n, t, v]]}
+  estado TEXT NOT NULL DEFAULT 'pendiente',  -- pendiente | aplicada | fallida
+  intentos INTEGER NOT NULL DEFAULT 0,
+  ultimo_error TEXT,
+  creada_at REAL NOT NULL,
+  aplicada_at REAL,
+  descartada_at REAL
+);
+CREATE INDEX IF NOT EXISTS ix_estado_seq ON escrituras (estado, seq);
+CREATE INDEX IF NOT EXISTS ix_gestion ON escrituras (id_gestion, estado);
+CREATE TABLE IF NOT EXISTS lease (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  duenio TEXT NOT NULL,
+  vence REAL NOT NULL
+);
+"""
+
+
+def _a_json(v: Any) -> Any:
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()
+    if isinstance(v, Decimal):
+        return str(v)
+    return v
+
+
+def _de_json(tipo: str, v: Any) -> Any:
+    if v is None:
+        return None
+    if tipo == "TIMESTAMP":
+        return datetime.fromisoformat(v)
+    if tipo == "DATE":
+        return date.fromisoformat(v)
+    return v
+
+
+def _params(crudos: Sequence[Sequence[Any]]) -> List[Param]:
+    return [(n, t, _de_json(t, v)) for n, t, v in crudos]
+
+
+def _dict(params: Sequence[Param]) -> Dict[str, Any]:
+    return {n: v for n, _, v in params}
+
+
+def _permanente(e: Exception) -> bool:
+    # conflicto entre transacciones concurrentes también llega como 400: es transitorio
+    return isinstance(e, BadRequest) and "concurrent update" not in str(e).lower()
+
+
+class Journal:
+    def __init__(self):
+        self._path: Optional[Path] = None
+        self._local = threading.local()
+        self._despertar = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._yo = f"{socket.gethostname()}:{os.getpid()}"
+        # seq hasta la que se aplica de a una entrada (después de un lote fallido)
+        self._aislar_hasta = 0
+        # descartadas hasta acá ya revertidas en este worker (al arrancar la réplica se siembra de cero)
+        self._revertidas_hasta = time.time()
+        self._oyentes: List[Callable[[str], None]] = []
+
+        self.lotes = 0
+        self.aplicadas = 0
+        self.errores = 0
+        self.ultimo_error: Optional[str] = None
+        self.ultimo_lote: Optional[Dict[str, Any]] = None
+
+    # -------------------------
+    # conexiones
+    # -------------------------
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")  # el 202 se da recién cuando está en disco
+            self._local.conn = conn
+        return conn
+
+    def activo(self) -> bool:
+        return self._thread is not None
+
+    def iniciar(self) -> None:
+        if not settings.journal_enabled or self._thread is not None:
+            return
+        if not settings.journal_path:
+            # sin volumen durable un reinicio pierde escrituras ya confirmadas con 202
+            raise RuntimeError("JOURNAL_ENABLED=true requiere JOURNAL_PATH en un volumen persistente")
+        self._path = Path(settings.journal_path)
+        if self._path.resolve().is_relative_to(Path("/tmp")) or self._path.resolve().is_relative_to(Path("/dev/shm")):
+            log.warning("journal: %s no sobrevive a un reinicio del contenedor", self._path)
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn().executescript(_DDL)
+        self._thread = threading.Thread(target=self._loop, name="journal", daemon=True)
+        self._thread.start()
+        pendientes = self._conn().execute("SELECT COUNT(1) FROM escrituras WHERE estado = 'pendiente'").fetchone()[0]
+        if pendientes:
+            log.info("journal: %d escrituras pendientes de un arranque anterior", pendientes)
+
+    # -------------------------
+    # request: encolar / leer lo pendiente
+    # -------------------------
+    def encolar(self, tipo: str, id_gestion: str, usuario: str, fila: Sequence[Param], evento: Sequence[Param]) -> int:
+        datos = json.dumps({
+            "fila": [[n, t, _a_json(v)] for n, t, v in fila],
+            "evento": [[n, t, _a_json(v)] for n, t, v in evento],
+        }, ensure_ascii=False)
+        cur = self._conn().execute(
+            "INSERT INTO escrituras (tipo, id_gestion, usuario, datos, creada_at) VALUES (?, ?, ?, ?, ?)",
+            (tipo, id_gestion, usuario, datos, time.time()),
+        )
+        self._despertar.set()
+        return cur.lastrowid
+
+    def _pendientes_de(self, id_gestion: str) -> List[sqlite3.Row]:
+        return self._conn().execute(
+            "SELECT * FROM escrituras WHERE id_gestion = ? AND estado = 'pendiente' ORDER BY seq",
+            (id_gestion,),
+        ).fetchall()
+
+    def tiene_pendientes(self, id_gestion: str) -> bool:
+        return self.activo() and bool(self._pendientes_de(id_gestion))
+
+    def superponer(self, id_gestion: str, g: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """`g` (leída de BigQuery o la réplica, o None) con las escrituras pendientes aplicadas encima."""
+        if not self.activo():
+            return g
+        for r in self._pendientes_de(id_gestion):
+            fila = _dict(_params(json.loads(r["datos"])["fila"]))
+            if r["tipo"] == "alta":
+                g = {**fila, "is_deleted": False, **(g or {})}
+            elif g is not None:
+                g = {
+                    **g,
+                    "estado": fila["nuevo_estado"],
+                    "fecha_estado": fila["fecha_estado"],
+                    "derivado_a_id": fila["derivado_a_id"],
+                    "updated_at": fila["updated_at"],
+                    "updated_by": fila["updated_by"],
+                }
+            if g is not None:
+                g["pendiente"] = True
+        return g
+
+    # -------------------------
+    # committer
+    # -------------------------
+    def al_descartar(self, fn: Callable[[str], None]) -> None:
+        """fn(id_gestion) en cada worker cuando una escritura de esa gestión queda fallida."""
+        self._oyentes.append(fn)
+
+    def _revertir_descartadas(self) -> None:
+        try:
+            self._revertir()
+        except Exception as e:
+            # se reintenta en la próxima vuelta (la reversión es idempotente)
+            log.warning("journal: no se pudo revertir lo descartado: %s", e)
+
+    def _revertir(self) -> None:
+        rows = self._conn().execute(
+            "SELECT DISTINCT id_gestion, descartada_at FROM escrituras "
+            "WHERE estado = 'fallida' AND descartada_at > ? ORDER BY descartada_at",
+            (self._revertidas_hasta,),
+        ).fetchall()
+        for r in rows:
+            for fn in self._oyentes:
+                fn(r["id_gestion"])
+            self._revertidas_hasta = r["descartada_at"]
+
+    def _tomar_lease(self) -> bool:
+        conn = self._conn()
+        ahora = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT duenio, vence FROM lease WHERE id = 1").fetchone()
+            if row and row["duenio"] != self._yo and row["vence"] > ahora:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO lease (id, duenio, vence) VALUES (1, ?, ?)",
+                (self._yo, ahora + settings.journal_lease_s),
+            )
+            return True
+        finally:
+            conn.execute("COMMIT")
+
+    # condición para marcar entradas: solo con el lease vigente a nuestro nombre
+    _CON_LEASE = " AND EXISTS (SELECT 1 FROM lease WHERE id = 1 AND duenio = ? AND vence > ?)"
+
+    def _loop(self) -> None:
+        espera = settings.journal_intervalo_s
+        while True:
+            self._despertar.wait(espera)
+            self._despertar.clear()
+            self._revertir_descartadas()
+            try:
+                if not self._tomar_lease():
+                    espera = settings.journal_intervalo_s
+                    continue
+                # juntar lo que llega en ráfaga antes de armar el lote
+                time.sleep(settings.journal_espera_lote_s)
+                while self._aplicar_lote():
+                    if not self._tomar_lease():
+                        # otro worker tomó el lease (un lote tardó más que journal_lease_s)
+                        log.warning("journal: se perdió el lease, se deja de aplicar")
+                        break
+                self._purgar()
+                self._revertir_descartadas()
+                espera = settings.journal_intervalo_s
+            except Exception as e:
+                self.errores += 1
+                self.ultimo_error = str(e)
+                log.warning("journal: no se pudo aplicar: %s", e)
+                espera = min(max(espera, 1) * 2, 300)
+
+    def _aplicar_lote(self) -> bool:
+        """Aplica el próximo lote. True si aplicó algo (puede haber más)."""
+        conn = self._conn()
+        filas = conn.execute(
+            "SELECT * FROM escrituras WHERE estado = 'pendiente' ORDER BY seq LIMIT ?",
+            (settings.journal_lote,),
+        ).fetchall()
+        if not filas:
+            return False
+        if filas[0]["seq"] <= self._aislar_hasta:
+            filas = filas[:1]
+
+        seqs = [r["seq"] for r in filas]
+        t0 = time.perf_counter()
+        try:
+            self._ejecutar(filas)
+        except Exception as e:
+            marcas = ",".join("?" * len(seqs))
+            conn.execute(
+                f"UPDATE escrituras SET intentos = intentos + 1, ultimo_error = ? WHERE seq IN ({marcas})",
+                [str(e)[:2000], *seqs],
+            )
+            if len(filas) > 1:
+                self._aislar_hasta = seqs[-1]
+            elif _permanente(e) and filas[0]["intentos"] + 1 >= settings.journal_max_intentos:
+                return self._descartar(filas[0], e)
+            raise
+
+        cur = conn.execute(
+            f"UPDATE escrituras SET estado = 'aplicada', aplicada_at = ? "
+            f"WHERE seq IN ({','.join('?' * len(seqs))}){self._CON_LEASE}",
+            [time.time(), *seqs, self._yo, time.time()],
+        )
+        if cur.rowcount == 0:
+            # el lease venció mientras corría el lote: las entradas quedan pendientes y
+            # el committer nuevo las re-aplica (las sentencias son idempotentes)
+            log.warning("journal: lote %s-%s aplicado sin lease vigente, no se marca", seqs[0], seqs[-1])
+            return False
+        self.lotes += 1
+        self.aplicadas += len(seqs)
+        self.ultimo_lote = {
+            "desde_seq": seqs[0],
+            "hasta_seq": seqs[-1],
+            "escrituras": len(seqs),
+            "ms": round((time.perf_counter() - t0) * 1000),
+        }
+        return True
+
+    def _descartar(self, fila: sqlite3.Row, e: Exception) -> bool:
+        """Marca la entrada (y lo que dependa de ella) como fallida. False si ya no tenemos el lease."""
+        # sin la alta, lo que siga de esa gestión tampoco puede aplicarse bien
+        dependientes = " OR (id_gestion = ? AND estado = 'pendiente')" if fila["tipo"] == "alta" else ""
+        ahora = time.time()
+        args = [ahora, f"{e}"[:2000], fila["seq"]] + ([fila["id_gestion"]] if dependientes else [])
+        cur = self._conn().execute(
+            f"UPDATE escrituras SET estado = 'fallida', descartada_at = ?, ultimo_error = ? "
+            f"WHERE (seq = ?{dependientes}){self._CON_LEASE}",
+            args + [self._yo, ahora],
+        )
+        if cur.rowcount == 0:
+            return False
+        log.error("journal: escritura %s (%s %s) descartada: %s", fila["seq"], fila["tipo"], fila["id_gestion"], e)
+        return True
+
+    def _ejecutar(self, filas: Sequence[sqlite3.Row]) -> None:
+        from .bq import fqtn, run_query
+        from .deps import qparams, qstructs
+        from . import sql_gestiones as Q
+
+        altas: List[List[Param]] = []
+        estados: Dict[str, List[Param]] = {}  # el último por gestión
+        eventos: List[List[Param]] = []
+        for r in filas:
+            datos = json.loads(r["datos"])
+            fila, evento = _params(datos["fila"]), _params(datos["evento"])
+            if r["tipo"] == "alta":
+                altas.append(fila)
+            else:
+                estados.pop(r["id_gestion"], None)
+                estados[r["id_gestion"]] = fila + [("id_evento", "STRING", _dict(evento)["id_evento"])]
+            eventos.append(evento)
+
+        sentencias, arrays = [], []
+        for nombre, sql, grupo in (
+            ("altas", Q.JOURNAL_ALTAS, altas),
+            ("estados", Q.JOURNAL_ESTADOS, list(estados.values())),
+            ("eventos", Q.JOURNAL_EVENTOS, eventos),
+        ):
+            if grupo:
+                sentencias.append(sql)
+                arrays.append(qstructs(nombre, [(n, t) for n, t, _ in grupo[0]], [_dict(p) for p in grupo]))
+
+        desde = min(_dict(e)["fecha_evento"] for e in eventos)
+        cuerpo = "".join(sentencias).format(
+            gestiones=fqtn("infra_gestion.gestiones"),
+            eventos=fqtn("infra_gestion.gestiones_eventos"),
+        )
+        cfg = qparams([("desde", "TIMESTAMP", desde)], arrays=arrays)
+        run_query(Q.JOURNAL_LOTE.format(sentencias=cuerpo), cfg, write=True)
+
+    def _purgar(self) -> None:
+        limite = time.time() - settings.journal_retencion_h * 3600
+        self._conn().execute("DELETE FROM escrituras WHERE estado = 'aplicada' AND aplicada_at < ?", (limite,))
+
+    # -------------------------
+    # estado
+    # -------------------------
+    def listar(
+        self,
+        usuario: Optional[str] = None,
+        id_gestion: Optional[str] = None,
+        incluir_fallidas: bool = True,
+        limit: int = 100,
+    ) -> List[Dict[str, Any]]:
+        conds = ["estado IN ('pendiente', 'fallida')" if incluir_fallidas else "estado = 'pendiente'"]
+        args: List[Any] = []
+        if usuario:
+            conds.append("usuario = ?")
+            args.append(usuario)
+        if id_gestion:
+            conds.append("id_gestion = ?")
+            args.append(id_gestion)
+        rows = self._conn().execute(
+            f"SELECT seq, tipo, id_gestion, usuario, estado, intentos, ultimo_error, creada_at "
+            f"FROM escrituras WHERE {' AND '.join(conds)} ORDER BY seq LIMIT ?",
+            args + [limit],
+        ).fetchall()
+        ahora = time.time()
+        return [{
+            **{k: r[k] for k in ("seq", "tipo", "id_gestion", "usuario", "estado", "intentos", "ultimo_error")},
+            "creada_at": datetime.fromtimestamp(r["creada_at"], timezone.utc).isoformat(),
+            "antiguedad_s": round(ahora - r["creada_at"], 1),
+        } for r in rows]
+
+    def estado(self) -> Dict[str, Any]:
+        if not self.activo():
+            return {"habilitado": settings.journal_enabled, "activo": False}
+        conn = self._conn()
+        cuentas = dict(conn.execute("SELECT estado, COUNT(1) FROM escrituras GROUP BY estado").fetchall())
+        mas_vieja = conn.execute("SELECT MIN(creada_at) FROM escrituras WHERE estado = 'pendiente'").fetchone()[0]
+        lease = conn.execute("SELECT duenio, vence FROM lease WHERE id = 1").fetchone()
+        return {
+            "habilitado": settings.journal_enabled,
+            "activo": True,
+            "pendientes": cuentas.get("pendiente", 0),
+            "fallidas": cuentas.get("fallida", 0),
+            "aplicadas_retenidas": cuentas.get("aplicada", 0),
+            "pendiente_mas_vieja_s": round(time.time() - mas_vieja, 1) if mas_vieja else None,
+            "committer": lease["duenio"] if lease and lease["vence"] > time.time() else None,
+            "es_committer": bool(lease and lease["duenio"] == self._yo and lease["vence"] > time.time()),
+            "lotes": self.lotes,
+            "aplicadas": self.aplicadas,
+            "ultimo_lote": self.ultimo_lote,
+            "errores": self.errores,
+            "ultimo_error": self.ultimo_error,
+        }
+
+
+journal = Journal()
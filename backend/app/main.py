@@ -1,8 +1,38 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .routers import me, gestiones, catalogos, usuarios
+from fastapi.responses import JSONResponse
+
+from .config import settings
+from .routers import me, gestiones, catalogos, usuarios, admin, auditoria, reportes, jobs, sesiones
+from . import warmup
+from .jobs import runner as jobs_runner
+from .journal import journal
+from .replica import replica
+from .tracing import TimedJSONResponse, TracingMiddleware
+
+logging.basicConfig(level=logging.INFO)
+
 
-app = FastAPI(title="Infra Gestión API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # En background: el proceso acepta conexiones (liveness) y /ready avisa cuándo está caliente
+    tarea = None
+    if settings.warmup_enabled:
+        tarea = asyncio.create_task(asyncio.to_thread(warmup.ejecutar))
+    else:
+        warmup.marcar_listo()
+    app.state.warmup_task = tarea
+    replica.iniciar()
+    journal.iniciar()
+    jobs_runner.iniciar()
+    yield
+
+
+app = FastAPI(title="Infra Gestión API", lifespan=lifespan, default_response_class=TimedJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -10,9 +40,22 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Fuente", "X-Replica-Lag"],
 )
+app.add_middleware(TracingMiddleware)
 
+app.include_router(sesiones.router)
 app.include_router(me.router)
 app.include_router(catalogos.router)
 app.include_router(gestiones.router)
 app.include_router(usuarios.router)
+app.include_router(admin.router)
+app.include_router(auditoria.router)
+app.include_router(reportes.router)
+app.include_router(jobs.router)
+
+
+@app.get("/ready", tags=["health"])
+def ready():
+    estado = warmup.estado()
+    return JSONResponse(estado, status_code=200 if estado["listo"] else 503)
@@ -0,0 +1,88 @@
+# app/pubsub.py
+"""
+Pub/sub en proceso para cambios de gestiones.
+
+Los endpoints que mutan (sync, corren en el threadpool) publican eventos;
+las conexiones SSE (async, corren en el event loop) se suscriben.
+Es por proceso: con varios workers cada uno ve solo sus propias escrituras.
+Además de las suscripciones SSE hay oyentes sync (`escuchar`) para índices en
+memoria que se mantienen con cada escritura.
+"""
+import asyncio
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional
+
+log = logging.getLogger(__name__)
+
+Evento = Dict[str, Any]
+
+
+class Suscripcion:
+    def __init__(self, loop: asyncio.AbstractEventLoop, filtro: Callable[[Evento], bool], maxsize: int):
+        self.loop = loop
+        self.filtro = filtro
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        # Si el cliente no consume a tiempo se marca desbordada y la conexión
+        # le pide al front un reload completo (no se pierden cambios en silencio).
+        self.desbordada = False
+
+    def _entregar(self, evento: Evento) -> None:
+        # corre dentro del event loop
+        if self.desbordada:
+            return
+        try:
+            self.queue.put_nowait(evento)
+        except asyncio.QueueFull:
+            self.desbordada = True
+
+
+class Bus:
+    def __init__(self, maxsize: int = 256):
+        self._lock = threading.Lock()
+        self._subs: set[Suscripcion] = set()
+        self._oyentes: list[Callable[[Evento], None]] = []
+        self._maxsize = maxsize
+
+    def suscribir(self, filtro: Optional[Callable[[Evento], bool]] = None) -> Suscripcion:
+        """Debe llamarse desde el event loop (endpoint async)."""
+        sub = Suscripcion(asyncio.get_running_loop(), filtro or (lambda _e: True), self._maxsize)
+        with self._lock:
+            self._subs.add(sub)
+        return sub
+
+    def desuscribir(self, sub: Suscripcion) -> None:
+        with self._lock:
+            self._subs.discard(sub)
+
+    def escuchar(self, fn: Callable[[Evento], None]) -> None:
+        """Oyente sync: corre en el thread que publica, tiene que ser rápido."""
+        with self._lock:
+            self._oyentes.append(fn)
+
+    def publicar(self, evento: Evento) -> None:
+        """Thread-safe: se puede llamar desde endpoints sync."""
+        with self._lock:
+            subs = list(self._subs)
+            oyentes = list(self._oyentes)
+        for fn in oyentes:
+            try:
+                fn(evento)
+            except Exception:
+                # un índice roto no puede tirar la escritura (ya está en BigQuery)
+                log.exception("oyente de %s falló", evento.get("tipo"))
+        for sub in subs:
+            try:
+                if not sub.filtro(evento):
+                    continue
+                sub.loop.call_soon_threadsafe(sub._entregar, evento)
+            except RuntimeError:
+                # loop cerrado (shutdown): la conexión ya no existe
+                self.desuscribir(sub)
+
+    def suscriptores(self) -> int:
+        with self._lock:
+            return len(self._subs)
+
+
+bus = Bus()
@@ -0,0 +1,282 @@
+# app/query_budget.py
+"""
+Regresión de costo de las queries: dry-run de cada SQL registrado con
+parámetros representativos y comparación contra budgets versionados
+(backend/query_budgets.json).
+
+    python -m app.query_budget                      # chequea, exit 1 si alguna se pasa o no tiene budget
+    python -m app.query_budget --actualizar         # reescribe budgets con lo observado + margen
+    python -m app.query_budget --dataset infra_fixture --json reporte.json
+
+Contra el emulador (ej. bigquery-emulator): BQ_API_ENDPOINT=http://localhost:9050.
+Una query sin budget (o con max_bytes null) también falla. Sin JSON medido
+(no existe o nunca pasó por --actualizar) el chequeo no corre y sale con 2:
+primero `--actualizar` contra el fixture y versionar el resultado.
+--actualizar no escribe nada si alguna query da error. --permitir-sin-budget
+solo sirve para medir mientras se agregan queries nuevas.
+El dry-run no factura. Se registran bytes procesados y la fracción leída de las
+tablas referenciadas (1.0 = full scan; mientras más baja, mejor poda).
+
+Los scripts multi-statement (altas/ediciones de usuarios, refresh de reportes)
+no se registran: el dry-run de scripts no reporta bytes por statement.
+"""
+import argparse
+import json
+import math
+import os
+import sys
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from google.cloud import bigquery
+
+from .bq import fqtn
+from .config import settings
+from .deps import qparams
+from . import sql_auditoria as QA
+from . import sql_catalogos as QC
+from . import sql_consistencia as QK
+from . import sql_gestiones as QG
+from . import sql_reportes as QR
+from . import sql_usuarios as QU
+
+BUDGETS_PATH = Path(__file__).resolve().parent.parent / "query_budgets.json"
+MARGEN_DEFAULT = 0.10
+
+_TABLAS = (
+    ("gestiones", "gestiones"),
+    ("archivo", "gestiones_archivo"),
+    ("eventos", "gestiones_eventos"),
+    ("geo_localidades", "geo_localidades"),
+    ("usuarios_roles", "usuarios_roles"),
+    ("usuarios_eventos", "usuarios_eventos"),
+    ("tiempos", "gestiones_tiempos_estado"),
+    ("cat_estado", "cat_estado"),
+    ("cat_urgencia", "cat_urgencia"),
+    ("cat_ministerio_agencia", "cat_ministerio_agencia"),
+    ("cat_categoria_general", "cat_categoria_general"),
+    ("cat_tipo_gestion", "cat_tipo_gestion"),
+    ("cat_canal_origen", "cat_canal_origen"),
+)
+
+
+def _filtros(**valores: Optional[str]) -> List[Tuple[str, str, Any]]:
+    return [(k, "STRING", valores.get(k)) for k in (
+        "estado", "ministerio", "categoria", "departamento", "localidad",
+        "q", "tipo_gestion", "canal_origen",
+    )]
+
+
+def registro() -> List[Tuple[str, str, List[Tuple[str, str, Any]]]]:
+    """(nombre, sql con placeholders, parámetros). Nombres estables: son las claves del JSON."""
+    ahora = datetime.now(timezone.utc)
+    semana = ahora - timedelta(days=7)
+    bbox = [("min_lat", "FLOAT64", -35.0), ("max_lat", "FLOAT64", -29.5),
+            ("min_lon", "FLOAT64", -65.8), ("max_lon", "FLOAT64", -61.7)]
+    pagina = [("limit", "INT64", 50), ("offset", "INT64", 0)]
+    auditoria = [
+        ("desde", "TIMESTAMP", semana), ("hasta", "TIMESTAMP", ahora),
+        ("cursor_ts", "TIMESTAMP", None), ("cursor_id", "STRING", None),
+        ("actor", "STRING", None), ("tipo_evento", "STRING", None),
+        ("entidad_id", "STRING", None), ("limit", "INT64", 101),
+    ]
+    return [
+        ("gestiones.count", QG.COUNT_GESTIONES, _filtros()),
+        ("gestiones.count_q", QG.COUNT_GESTIONES, _filtros(q="ruta")),
+        ("gestiones.list", QG.LIST_GESTIONES, _filtros() + pagina),
+        ("gestiones.list_departamento", QG.LIST_GESTIONES, _filtros(departamento="CAPITAL") + pagina),
+        ("gestiones.list_q", QG.LIST_GESTIONES, _filtros(q="ruta") + pagina),
+        ("gestiones.list_archivo", QG.LIST_GESTIONES.replace("`{gestiones}`", QG.GESTIONES_CON_ARCHIVO),
+         _filtros() + pagina),
+        ("gestiones.changes", QG.CHANGES_GESTIONES, _filtros() + [
+            ("since", "TIMESTAMP", ahora - timedelta(minutes=5)), ("since_id", "STRING", ""),
+            ("hasta", "TIMESTAMP", ahora), ("limit", "INT64", 500),
+        ]),
+        ("gestiones.changes_archivo", QG.CHANGES_GESTIONES_CON_ARCHIVO, _filtros() + [
+            ("since", "TIMESTAMP", ahora - timedelta(minutes=5)), ("since_id", "STRING", ""),
+            ("hasta", "TIMESTAMP", ahora), ("limit", "INT64", 500),
+        ]),
+        ("gestiones.replica_seed", QG.REPLICA_SEED, []),
+        ("gestiones.replica_cambios", QG.REPLICA_CAMBIOS, [
+            ("since", "TIMESTAMP", ahora - timedelta(seconds=15)), ("since_id", "STRING", ""),
+            ("hasta", "TIMESTAMP", ahora), ("limit", "INT64", 5000),
+        ]),
+        ("gestiones.replica_archivadas", QG.REPLICA_ARCHIVADAS, [("since", "TIMESTAMP", ahora - timedelta(minutes=5))]),
+        ("gestiones.similares_seed", QG.SIMILARES_SEED, [("dias", "INT64", 365)]),
+        ("gestiones.sugerencias_seed", QG.SUGERENCIAS_SEED, []),
+        ("gestiones.mapa_clusters", QG.MAPA_CLUSTERS, _filtros() + bbox + [("celda", "FLOAT64", 0.35), ("limit", "INT64", 1024)]),
+        ("gestiones.mapa_puntos", QG.MAPA_PUNTOS, _filtros() + bbox + [("limit", "INT64", 2000)]),
+        ("gestiones.get", QG.GET_GESTION, [("id_gestion", "STRING", "00000000-0000-0000-0000-000000000000")]),
+        ("gestiones.eventos", QG.LIST_EVENTOS, [
+            ("id_gestion", "STRING", "00000000-0000-0000-0000-000000000000"),
+            ("cursor_ts", "TIMESTAMP", None), ("cursor_id", "STRING", None), ("limit", "INT64", 101),
+        ]),
+        ("gestiones.geo", QG.GET_GEO, [("departamento", "STRING", "CAPITAL"), ("localidad", "STRING", "CORDOBA")]),
+        ("usuarios.auth", QU.GET_USUARIO_AUTH, [("email", "STRING", "alguien@example.com")]),
+        ("usuarios.list", QU.LIST_USUARIOS, [
+            ("q", "STRING", None), ("rol", "STRING", None), ("limit", "INT64", 200), ("offset", "INT64", 0),
+        ]),
+        ("usuarios.count", QU.COUNT_USUARIOS, [("q", "STRING", "gmail"), ("rol", "STRING", None)]),
+        ("auditoria.gestiones", QA.BUSCAR_AUDITORIA.format(ramas=QA.AUDITORIA_GESTIONES), auditoria),
+        ("auditoria.todas", QA.BUSCAR_AUDITORIA.format(
+            ramas=QA.AUDITORIA_GESTIONES + "\nUNION ALL\n" + QA.AUDITORIA_USUARIOS), auditoria),
+        ("consistencia.limites", QK.LIMITES_RANGOS, [("rangos", "INT64", 32)]),
+        ("consistencia.gestiones_rango", QK.GESTIONES_RANGO, [("desde", "STRING", "8"), ("hasta", "STRING", "9")]),
+        ("consistencia.eventos_rango", QK.EVENTOS_RANGO, [("desde", "STRING", "8"), ("hasta", "STRING", "9")]),
+        ("consistencia.gestiones_hash", QK.GESTIONES_HASH, [("rangos", "INT64", 32)]),
+        ("consistencia.eventos_hash", QK.EVENTOS_HASH, [("rangos", "INT64", 32)]),
+        ("reportes.tiempos_estado", QR.TIEMPOS_ESTADO, [
+            ("desde", "TIMESTAMP", ahora - timedelta(days=90)), ("hasta", "TIMESTAMP", ahora),
+            ("ministerio", "STRING", None), ("departamento", "STRING", None),
+            ("por_ministerio", "BOOL", True), ("por_departamento", "BOOL", False),
+        ]),
+        ("catalogos.estados", QC.CAT_ESTADOS, []),
+        ("catalogos.urgencias", QC.CAT_URGENCIAS, []),
+        ("catalogos.ministerios", QC.CAT_MINISTERIOS, []),
+        ("catalogos.categorias", QC.CAT_CATEGORIAS, []),
+        ("catalogos.tipos_gestion", QC.CAT_TIPOS_GESTION, []),
+        ("catalogos.canales_origen", QC.CAT_CANALES_ORIGEN, []),
+        ("catalogos.geo", QC.GEO_LOCALIDADES, []),
+    ]
+
+
+def _client() -> bigquery.Client:
+    endpoint = os.getenv("BQ_API_ENDPOINT", "")
+    if endpoint:
+        from google.api_core.client_options import ClientOptions
+        from google.auth.credentials import AnonymousCredentials
+        return bigquery.Client(
+            project=settings.gcp_project or "test",
+            credentials=AnonymousCredentials(),
+            client_options=ClientOptions(api_endpoint=endpoint),
+        )
+    from .bq import bq_client
+    return bq_client()
+
+
+def _tamanios(client: bigquery.Client, refs, cache: Dict[str, Optional[int]]) -> Optional[int]:
+    total = 0
+    for ref in refs or []:
+        key = f"{ref.project}.{ref.dataset_id}.{ref.table_id}"
+        if key not in cache:
+            try:
+                cache[key] = int(client.get_table(key).num_bytes or 0)
+            except Exception:
+                cache[key] = None
+        if cache[key] is None:
+            return None
+        total += cache[key]
+    return total
+
+
+def medir(client: bigquery.Client, dataset: str) -> Dict[str, Dict[str, Any]]:
+    tablas = {k: fqtn(f"{dataset}.{t}") for k, t in _TABLAS}
+    cache: Dict[str, Optional[int]] = {}
+    out: Dict[str, Dict[str, Any]] = {}
+    for nombre, sql, params in registro():
+        cfg = qparams(params)
+        cfg.dry_run = True
+        cfg.use_query_cache = False
+        try:
+            job = client.query(sql.format(**tablas), job_config=cfg)
+        except Exception as e:
+            out[nombre] = {"error": str(e).splitlines()[0]}
+            continue
+        procesados = int(job.total_bytes_processed or 0)
+        tamanio = _tamanios(client, job.referenced_tables, cache)
+        out[nombre] = {
+            "bytes": procesados,
+            "bytes_tablas": tamanio,
+            "fraccion_leida": round(procesados / tamanio, 4) if tamanio else None,
+        }
+    return out
+
+
+def _fmt(n: Optional[int]) -> str:
+    if n is None:
+        return "-"
+    for unidad in ("B", "KB", "MB", "GB"):
+        if n < 1024:
+            return f"{n:.0f} {unidad}"
+        n /= 1024
+    return f"{n:.1f} TB"
+
+
+def comparar(medidas: Dict[str, Dict[str, Any]], budgets: Dict[str, Any], permitir_sin_budget: bool = False) -> int:
+    """Imprime el reporte y devuelve el exit code (0 ok, 1 regresión, 2 error de query)."""
+    limites = budgets.get("queries", {})
+    codigo = 0
+    print(f"{'query':34} {'bytes':>10} {'budget':>10} {'leído':>7}  estado")
+    for nombre, m in medidas.items():
+        if "error" in m:
+            print(f"{nombre:34} {'-':>10} {'-':>10} {'-':>7}  ERROR {m['error']}")
+            codigo = max(codigo, 2)
+            continue
+        limite = (limites.get(nombre) or {}).get("max_bytes")
+        if limite is None:
+            estado = "SIN BUDGET"
+            if not permitir_sin_budget:
+                codigo = max(codigo, 1)
+        elif m["bytes"] > limite:
+            estado = f"REGRESIÓN (+{(m['bytes'] / max(limite, 1) - 1) * 100:.0f}%)"
+            codigo = max(codigo, 1)
+        else:
+            estado = "ok"
+        frac = f"{m['fraccion_leida'] * 100:.0f}%" if m["fraccion_leida"] is not None else "-"
+        print(f"{nombre:34} {_fmt(m['bytes']):>10} {_fmt(limite):>10} {frac:>7}  {estado}")
+
+    sobrantes = sorted(set(limites) - set(medidas))
+    for nombre in sobrantes:
+        print(f"{nombre:34} budget sin query registrada (borrar del JSON)")
+    return codigo
+
+
+def actualizar(medidas: Dict[str, Dict[str, Any]], budgets: Dict[str, Any]) -> Dict[str, Any]:
+    margen = float(budgets.get("margen", MARGEN_DEFAULT))
+    queries = {}
+    for nombre, m in medidas.items():
+        queries[nombre] = {
+            "max_bytes": int(math.ceil(m["bytes"] * (1 + margen))),
+            "observado": m["bytes"],
+            "fraccion_leida": m["fraccion_leida"],
+        }
+    return {"margen": margen, "actualizado": date.today().isoformat(), "queries": queries}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(prog="python -m app.query_budget", description=__doc__.splitlines()[1])
+    p.add_argument("--dataset", default=settings.bq_dataset, help="dataset (fixture) contra el que correr el dry-run")
+    p.add_argument("--budgets", default=str(BUDGETS_PATH), help="JSON de budgets versionado")
+    p.add_argument("--actualizar", action="store_true", help="reescribir budgets con lo observado + margen")
+    p.add_argument("--permitir-sin-budget", action="store_true", help="no fallar si una query no tiene budget (solo reportarla)")
+    p.add_argument("--json", dest="salida_json", help="guardar las medidas en este archivo")
+    args = p.parse_args(argv)
+
+    ruta = Path(args.budgets)
+    budgets = json.loads(ruta.read_text(encoding="utf-8")) if ruta.exists() else {}
+    if not args.actualizar and not budgets.get("actualizado"):
+        print(f"{ruta}: budgets sin medir; correr --actualizar contra el fixture y versionar el JSON")
+        return 2
+
+    medidas = medir(_client(), args.dataset)
+    if args.salida_json:
+        Path(args.salida_json).write_text(json.dumps(medidas, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    if args.actualizar:
+        errores = sorted(n for n, m in medidas.items() if "error" in m)
+        if errores:
+            # un budget null no chequea nada: mejor no escribir que versionar huecos
+            for nombre in errores:
+                print(f"{nombre:34} ERROR {medidas[nombre]['error']}")
+            print(f"{ruta} sin cambios: {len(errores)} queries con error")
+            return 2
+        ruta.write_text(json.dumps(actualizar(medidas, budgets), indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+        print(f"budgets actualizados en {ruta}")
+        return 0
+
+    return comparar(medidas, budgets, args.permitir_sin_budget)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
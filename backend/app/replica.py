@@ -0,0 +1,367 @@
+# app/replica.py
+"""
+Réplica local de gestiones en SQLite para listado, búsqueda y detalle en
+milisegundos. BigQuery sigue siendo la fuente de verdad: las escrituras van a
+BigQuery y se aplican acá además (write-through) para leer lo propio enseguida.
+
+- Carga inicial completa (REPLICA_SEED) en un thread al arrancar.
+- Después sigue `updated_at` con el mismo keyset y margen que /gestiones/changes
+  (REPLICA_CAMBIOS) cada `replica_sync_s`, o antes si hubo una escritura.
+- Las gestiones que pasan a gestiones_archivo (borrado físico en gestiones,
+  no se ve por updated_at) se sacan cada `replica_archivo_s` (REPLICA_ARCHIVADAS).
+- Lag = antigüedad del watermark. Si supera `replica_max_lag_s` (o no terminó
+  la carga) `disponible()` da False y los endpoints leen de BigQuery.
+
+Un archivo por proceso (con varios workers, cada uno tiene su réplica).
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .config import settings
+
+log = logging.getLogger(__name__)
+
+COLUMNAS = (
+    "id_gestion", "nro_expediente", "origen",
+    "estado", "fecha_ingreso", "fecha_estado", "fecha_finalizacion",
+    "urgencia",
+    "ministerio_agencia_id", "organismo_id", "derivado_a_id",
+    "categoria_general_id", "subcategoria_id", "tipo_demanda_principal_id", "subtipo_detalle",
+    "detalle", "observaciones",
+    "geo_id", "departamento", "localidad", "direccion", "lat", "lon",
+    "costo_estimado", "costo_moneda",
+    "created_at", "created_by", "updated_at", "updated_by",
+    "tipo_gestion", "canal_origen",
+)
+
+# Columnas de LIST_GESTIONES (dias_transcurridos se calcula al leer)
+COLUMNAS_LISTA = (
+    "id_gestion", "departamento", "localidad", "estado", "urgencia",
+    "ministerio_agencia_id", "categoria_general_id", "tipo_gestion", "canal_origen",
+    "detalle", "costo_estimado", "costo_moneda", "nro_expediente", "fecha_ingreso",
+    "fecha_estado",
+)
+
+# Mismos campos que el filtro `q` de FILTROS_GESTIONES
+_CAMPOS_BUSQUEDA = (
+    "id_gestion", "departamento", "localidad", "estado", "urgencia", "detalle",
+    "subtipo_detalle", "nro_expediente", "costo_estimado", "costo_moneda",
+    "tipo_gestion", "canal_origen",
+)
+
+_DDL = f"""
+CREATE TABLE IF NOT EXISTS gestiones (
+  {", ".join(c + (" TEXT PRIMARY KEY" if c == "id_gestion" else "") for c in COLUMNAS)},
+  busqueda TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_orden ON gestiones (fecha_ingreso DESC, fecha_estado DESC);
+CREATE INDEX IF NOT EXISTS ix_estado ON gestiones (estado);
+CREATE INDEX IF NOT EXISTS ix_ministerio ON gestiones (ministerio_agencia_id);
+"""
+
+
+def _a_sqlite(v: Any) -> Any:
+    if isinstance(v, datetime):
+        if v.tzinfo is None:
+            v = v.replace(tzinfo=timezone.utc)
+        return v.astimezone(timezone.utc).isoformat()
+    if isinstance(v, date):
+        return v.isoformat()
+    if isinstance(v, Decimal):
+        return str(v)
+    return v
+
+
+def _norm(s: Optional[str]) -> str:
+    # mismo criterio que UPPER(TRIM(...)) en SQL
+    return (s or "").strip().upper()
+
+
+def _busqueda(fila: Dict[str, Any]) -> str:
+    return "\x1f".join(str(fila.get(c) if fila.get(c) is not None else "").casefold() for c in _CAMPOS_BUSQUEDA)
+
+
+def _de_sqlite(fila: Dict[str, Any]) -> Dict[str, Any]:
+    for c in ("costo_estimado", "lat", "lon"):
+        if fila.get(c) is not None:
+            fila[c] = float(fila[c])
+    return fila
+
+
+def _dias(fecha_estado: Optional[str], ahora: datetime) -> Optional[int]:
+    if not fecha_estado:
+        return None
+    return (ahora - datetime.fromisoformat(fecha_estado)).days
+
+
+class Replica:
+    def __init__(self):
+        self._path: Optional[Path] = None
+        self._write_lock = threading.Lock()
+        self._local = threading.local()
+        self._despertar = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self._sembrada = False
+        self._watermark: Optional[datetime] = None
+        self._watermark_id = ""
+        self._archivo_watermark: Optional[datetime] = None
+        self._archivo_chequeado = 0.0
+        self._ultima_sync: Optional[float] = None
+        self.errores = 0
+        self.ultimo_error: Optional[str] = None
+        self.lecturas = 0
+        self.fallbacks = 0
+
+    # -------------------------
+    # conexiones
+    # -------------------------
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.create_function("norm", 1, _norm, deterministic=True)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")  # es descartable: se re-siembra al arrancar
+            self._local.conn = conn
+        return conn
+
+    def iniciar(self) -> None:
+        if not settings.replica_enabled or self._thread is not None:
+            return
+        self._path = Path(settings.replica_dir) / f"replica_gestiones_{os.getpid()}.sqlite3"
+        for sufijo in ("", "-wal", "-shm"):
+            Path(str(self._path) + sufijo).unlink(missing_ok=True)
+        self._conn().executescript(_DDL)
+        self._thread = threading.Thread(target=self._loop, name="replica", daemon=True)
+        self._thread.start()
+
+    # -------------------------
+    # sync desde BigQuery
+    # -------------------------
+    def _loop(self) -> None:
+        espera = settings.replica_sync_s
+        while True:
+            try:
+                if not self._sembrada:
+                    self._sembrar()
+                else:
+                    self._seguir()
+                espera = settings.replica_sync_s
+            except Exception as e:
+                self.errores += 1
+                self.ultimo_error = str(e)
+                log.warning("réplica: sync falló: %s", e)
+                espera = min(espera * 2, 300)
+            self._despertar.wait(espera)
+            self._despertar.clear()
+
+    def _sembrar(self) -> None:
+        from .bq import fqtn, run_query
+        from . import sql_gestiones as Q
+
+        hasta = datetime.now(timezone.utc) - timedelta(seconds=settings.changes_margen_s)
+        t0 = time.perf_counter()
+        rows = run_query(Q.REPLICA_SEED.format(gestiones=fqtn("infra_gestion.gestiones")))
+        with self._write_lock:
+            conn = self._conn()
+            conn.execute("DELETE FROM gestiones")
+            self._upsert_many(conn, [dict(r) for r in rows])
+            conn.commit()
+        # lo escrito en [hasta, ahora] se vuelve a leer en el primer tail (upsert idempotente)
+        self._watermark, self._watermark_id = hasta, ""
+        self._archivo_watermark, self._archivo_chequeado = hasta, time.monotonic()
+        self._ultima_sync = time.time()
+        self._sembrada = True
+        log.info("réplica: %d gestiones cargadas en %.0f ms", len(rows), (time.perf_counter() - t0) * 1000)
+
+    def _seguir(self) -> None:
+        from .bq import fqtn, run_query
+        from .deps import qparams
+        from . import sql_gestiones as Q
+
+        sql = Q.REPLICA_CAMBIOS.format(gestiones=fqtn("infra_gestion.gestiones"))
+        hasta = datetime.now(timezone.utc) - timedelta(seconds=settings.changes_margen_s)
+        limit = 5000
+        while True:
+            rows = [dict(r) for r in run_query(sql, qparams([
+                ("since", "TIMESTAMP", self._watermark),
+                ("since_id", "STRING", self._watermark_id),
+                ("hasta", "TIMESTAMP", hasta),
+                ("limit", "INT64", limit),
+            ]))]
+            if rows:
+                with self._write_lock:
+                    conn = self._conn()
+                    borradas = [r["id_gestion"] for r in rows if r.get("is_deleted")]
+                    self._upsert_many(conn, [r for r in rows if not r.get("is_deleted")])
+                    conn.executemany("DELETE FROM gestiones WHERE id_gestion = ?", [(i,) for i in borradas])
+                    conn.commit()
+                self._watermark, self._watermark_id = rows[-1]["updated_at"], rows[-1]["id_gestion"]
+            if len(rows) < limit:
+                break
+        # al día hasta `hasta` aunque no haya habido cambios
+        if self._watermark < hasta:
+            self._watermark, self._watermark_id = hasta, ""
+        self._ultima_sync = time.time()
+
+        if time.monotonic() - self._archivo_chequeado >= settings.replica_archivo_s:
+            self._sacar_archivadas(hasta)
+
+    def _sacar_archivadas(self, hasta: datetime) -> None:
+        from google.api_core.exceptions import NotFound
+
+        from .bq import fqtn, run_query
+        from .deps import qparams
+        from . import sql_gestiones as Q
+
+        self._archivo_chequeado = time.monotonic()
+        try:
+            rows = run_query(
+                Q.REPLICA_ARCHIVADAS.format(archivo=fqtn("infra_gestion.gestiones_archivo")),
+                qparams([("since", "TIMESTAMP", self._archivo_watermark)]),
+            )
+        except NotFound:
+            return  # todavía no se archivó nada
+        # mismo margen que los cambios: un lote puede confirmarse después de su archivado_at
+        ids = [r["id_gestion"] for r in rows if r["archivado_at"] <= hasta]
+        if ids:
+            with self._write_lock:
+                conn = self._conn()
+                conn.executemany("DELETE FROM gestiones WHERE id_gestion = ?", [(i,) for i in ids])
+                conn.commit()
+            log.info("réplica: %d gestiones archivadas", len(ids))
+        self._archivo_watermark = hasta
+
+    def _upsert_many(self, conn: sqlite3.Connection, filas: List[Dict[str, Any]]) -> None:
+        cols = COLUMNAS + ("busqueda",)
+        conn.executemany(
+            f"INSERT OR REPLACE INTO gestiones ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})",
+            [tuple(_a_sqlite(f.get(c)) for c in COLUMNAS) + (_busqueda(f),) for f in filas],
+        )
+
+    def sincronizar_pronto(self) -> None:
+        self._despertar.set()
+
+    # -------------------------
+    # write-through (las escrituras de esta API)
+    # -------------------------
+    def upsert(self, fila: Dict[str, Any]) -> None:
+        if not self._sembrada:
+            return
+        with self._write_lock:
+            conn = self._conn()
+            self._upsert_many(conn, [fila])
+            conn.commit()
+        self.sincronizar_pronto()
+
+    def actualizar(self, id_gestion: str, cambios: Dict[str, Any]) -> None:
+        if not self._sembrada:
+            return
+        with self._write_lock:
+            conn = self._conn()
+            row = conn.execute("SELECT * FROM gestiones WHERE id_gestion = ?", (id_gestion,)).fetchone()
+            if row:
+                self._upsert_many(conn, [{**dict(row), **cambios}])
+                conn.commit()
+        self.sincronizar_pronto()
+
+    def eliminar(self, id_gestion: str) -> None:
+        if not self._sembrada:
+            return
+        with self._write_lock:
+            conn = self._conn()
+            conn.execute("DELETE FROM gestiones WHERE id_gestion = ?", (id_gestion,))
+            conn.commit()
+        self.sincronizar_pronto()
+
+    # -------------------------
+    # lecturas
+    # -------------------------
+    def lag_s(self) -> Optional[float]:
+        if not self._sembrada or self._watermark is None:
+            return None
+        return round((datetime.now(timezone.utc) - self._watermark).total_seconds(), 1)
+
+    def disponible(self) -> bool:
+        lag = self.lag_s()
+        ok = lag is not None and lag <= settings.replica_max_lag_s
+        if settings.replica_enabled and not ok:
+            self.fallbacks += 1
+        return ok
+
+    def _where(self, filtros: Dict[str, Optional[str]]) -> Tuple[str, list]:
+        conds, args = [], []
+        exactos = {
+            "estado": "estado", "ministerio": "ministerio_agencia_id", "categoria": "categoria_general_id",
+            "tipo_gestion": "tipo_gestion", "canal_origen": "canal_origen",
+        }
+        for k, col in exactos.items():
+            if filtros.get(k):
+                conds.append(f"{col} = ?")
+                args.append(filtros[k])
+        for k in ("departamento", "localidad"):
+            if filtros.get(k):
+                conds.append(f"norm({k}) = ?")
+                args.append(_norm(filtros[k]))
+        if filtros.get("q"):
+            conds.append("instr(busqueda, ?) > 0")
+            args.append(filtros["q"].casefold())
+        return (" WHERE " + " AND ".join(conds)) if conds else "", args
+
+    def listar(self, filtros: Dict[str, Optional[str]], limit: int, offset: int) -> Tuple[int, List[Dict[str, Any]]]:
+        """(total, items) con el mismo filtro y orden que COUNT/LIST_GESTIONES."""
+        where, args = self._where(filtros)
+        conn = self._conn()
+        total = conn.execute(f"SELECT COUNT(1) FROM gestiones{where}", args).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT {', '.join(COLUMNAS_LISTA)} FROM gestiones{where} "
+            "ORDER BY fecha_ingreso DESC, fecha_estado DESC LIMIT ? OFFSET ?",
+            args + [limit, offset],
+        ).fetchall()
+        ahora = datetime.now(timezone.utc)
+        items = []
+        for r in rows:
+            d = _de_sqlite(dict(r))
+            d["dias_transcurridos"] = _dias(d.pop("fecha_estado"), ahora)
+            items.append(d)
+        self.lecturas += 1
+        return total, items
+
+    def obtener(self, id_gestion: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            f"SELECT {', '.join(COLUMNAS)} FROM gestiones WHERE id_gestion = ?", (id_gestion,)
+        ).fetchone()
+        if not row:
+            return None
+        self.lecturas += 1
+        return {**_de_sqlite(dict(row)), "is_deleted": False}
+
+    def estado(self) -> Dict[str, Any]:
+        filas = None
+        if self._sembrada:
+            filas = self._conn().execute("SELECT COUNT(1) FROM gestiones").fetchone()[0]
+        return {
+            "habilitada": settings.replica_enabled,
+            "sembrada": self._sembrada,
+            "filas": filas,
+            "watermark": self._watermark.isoformat() if self._watermark else None,
+            "lag_s": self.lag_s(),
+            "max_lag_s": settings.replica_max_lag_s,
+            "ultima_sync_hace_s": round(time.time() - self._ultima_sync, 1) if self._ultima_sync else None,
+            "lecturas": self.lecturas,
+            "fallbacks": self.fallbacks,
+            "errores": self.errores,
+            "ultimo_error": self.ultimo_error,
+        }
+
+
+replica = Replica()
@@ -0,0 +1,57 @@
+# app/routers/admin.py
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+from ..bq import estado_http_pool
+from ..cost_guard import guard
+from ..deps import require_roles
+from ..jobs import runner
+from ..journal import journal
+from ..replica import replica
+from ..similares import similares
+from ..sugerencias import sugerencias
+from ..scheduler import scheduler
+from ..singleflight import singleflight
+from ..tracing import perfilar
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+
+@router.get("/consumo-bq")
+def consumo_bq(user=Depends(require_roles("Admin"))):
+    """
+    Bytes facturados hoy por usuario y por rol, límites vigentes y contadores
+    del guard de costo (por proceso).
+    """
+    return guard.reporte()
+
+
+@router.get("/bq")
+def estado_bq(user=Depends(require_roles("Admin"))):
+    """Estado del scheduler, del single-flight, del pool HTTP de BigQuery, de los jobs, de la réplica, del journal de escrituras y de los índices de similares y sugerencias (por proceso)."""
+    return {
+        "scheduler": scheduler.estado(),
+        "singleflight": singleflight.estado(),
+        "http_pool": estado_http_pool(),
+        "jobs": runner.estado(),
+        "replica": replica.estado(),
+        "journal": journal.estado(),
+        "similares": similares.estado(),
+        "sugerencias": sugerencias.estado(),
+    }
+
+
+@router.get("/profile", response_class=PlainTextResponse)
+def profile(
+    segundos: float = Query(10, gt=0, le=60),
+    hz: int = Query(100, ge=1, le=1000),
+    user=Depends(require_roles("Admin")),
+):
+    """
+    Perfilado por muestreo del proceso durante `segundos` (todos los threads).
+    Devuelve stacks en formato collapsed: `flamegraph.pl` o speedscope.app.
+    """
+    out = perfilar(segundos, hz)
+    if out is None:
+        raise HTTPException(status_code=409, detail="Ya hay un perfilado en curso")
+    return PlainTextResponse(out)
@@ -0,0 +1,76 @@
+# app/routers/auditoria.py
+from fastapi import APIRouter, Depends, HTTPException, Query
+from datetime import datetime, timezone
+from typing import Literal, Optional
+
+from ..bq import fqtn, run_query
+from ..config import settings
+from ..deps import decode_cursor, encode_cursor, qparams, require_roles
+from .. import sql_auditoria as Q
+
+router = APIRouter(prefix="/auditoria", tags=["auditoria"])
+
+
+def _utc(dt: datetime) -> datetime:
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt
+
+
+@router.get("")
+@router.get("/")
+def buscar_auditoria(
+    desde: datetime,
+    hasta: datetime,
+    actor: Optional[str] = None,
+    tipo_evento: Optional[str] = None,
+    entidad: Optional[Literal["gestion", "usuario"]] = None,
+    entidad_id: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    user=Depends(require_roles("Admin", "Supervisor")),
+):
+    """
+    Eventos de gestiones_eventos y usuarios_eventos en [desde, hasta), más nuevos primero.
+    La ventana es obligatoria (y acotada) para que toda búsqueda pode por timestamp.
+    Paginado keyset: pasar `next_cursor` de la respuesta como `cursor`.
+    """
+    desde, hasta = _utc(desde), _utc(hasta)
+    if hasta <= desde:
+        raise HTTPException(status_code=400, detail="'hasta' debe ser posterior a 'desde'")
+    if (hasta - desde).days > settings.auditoria_max_dias:
+        raise HTTPException(
+            status_code=400,
+            detail=f"La ventana no puede superar {settings.auditoria_max_dias} días",
+        )
+
+    cursor_ts, cursor_id = None, None
+    if cursor:
+        cursor_ts, cursor_id = decode_cursor(cursor)
+
+    ramas = []
+    if entidad in (None, "gestion"):
+        ramas.append(Q.AUDITORIA_GESTIONES.format(eventos=fqtn("infra_gestion.gestiones_eventos")))
+    if entidad in (None, "usuario"):
+        ramas.append(Q.AUDITORIA_USUARIOS.format(usuarios_eventos=fqtn("infra_gestion.usuarios_eventos")))
+    sql = Q.BUSCAR_AUDITORIA.format(ramas="\nUNION ALL\n".join(ramas))
+
+    rows = run_query(
+        sql,
+        qparams([
+            ("desde", "TIMESTAMP", desde),
+            ("hasta", "TIMESTAMP", hasta),
+            ("cursor_ts", "TIMESTAMP", cursor_ts),
+            ("cursor_id", "STRING", cursor_id),
+            ("actor", "STRING", actor),
+            ("tipo_evento", "STRING", tipo_evento),
+            ("entidad_id", "STRING", entidad_id),
+            ("limit", "INT64", limit + 1),
+        ]),
+        user=user,
+    )
+    items = [dict(r) for r in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(last["ts"], last["id_evento"])
+
+    return {"items": items, "next_cursor": next_cursor}
@@ -1,87 +1,46 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
-from ..bq import bq_client, fqtn
-from ..deps import qparams, current_user
+from ..catalogos_cache import catalogos
+from ..deps import current_user
+from ..geo_matcher import geo_matcher
 
 router = APIRouter(prefix="/catalogos", tags=["catalogos"])
 
 
 @router.get("/estados")
 def estados(user=Depends(current_user)):
-    q = f"""
-    SELECT id, nombre, orden, activo
-    FROM `{fqtn("cat_estado")}`
-    WHERE activo = TRUE
-    ORDER BY orden, nombre
-    """
-    return [dict(r) for r in bq_client().query(q).result()]
+    return catalogos.get("estados")
 
 
 @router.get("/urgencias")
 def urgencias(user=Depends(current_user)):
-    q = f"""
-    SELECT id, nombre, orden, activo
-    FROM `{fqtn("cat_urgencia")}`
-    WHERE activo = TRUE
-    ORDER BY orden, nombre
-    """
-    return [dict(r) for r in bq_client().query(q).result()]
+    return catalogos.get("urgencias")
 
 
 @router.get("/ministerios")
 def ministerios(user=Depends(current_user)):
-    q = f"""
-    SELECT id, nombre, activo, orden
-    FROM `{fqtn("cat_ministerio_agencia")}`
-    WHERE activo = TRUE
-    ORDER BY orden, nombre
-    """
-    return [dict(r) for r in bq_client().query(q).result()]
+    return catalogos.get("ministerios")
 
 
 @router.get("/categorias")
 def categorias(user=Depends(current_user)):
-    q = f"""
-    SELECT id, nombre, activo, orden, descripcion
-    FROM `{fqtn("cat_categoria_general")}`
-    WHERE activo = TRUE
-    ORDER BY orden, nombre
-    """
-    return [dict(r) for r in bq_client().query(q).result()]
+    return catalogos.get("categorias")
 
 
 # ✅ NUEVO: Tipos de gestión
 @router.get("/tipos-gestion")
 def tipos_gestion(user=Depends(current_user)):
-    q = f"""
-    SELECT id, nombre, activo, orden, descripcion
-    FROM `{fqtn("cat_tipo_gestion")}`
-    WHERE activo = TRUE
-    ORDER BY orden, nombre
-    """
-    return [dict(r) for r in bq_client().query(q).result()]
+    return catalogos.get("tipos-gestion")
 
 
 # ✅ NUEVO: Canales de origen
 @router.get("/canales-origen")
 def canales_origen(user=Depends(current_user)):
-    q = f"""
-    SELECT id, nombre, activo, orden, descripcion
-    FROM `{fqtn("cat_canal_origen")}`
-    WHERE activo = TRUE
-    ORDER BY orden, nombre
-    """
-    return [dict(r) for r in bq_client().query(q).result()]
+    return catalogos.get("canales-origen")
 
 
 @router.get("/departamentos")
 def departamentos(user=Depends(current_user)):
-    q = f"""
-    SELECT DISTINCT departamento
-    FROM `{fqtn("geo_localidades")}`
-    WHERE departamento IS NOT NULL AND TRIM(departamento) != ''
-    ORDER BY departamento
-    """
-    return [r["departamento"] for r in bq_client().query(q).result()]
+    return catalogos.departamentos()
 
 
 @router.get("/localidades")
@@ -89,15 +48,7 @@ def localidades(
     departamento: str = Query(..., min_length=1),
     user=Depends(current_user),
 ):
-    q = f"""
-    SELECT localidad
-    FROM `{fqtn("geo_localidades")}`
-    WHERE UPPER(TRIM(departamento)) = UPPER(TRIM(@depto))
-      AND localidad IS NOT NULL AND TRIM(localidad) != ''
-    ORDER BY localidad
-    """
-    job = bq_client().query(q, job_config=qparams([("depto", "STRING", departamento)]))
-    return [r["localidad"] for r in job.result()]
+    return catalogos.localidades(departamento)
 
 
 @router.get("/geo")
@@ -106,41 +57,24 @@ def geo_lookup(
     localidad: str = Query(..., min_length=1),
     user=Depends(current_user),
 ):
-    q = f"""
-    SELECT
-      id_geo,
-      departamento,
-      localidad,
-      lat_centro AS lat,
-      lon_centro AS lon
-    FROM `{fqtn("geo_localidades")}`
-    WHERE activo = TRUE
-      AND UPPER(TRIM(departamento)) = UPPER(TRIM(@depto))
-      AND UPPER(TRIM(localidad)) = UPPER(TRIM(@loc))
-    LIMIT 1
-    """
-
-    job = bq_client().query(
-        q,
-        job_config=qparams([
-            ("depto", "STRING", departamento),
-            ("loc", "STRING", localidad),
-        ])
-    )
-
-    rows = list(job.result())
-    if not rows:
+    """Tolera acentos y errores de tipeo; si no hay un match claro devuelve 400 con sugerencias."""
+    res = geo_matcher.resolver(departamento, localidad)
+    r = res["geo"]
+    if not r:
         raise HTTPException(
             status_code=400,
-            detail="Departamento/Localidad inválidos (no existen en geo_localidades)"
+            detail={
+                "mensaje": "Departamento/Localidad inválidos (no existen en geo_localidades)",
+                "sugerencias": res["sugerencias"],
+            },
         )
 
-    r = rows[0]
     out = {
         "id_geo": r.get("id_geo"),
         "departamento": r.get("departamento"),
         "localidad": r.get("localidad"),
         "lat": float(r.get("lat")) if r.get("lat") is not None else None,
         "lon": float(r.get("lon")) if r.get("lon") is not None else None,
+        "corregido": res["corregido"],
     }
     return out
@@ -1,33 +1,50 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from uuid import uuid4
-from datetime import date, datetime
+from datetime import date, datetime, timedelta, timezone
 from decimal import Decimal
+import asyncio
 import json
+import math
 
+from google.api_core.exceptions import NotFound
 from google.cloud import bigquery
 
-from ..bq import bq_client, fqtn
-from ..deps import qparams, require_roles
-from ..models import GestionCreate, CambioEstado
+from ..bq import fqtn, run_query
+from ..catalogos_cache import catalogos
+from ..config import settings
+from ..deps import decode_cursor, encode_cursor, qparams, qstructs, require_roles
+from ..geo_matcher import geo_matcher
+from ..journal import journal
+from ..models import GestionCreate, GestionUpdate, CambioEstado
+from ..pubsub import bus
+from ..replica import replica
+from ..similares import similares
+from ..sugerencias import sugerencias
+from ..tracing import phase
 from .. import sql_gestiones as Q
 
 router = APIRouter(prefix="/gestiones", tags=["gestiones"])
 
 
-def _run(query: str, cfg: bigquery.QueryJobConfig):
-    return bq_client().query(query, job_config=cfg).result()
+def _run(query: str, cfg: bigquery.QueryJobConfig, user=None, write: bool = False, prioritario: bool = False):
+    return run_query(query, cfg, user=user, write=write, prioritario=prioritario)
 
 
-def _one(query: str, cfg: bigquery.QueryJobConfig):
-    rows = list(_run(query, cfg))
+def _one(query: str, cfg: bigquery.QueryJobConfig, user=None, prioritario: bool = False):
+    rows = _run(query, cfg, user, prioritario=prioritario)
     return dict(rows[0]) if rows else None
 
 
-def _fmt_tables(sql_text: str) -> str:
+def _fmt_tables(sql_text: str, incluir_archivo: bool = False, **extra: str) -> str:
+    if incluir_archivo:
+        sql_text = sql_text.replace("`{gestiones}`", Q.GESTIONES_CON_ARCHIVO)
     return sql_text.format(
         gestiones=fqtn("infra_gestion.gestiones"),
         eventos=fqtn("infra_gestion.gestiones_eventos"),
+        archivo=fqtn("infra_gestion.gestiones_archivo"),
         geo_localidades=fqtn("geo_localidades"),
+        **extra,
     )
 
 
@@ -43,6 +60,104 @@ def json_dumps_safe(d: dict) -> str:
     return json.dumps(d, ensure_ascii=False, default=_json_safe)
 
 
+# Columnas que devuelve LIST_GESTIONES (las que la grilla necesita para parchear filas)
+_LIST_COLS = (
+    "id_gestion", "departamento", "localidad", "estado", "urgencia",
+    "ministerio_agencia_id", "categoria_general_id", "tipo_gestion", "canal_origen",
+    "detalle", "costo_estimado", "costo_moneda", "nro_expediente", "fecha_ingreso",
+    "dias_transcurridos",
+    "ministerio_nombre", "categoria_nombre", "tipo_gestion_nombre", "canal_origen_nombre",
+)
+
+
+def _fila_lista(d: dict) -> dict:
+    return {k: d.get(k) for k in _LIST_COLS}
+
+
+def _publicar(tipo: str, id_gestion: str, gestion: dict | None = None) -> None:
+    if gestion:
+        catalogos.enriquecer([gestion])
+    bus.publicar({
+        "tipo": tipo,
+        "id_gestion": id_gestion,
+        "gestion": _fila_lista(gestion) if gestion else None,
+        "ts": datetime.utcnow().isoformat() + "Z",
+    })
+
+
+def _revertir_descartada(id_gestion: str) -> None:
+    """
+    Una escritura del journal quedó fallida: réplica, stream y similares/sugerencias
+    vuelven a lo que hay en BigQuery más lo que siga pendiente (corre en cada worker).
+    """
+    g = _one(_fmt_tables(Q.GET_GESTION), qparams([("id_gestion", "STRING", id_gestion)]))
+    g = journal.superponer(id_gestion, g)
+    if not g:
+        # era un alta que nunca llegó
+        replica.eliminar(id_gestion)
+        _publicar("eliminada", id_gestion)
+        return
+    replica.upsert(g)
+    fecha_estado = g.get("fecha_estado")
+    if fecha_estado is not None:
+        if fecha_estado.tzinfo is None:
+            fecha_estado = fecha_estado.replace(tzinfo=timezone.utc)
+        g["dias_transcurridos"] = (datetime.now(timezone.utc) - fecha_estado).days
+    _publicar("estado", id_gestion, g)
+
+
+journal.al_descartar(_revertir_descartada)
+
+
+def _filtro_stream(**filtros: str | None):
+    """
+    Mismo criterio que los filtros de LIST_GESTIONES (exactos; depto/localidad sin
+    distinguir mayúsculas), pero solo para altas. Los cambios ("estado",
+    "actualizada") y borrados pasan siempre: con los valores nuevos no se puede
+    saber si la fila estaba en la pantalla del cliente (puede justo salir del
+    filtro), y el front ignora ids que no tiene y saca los que dejan de cumplirlo.
+    """
+    activos = {k: v for k, v in filtros.items() if v}
+    insensibles = {"departamento", "localidad"}
+    cols = {"ministerio": "ministerio_agencia_id", "categoria": "categoria_general_id"}
+
+    def _match(evento: dict) -> bool:
+        g = evento.get("gestion")
+        if not g or not activos or evento.get("tipo") != "creada":
+            return True
+        for k, v in activos.items():
+            actual = g.get(cols.get(k, k))
+            if k in insensibles:
+                if str(actual or "").strip().upper() != v.strip().upper():
+                    return False
+            elif actual != v:
+                return False
+        return True
+
+    return _match
+
+
+def _filtros_params(**filtros: str | None) -> list:
+    """Parámetros de FILTROS_GESTIONES (todos STRING, vacío = sin filtro)."""
+    return [(k, "STRING", filtros.get(k)) for k in (
+        "estado", "ministerio", "categoria", "departamento", "localidad",
+        "q", "tipo_gestion", "canal_origen",
+    )]
+
+
+def _sse(evento: str, data: dict) -> str:
+    return f"event: {evento}\ndata: {json_dumps_safe(data)}\n\n"
+
+
+def _marcar_fuente(response: Response | None, fuente: str) -> None:
+    if response is None:
+        return
+    response.headers["X-Fuente"] = fuente
+    lag = replica.lag_s()
+    if lag is not None:
+        response.headers["X-Replica-Lag"] = str(lag)
+
+
 @router.get("/")
 def list_gestiones(
     estado: str | None = None,
@@ -60,78 +175,415 @@ def list_gestiones(
 
     limit: int = Query(50, ge=1, le=200),
     offset: int = Query(0, ge=0),
+    # también las terminadas que ya pasaron a gestiones_archivo
+    incluir_archivo: bool = False,
+    response: Response = None,
     user=Depends(require_roles("Admin", "Supervisor", "Operador", "Consulta")),
 ):
-    cfg_count = qparams([
-        ("estado", "STRING", estado),
-        ("ministerio", "STRING", ministerio),
-        ("categoria", "STRING", categoria),
-        ("departamento", "STRING", departamento),
-        ("localidad", "STRING", localidad),
-        ("q", "STRING", q),
-
-        ("tipo_gestion", "STRING", tipo_gestion),
-        ("canal_origen", "STRING", canal_origen),
+    filtros = _filtros_params(
+        estado=estado,
+        ministerio=ministerio,
+        categoria=categoria,
+        departamento=departamento,
+        localidad=localidad,
+        q=q,
+        tipo_gestion=tipo_gestion,
+        canal_origen=canal_origen,
+    )
+    if not incluir_archivo and replica.disponible():
+        with phase("replica"):
+            total, items = replica.listar({n: v for n, _, v in filtros}, limit, offset)
+        _marcar_fuente(response, "replica")
+        version = catalogos.enriquecer(items)
+        return {"items": items, "total": total, "limit": limit, "offset": offset, "catalogos_version": version}
+
+    _marcar_fuente(response, "bigquery")
+    cfg_list = qparams(filtros + [
+        ("limit", "INT64", limit),
+        ("offset", "INT64", offset),
     ])
-    total_row = _one(_fmt_tables(Q.COUNT_GESTIONES), cfg_count)
+    try:
+        total_row = _one(_fmt_tables(Q.COUNT_GESTIONES, incluir_archivo), qparams(filtros), user)
+        items = [dict(r) for r in _run(_fmt_tables(Q.LIST_GESTIONES, incluir_archivo), cfg_list, user)]
+    except NotFound:
+        if not incluir_archivo:
+            raise
+        # todavía no corrió ningún archivo (no existe la tabla): es lo mismo que sin archivo
+        total_row = _one(_fmt_tables(Q.COUNT_GESTIONES), qparams(filtros), user)
+        items = [dict(r) for r in _run(_fmt_tables(Q.LIST_GESTIONES), cfg_list, user)]
     total = int(total_row["total"]) if total_row and "total" in total_row else 0
+    version = catalogos.enriquecer(items)
+    return {"items": items, "total": total, "limit": limit, "offset": offset, "catalogos_version": version}
 
-    cfg_list = qparams([
-        ("estado", "STRING", estado),
-        ("ministerio", "STRING", ministerio),
-        ("categoria", "STRING", categoria),
-        ("departamento", "STRING", departamento),
-        ("localidad", "STRING", localidad),
-        ("q", "STRING", q),
-
-        ("tipo_gestion", "STRING", tipo_gestion),
-        ("canal_origen", "STRING", canal_origen),
 
+@router.get("/changes")
+def changes_gestiones(
+    since: datetime,
+    since_id: str = "",
+    estado: str | None = None,
+    ministerio: str | None = None,
+    categoria: str | None = None,
+    departamento: str | None = None,
+    localidad: str | None = None,
+    q: str | None = None,
+    tipo_gestion: str | None = None,
+    canal_origen: str | None = None,
+    limit: int = Query(500, ge=1, le=2000),
+    user=Depends(require_roles("Admin", "Supervisor", "Operador", "Consulta")),
+):
+    """
+    Delta sync: filas con updated_at > watermark (since, since_id).
+    Devuelve las vigentes en `items` y en `tombstones` los ids borrados, los que
+    dejaron de cumplir los filtros y los archivados (por archivado_at). El cliente reenvía `watermark`/`watermark_id`
+    en la próxima llamada; con `has_more` debe pedir de nuevo enseguida.
+
+    Las filas más nuevas que `changes_margen_s` se difieren a la próxima llamada:
+    updated_at lo fija la API antes de que el job termine, y sin ese margen una
+    escritura en vuelo podría quedar detrás del watermark y perderse.
+    """
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    hasta = datetime.now(timezone.utc) - timedelta(seconds=settings.changes_margen_s)
+
+    cfg = qparams(_filtros_params(
+        estado=estado,
+        ministerio=ministerio,
+        categoria=categoria,
+        departamento=departamento,
+        localidad=localidad,
+        q=q,
+        tipo_gestion=tipo_gestion,
+        canal_origen=canal_origen,
+    ) + [
+        ("since", "TIMESTAMP", since),
+        ("since_id", "STRING", since_id),
+        ("hasta", "TIMESTAMP", hasta),
         ("limit", "INT64", limit),
-        ("offset", "INT64", offset),
     ])
-    items = [dict(r) for r in _run(_fmt_tables(Q.LIST_GESTIONES), cfg_list)]
-    return {"items": items, "total": total, "limit": limit, "offset": offset}
+    try:
+        rows = [dict(r) for r in _run(_fmt_tables(Q.CHANGES_GESTIONES_CON_ARCHIVO), cfg, user)]
+    except NotFound:
+        # todavía no corrió ningún archivo (no existe la tabla)
+        rows = [dict(r) for r in _run(_fmt_tables(Q.CHANGES_GESTIONES), cfg, user)]
+
+    items, tombstones = [], []
+    for r in rows:
+        if r.pop("vigente"):
+            items.append(r)
+        else:
+            tombstones.append(r["id_gestion"])
+    version = catalogos.enriquecer(items)
+
+    last = rows[-1] if rows else None
+    return {
+        "items": items,
+        "catalogos_version": version,
+        "tombstones": tombstones,
+        "watermark": last["updated_at"] if last else since,
+        "watermark_id": last["id_gestion"] if last else since_id,
+        "has_more": len(rows) == limit,
+    }
+
+
+@router.get("/sugerencias")
+def sugerencias_gestiones(
+    prefix: str = "",
+    limit: int = Query(10, ge=1, le=50),
+    user=Depends(require_roles("Admin", "Supervisor", "Operador", "Consulta")),
+):
+    """Type-ahead del buscador desde memoria: expedientes, ids, localidades y términos del detalle."""
+    with phase("sugerencias"):
+        items = sugerencias.buscar(prefix, limit)
+    return {"items": items}
+
+
+@router.get("/pendientes")
+def pendientes_gestiones(
+    id_gestion: str | None = None,
+    incluir_fallidas: bool = True,
+    limit: int = Query(100, ge=1, le=1000),
+    user=Depends(require_roles("Admin", "Supervisor", "Operador")),
+):
+    """
+    Escrituras aceptadas con 202 (JOURNAL_ENABLED) que todavía no llegaron a
+    BigQuery, y las descartadas por error. Admin ve las de todos.
+    """
+    if not journal.activo():
+        return {"resumen": journal.estado(), "items": []}
+    usuario = None if user.get("rol") == "Admin" else (user.get("email") or user.get("usuario") or "")
+    items = journal.listar(usuario, id_gestion, incluir_fallidas, limit)
+    return {"resumen": journal.estado(), "items": items}
+
+
+def _parse_bbox(bbox: str) -> tuple[float, float, float, float]:
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(x) for x in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox inválido: se espera minLon,minLat,maxLon,maxLat")
+    if min_lon > max_lon or min_lat > max_lat:
+        raise HTTPException(status_code=400, detail="bbox inválido: mínimos mayores que máximos")
+    if not (-180 <= min_lon and max_lon <= 180 and -90 <= min_lat and max_lat <= 90):
+        # también descarta NaN (toda comparación da False)
+        raise HTTPException(status_code=400, detail="bbox inválido: lon fuera de ±180 o lat fuera de ±90")
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def _celda_mapa(zoom: int, ancho: float, alto: float) -> float:
+    """
+    Tiles de 256px: 360° / 2^zoom por tile, partido en mapa_celdas_por_tile celdas.
+    Con bboxes grandes se agranda hasta que entren como mucho mapa_max_celdas.
+    """
+    celda = 360.0 / (2 ** zoom) / settings.mapa_celdas_por_tile
+    maximo = settings.mapa_max_celdas
+    celda = max(celda, math.sqrt(ancho * alto / maximo))
+    # cota de las celdas que toca el bbox (FLOOR de cada borde)
+    while (math.ceil(ancho / celda) + 1) * (math.ceil(alto / celda) + 1) > maximo:
+        celda *= 1.25
+    return celda
+
+
+@router.get("/mapa")
+def mapa_gestiones(
+    bbox: str,
+    zoom: int = Query(..., ge=0, le=22),
+    estado: str | None = None,
+    ministerio: str | None = None,
+    categoria: str | None = None,
+    departamento: str | None = None,
+    localidad: str | None = None,
+    q: str | None = None,
+    tipo_gestion: str | None = None,
+    canal_origen: str | None = None,
+    user=Depends(require_roles("Admin", "Supervisor", "Operador", "Consulta")),
+):
+    """
+    GeoJSON para el mapa. bbox = minLon,minLat,maxLon,maxLat (WGS84).
+    Hasta `mapa_zoom_puntos` devuelve clusters por celda de grilla (cantidad y
+    estado/urgencia dominantes, calculados en BigQuery); desde ese zoom, puntos.
+    Los clusters van como mucho `mapa_max_celdas` (la celda crece con bboxes
+    grandes); `truncado` indica si igual se cortó.
+    """
+    min_lon, min_lat, max_lon, max_lat = _parse_bbox(bbox)
+    filtros = _filtros_params(
+        estado=estado,
+        ministerio=ministerio,
+        categoria=categoria,
+        departamento=departamento,
+        localidad=localidad,
+        q=q,
+        tipo_gestion=tipo_gestion,
+        canal_origen=canal_origen,
+    ) + [
+        ("min_lat", "FLOAT64", min_lat),
+        ("max_lat", "FLOAT64", max_lat),
+        ("min_lon", "FLOAT64", min_lon),
+        ("max_lon", "FLOAT64", max_lon),
+    ]
+
+    if zoom >= settings.mapa_zoom_puntos:
+        cfg = qparams(filtros + [("limit", "INT64", settings.mapa_max_puntos)])
+        rows = _run(_fmt_tables(Q.MAPA_PUNTOS), cfg, user)
+        features = [{
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [r["lon"], r["lat"]]},
+            "properties": {
+                "cluster": False,
+                "id_gestion": r["id_gestion"],
+                "estado": r["estado"],
+                "urgencia": r["urgencia"],
+                "departamento": r["departamento"],
+                "localidad": r["localidad"],
+                "detalle": r["detalle"],
+            },
+        } for r in rows]
+        return {
+            "type": "FeatureCollection",
+            "features": features,
+            "modo": "puntos",
+            "truncado": len(features) >= settings.mapa_max_puntos,
+        }
+
+    celda = _celda_mapa(zoom, max_lon - min_lon, max_lat - min_lat)
+    cfg = qparams(filtros + [("celda", "FLOAT64", celda), ("limit", "INT64", settings.mapa_max_celdas)])
+    rows = _run(_fmt_tables(Q.MAPA_CLUSTERS), cfg, user)
+    features = [{
+        "type": "Feature",
+        "geometry": {"type": "Point", "coordinates": [r["lon"], r["lat"]]},
+        "properties": {
+            "cluster": True,
+            "celda": [r["cx"], r["cy"]],
+            "cantidad": r["cantidad"],
+            "estado_dominante": r["estado_dominante"],
+            "urgencia_dominante": r["urgencia_dominante"],
+        },
+    } for r in rows]
+    return {
+        "type": "FeatureCollection",
+        "features": features,
+        "modo": "clusters",
+        "celda_grados": celda,
+        "truncado": len(features) >= settings.mapa_max_celdas,
+    }
+
+
+@router.get("/stream")
+async def stream_gestiones(
+    request: Request,
+    estado: str | None = None,
+    ministerio: str | None = None,
+    categoria: str | None = None,
+    departamento: str | None = None,
+    localidad: str | None = None,
+    tipo_gestion: str | None = None,
+    canal_origen: str | None = None,
+    user=Depends(require_roles("Admin", "Supervisor", "Operador", "Consulta")),
+):
+    """
+    Server-Sent Events con altas, cambios de estado y borrados.
+    Eventos: `creada`, `estado`, `eliminada`; `resync` si la conexión se atrasó
+    (el cliente debe recargar la página). Heartbeat como comentario SSE.
+    """
+    sub = bus.suscribir(_filtro_stream(
+        estado=estado,
+        ministerio=ministerio,
+        categoria=categoria,
+        departamento=departamento,
+        localidad=localidad,
+        tipo_gestion=tipo_gestion,
+        canal_origen=canal_origen,
+    ))
+
+    async def _gen():
+        try:
+            yield "retry: 5000\n\n"
+            while not await request.is_disconnected():
+                if sub.desbordada:
+                    yield _sse("resync", {})
+                    return
+                try:
+                    ev = await asyncio.wait_for(sub.queue.get(), timeout=settings.sse_heartbeat_s)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield _sse(ev["tipo"], ev)
+        finally:
+            bus.desuscribir(sub)
+
+    return StreamingResponse(
+        _gen(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.get("/{id_gestion}")
 def get_gestion(
     id_gestion: str,
+    response: Response,
+    incluir_archivo: bool = False,
     user=Depends(require_roles("Admin", "Supervisor", "Operador", "Consulta")),
 ):
-    cfg = qparams([("id_gestion", "STRING", id_gestion)])
-    g = _one(_fmt_tables(Q.GET_GESTION), cfg)
+    # en la réplica puede faltar una alta de otro worker todavía no replicada: ahí va a BigQuery
+    g = None
+    if replica.disponible():
+        with phase("replica"):
+            g = replica.obtener(id_gestion)
+    if g:
+        _marcar_fuente(response, "replica")
+    else:
+        _marcar_fuente(response, "bigquery")
+        cfg = qparams([("id_gestion", "STRING", id_gestion)])
+        g = _one(_fmt_tables(Q.GET_GESTION), cfg, user)
+    if not g and incluir_archivo:
+        try:
+            g = _one(_fmt_tables(Q.GET_GESTION, incluir_archivo=True), cfg, user)
+        except NotFound:
+            g = None
+    g = journal.superponer(id_gestion, g)
     if not g:
         raise HTTPException(status_code=404, detail="Gestión no encontrada")
+    g["catalogos_version"] = catalogos.enriquecer([g])
     return g
 
 
+@router.get("/{id_gestion}/similares")
+def similares_gestion(
+    id_gestion: str,
+    limit: int = Query(10, ge=1, le=50),
+    umbral: float | None = Query(None, ge=0, le=1),
+    user=Depends(require_roles("Admin", "Supervisor", "Operador", "Consulta")),
+):
+    """Posibles duplicados: misma localidad y detalle parecido (Jaccard de trigramas)."""
+    g = similares.resumen(id_gestion)
+    if g is None:
+        cfg = qparams([("id_gestion", "STRING", id_gestion)])
+        g = _one(_fmt_tables(Q.GET_GESTION), cfg, user)
+    if not g:
+        raise HTTPException(status_code=404, detail="Gestión no encontrada")
+    with phase("similares"):
+        items = similares.buscar(
+            g.get("departamento"), g.get("localidad"), g.get("detalle"),
+            excluir=id_gestion, limit=limit, umbral=umbral,
+        )
+    return {"items": items, "umbral": settings.similares_umbral if umbral is None else umbral}
+
+
 @router.get("/{id_gestion}/eventos")
 def list_eventos(
     id_gestion: str,
+    cursor: str | None = None,
+    limit: int = Query(100, ge=1, le=500),
     user=Depends(require_roles("Admin", "Supervisor", "Operador", "Consulta")),
 ):
-    cfg = qparams([("id_gestion", "STRING", id_gestion)])
-    return [dict(r) for r in _run(_fmt_tables(Q.LIST_EVENTOS), cfg)]
+    """Timeline de la gestión, más nuevos primero; paginado keyset con `next_cursor`."""
+    cursor_ts, cursor_id = None, None
+    if cursor:
+        cursor_ts, cursor_id = decode_cursor(cursor)
+
+    cfg = qparams([
+        ("id_gestion", "STRING", id_gestion),
+        ("cursor_ts", "TIMESTAMP", cursor_ts),
+        ("cursor_id", "STRING", cursor_id),
+        ("limit", "INT64", limit + 1),
+    ])
+    rows = [dict(r) for r in _run(_fmt_tables(Q.LIST_EVENTOS), cfg, user)]
+    items = rows[:limit]
+    next_cursor = encode_cursor(items[-1]["fecha_evento"], items[-1]["id_evento"]) if len(rows) > limit else None
+    return {"items": items, "next_cursor": next_cursor}
 
 
 @router.post("", status_code=201)
 @router.post("/", status_code=201)
 def create_gestion(
     payload: GestionCreate,
+    response: Response,
     user=Depends(require_roles("Admin", "Supervisor", "Operador")),
 ):
-    # geo lookup
-    cfg_geo = qparams([
-        ("departamento", "STRING", payload.departamento),
-        ("localidad", "STRING", payload.localidad),
-    ])
-    geo = _one(_fmt_tables(Q.GET_GEO), cfg_geo)
+    # geo lookup: desde memoria, tolerando acentos y errores de tipeo. Sin match
+    # ni sugerencias va a BigQuery (el cache pudo quedar viejo); con sugerencias, 400.
+    res_geo = geo_matcher.resolver(payload.departamento, payload.localidad)
+    geo = res_geo["geo"]
+    if not geo and not res_geo["sugerencias"]:
+        cfg_geo = qparams([
+            ("departamento", "STRING", payload.departamento),
+            ("localidad", "STRING", payload.localidad),
+        ])
+        geo = _one(_fmt_tables(Q.GET_GEO), cfg_geo, user, prioritario=True)
     if not geo:
         raise HTTPException(
             status_code=400,
-            detail="Departamento/Localidad inválidos (no existen en geo_localidades)"
+            detail={
+                "mensaje": "Departamento/Localidad inválidos (no existen en geo_localidades)",
+                "sugerencias": res_geo["sugerencias"],
+            },
         )
+    # se guardan los nombres oficiales (corrige acentos / tipeo)
+    departamento = geo.get("departamento") or payload.departamento
+    localidad = geo.get("localidad") or payload.localidad
+
+    # antes del insert: así la gestión nueva no se encuentra a sí misma
+    with phase("similares"):
+        posibles_duplicados = similares.buscar(departamento, localidad, payload.detalle)
 
     now_dt = datetime.utcnow()
     today = date.today()
@@ -146,7 +598,7 @@ def create_gestion(
     lat_num = None if lat_val is None else str(lat_val)
     lon_num = None if lon_val is None else str(lon_val)
 
-    cfg_ins = qparams([
+    params_ins = [
         ("id_gestion", "STRING", new_id),
         ("nro_expediente", "STRING", getattr(payload, "nro_expediente", None)),
         ("origen", "STRING", "APP"),
@@ -171,8 +623,8 @@ def create_gestion(
         ("observaciones", "STRING", payload.observaciones),
 
         ("geo_id", "STRING", geo.get("id_geo")),
-        ("departamento", "STRING", payload.departamento),
-        ("localidad", "STRING", payload.localidad),
+        ("departamento", "STRING", departamento),
+        ("localidad", "STRING", localidad),
         ("direccion", "STRING", payload.direccion),
 
         ("lat", "NUMERIC", lat_num),
@@ -189,8 +641,7 @@ def create_gestion(
         # ✅ NUEVOS
         ("tipo_gestion", "STRING", getattr(payload, "tipo_gestion", None)),
         ("canal_origen", "STRING", getattr(payload, "canal_origen", None)),
-    ])
-    _run(_fmt_tables(Q.INSERT_GESTION), cfg_ins)
+    ]
 
     meta = {
         "ministerio_agencia_id": payload.ministerio_agencia_id,
@@ -200,8 +651,8 @@ def create_gestion(
         "costo_estimado": getattr(payload, "costo_estimado", None),
         "costo_moneda": getattr(payload, "costo_moneda", None),
         "nro_expediente": getattr(payload, "nro_expediente", None),
-        "departamento": payload.departamento,
-        "localidad": payload.localidad,
+        "departamento": departamento,
+        "localidad": localidad,
         "geo_id": geo.get("id_geo"),
 
         # ✅ NUEVOS
@@ -209,7 +660,7 @@ def create_gestion(
         "canal_origen": getattr(payload, "canal_origen", None),
     }
 
-    cfg_ev = qparams([
+    params_ev = [
         ("id_evento", "STRING", str(uuid4())),
         ("id_gestion", "STRING", new_id),
         ("fecha_evento", "TIMESTAMP", now_dt),
@@ -223,20 +674,58 @@ def create_gestion(
         ("valor_nuevo", "STRING", None),
         ("comentario", "STRING", None),
         ("metadata_json", "STRING", json_dumps_safe(meta)),
-    ])
-    _run(_fmt_tables(Q.INSERT_EVENTO), cfg_ev)
+    ]
+
+    # con journal: queda en disco y el committer lo aplica; 202 sin esperar a BigQuery
+    seq = None
+    if journal.activo():
+        seq = journal.encolar("alta", new_id, actor, params_ins, params_ev)
+        response.status_code = 202
+    else:
+        _run(_fmt_tables(Q.INSERT_GESTION), qparams(params_ins), user, write=True)
+        _run(_fmt_tables(Q.INSERT_EVENTO), qparams(params_ev), user, write=True)
+    replica.upsert({n: v for n, _, v in params_ins})
+
+    _publicar("creada", new_id, {
+        "id_gestion": new_id,
+        "departamento": departamento,
+        "localidad": localidad,
+        "estado": "INGRESADO",
+        "urgencia": payload.urgencia or "Media",
+        "ministerio_agencia_id": payload.ministerio_agencia_id,
+        "categoria_general_id": payload.categoria_general_id,
+        "tipo_gestion": getattr(payload, "tipo_gestion", None),
+        "canal_origen": getattr(payload, "canal_origen", None),
+        "detalle": payload.detalle,
+        "costo_estimado": getattr(payload, "costo_estimado", None),
+        "costo_moneda": getattr(payload, "costo_moneda", None),
+        "nro_expediente": getattr(payload, "nro_expediente", None),
+        "fecha_ingreso": today,
+        "dias_transcurridos": 0,
+    })
 
-    return {"id_gestion": new_id}
+    out = {"id_gestion": new_id, "posibles_duplicados": posibles_duplicados}
+    if seq is not None:
+        out.update(pendiente=True, seq=seq)
+    return out
 
 
 @router.post("/{id_gestion}/cambiar-estado")
 def cambiar_estado(
     id_gestion: str,
     payload: CambioEstado,
+    response: Response,
     user=Depends(require_roles("Admin", "Supervisor", "Operador")),
 ):
-    cfg_get = qparams([("id_gestion", "STRING", id_gestion)])
-    g = _one(_fmt_tables(Q.GET_GESTION), cfg_get)
+    g = None
+    if journal.activo() and replica.disponible():
+        # con journal no se espera a BigQuery: réplica al día (estado_anterior del evento
+        # sale de acá) + lo pendiente; atrasada o sin sembrar, GET_GESTION
+        g = replica.obtener(id_gestion)
+    if not g:
+        cfg_get = qparams([("id_gestion", "STRING", id_gestion)])
+        g = _one(_fmt_tables(Q.GET_GESTION), cfg_get, user, prioritario=True)
+    g = journal.superponer(id_gestion, g)
     if not g:
         raise HTTPException(status_code=404, detail="Gestión no encontrada")
 
@@ -245,22 +734,21 @@ def cambiar_estado(
     actor = user.get("email") or user.get("usuario") or ""
     rol = user.get("rol")
 
-    cfg_upd = qparams([
+    params_upd = [
         ("id_gestion", "STRING", id_gestion),
         ("nuevo_estado", "STRING", payload.nuevo_estado),
         ("fecha_estado", "TIMESTAMP", now_dt),
         ("derivado_a_id", "STRING", getattr(payload, "derivado_a", None)),
         ("updated_at", "TIMESTAMP", now_dt),
         ("updated_by", "STRING", actor),
-    ])
-    _run(_fmt_tables(Q.UPDATE_ESTADO_GESTION), cfg_upd)
+    ]
 
     meta = {
         "derivado_a": getattr(payload, "derivado_a", None),
         "acciones_implementadas": getattr(payload, "acciones_implementadas", None),
     }
 
-    cfg_ev = qparams([
+    params_ev = [
         ("id_evento", "STRING", str(uuid4())),
         ("id_gestion", "STRING", id_gestion),
         ("fecha_evento", "TIMESTAMP", now_dt),
@@ -274,10 +762,170 @@ def cambiar_estado(
         ("valor_nuevo", "STRING", None),
         ("comentario", "STRING", payload.comentario),
         ("metadata_json", "STRING", json_dumps_safe(meta)),
-    ])
-    _run(_fmt_tables(Q.INSERT_EVENTO), cfg_ev)
+    ]
+
+    seq = None
+    if journal.activo():
+        seq = journal.encolar("estado", id_gestion, actor, params_upd, params_ev)
+        response.status_code = 202
+    else:
+        _run(_fmt_tables(Q.UPDATE_ESTADO_GESTION), qparams(params_upd), user, write=True)
+        _run(_fmt_tables(Q.INSERT_EVENTO), qparams(params_ev), user, write=True)
+    replica.actualizar(id_gestion, {
+        "estado": payload.nuevo_estado,
+        "fecha_estado": now_dt,
+        "derivado_a_id": getattr(payload, "derivado_a", None),
+        "updated_at": now_dt,
+        "updated_by": actor,
+    })
+
+    _publicar("estado", id_gestion, {**g, "estado": payload.nuevo_estado, "dias_transcurridos": 0})
+
+    out = {"ok": True, "id_gestion": id_gestion, "estado": payload.nuevo_estado}
+    if seq is not None:
+        out.update(pendiente=True, seq=seq)
+    return out
+
+
+# Columnas que puede tocar PATCH (tipo BigQuery). geo_id/lat/lon no vienen del
+# cliente: se derivan de departamento/localidad.
+_EDITABLES = {
+    "ministerio_agencia_id": "STRING",
+    "categoria_general_id": "STRING",
+    "detalle": "STRING",
+    "observaciones": "STRING",
+    "urgencia": "STRING",
+    "direccion": "STRING",
+    "departamento": "STRING",
+    "localidad": "STRING",
+    "tipo_gestion": "STRING",
+    "canal_origen": "STRING",
+    "geo_id": "STRING",
+    "lat": "NUMERIC",
+    "lon": "NUMERIC",
+}
+_NO_VACIOS = ("ministerio_agencia_id", "categoria_general_id", "detalle", "departamento", "localidad")
+
+
+def _sin_pendientes(id_gestion: str) -> None:
+    """
+    PATCH y DELETE escriben directo: con un alta o cambio de estado de la misma
+    gestión todavía en el journal, el committer la aplicaría después y pisaría esto.
+    """
+    if journal.tiene_pendientes(id_gestion):
+        raise HTTPException(
+            status_code=409,
+            detail="La gestión tiene escrituras pendientes de confirmar; reintentá en unos segundos",
+        )
+
 
-    return {"ok": True, "id_gestion": id_gestion, "estado": payload.nuevo_estado}
+def _valor_evento(v) -> str | None:
+    """Valor como texto para comparar y para valor_anterior/valor_nuevo (NUMERIC sin ceros de más)."""
+    if v is None:
+        return None
+    if isinstance(v, (Decimal, float, int)) and not isinstance(v, bool):
+        return format(Decimal(str(v)).normalize(), "f")
+    return str(v)
+
+
+@router.patch("/{id_gestion}")
+def update_gestion(
+    id_gestion: str,
+    payload: GestionUpdate,
+    user=Depends(require_roles("Admin", "Supervisor", "Operador")),
+):
+    """
+    Edición parcial: solo los campos enviados. Se comparan contra la fila actual y,
+    si algo cambió, un único job actualiza esas columnas e inserta un evento EDICION
+    por campo. Sin cambios no hay escritura.
+    """
+    datos = payload.model_dump(exclude_unset=True)
+    _sin_pendientes(id_gestion)
+    for campo in _NO_VACIOS:
+        if campo in datos and not (datos[campo] or "").strip():
+            raise HTTPException(status_code=422, detail=f"{campo} no puede quedar vacío")
+
+    cfg_get = qparams([("id_gestion", "STRING", id_gestion)])
+    g = _one(_fmt_tables(Q.GET_GESTION), cfg_get, user, prioritario=True)
+    if not g:
+        raise HTTPException(status_code=404, detail="Gestión no encontrada")
+
+    if "departamento" in datos or "localidad" in datos:
+        res_geo = geo_matcher.resolver(
+            datos.get("departamento", g.get("departamento")),
+            datos.get("localidad", g.get("localidad")),
+        )
+        geo = res_geo["geo"]
+        if not geo:
+            raise HTTPException(
+                status_code=400,
+                detail={
+                    "mensaje": "Departamento/Localidad inválidos (no existen en geo_localidades)",
+                    "sugerencias": res_geo["sugerencias"],
+                },
+            )
+        datos.update(
+            departamento=geo.get("departamento"),
+            localidad=geo.get("localidad"),
+            geo_id=geo.get("id_geo"),
+            lat=geo.get("lat"),
+            lon=geo.get("lon"),
+        )
+
+    cambios = [
+        (campo, g.get(campo), valor) for campo, valor in datos.items()
+        if _valor_evento(g.get(campo)) != _valor_evento(valor)
+    ]
+    if not cambios:
+        return {"ok": True, "id_gestion": id_gestion, "cambios": []}
+
+    now_dt = datetime.utcnow()
+    actor = user.get("email") or user.get("usuario") or ""
+
+    campos_sql = ",\n  ".join(f"{campo} = @v_{campo}" for campo, _, _ in cambios)
+    cfg_upd = qparams(
+        [
+            (f"v_{campo}", _EDITABLES[campo], _valor_evento(valor) if _EDITABLES[campo] == "NUMERIC" else valor)
+            for campo, _, valor in cambios
+        ] + [
+            ("id_gestion", "STRING", id_gestion),
+            ("updated_at", "TIMESTAMP", now_dt),
+            ("updated_by", "STRING", actor),
+            ("updated_at_leido", "TIMESTAMP", g.get("updated_at")),
+            ("usuario", "STRING", actor),
+            ("rol_usuario", "STRING", user.get("rol")),
+            ("metadata_json", "STRING", json_dumps_safe({"campos": [c for c, _, _ in cambios]})),
+        ],
+        arrays=[qstructs(
+            "cambios",
+            [("campo", "STRING"), ("valor_anterior", "STRING"), ("valor_nuevo", "STRING")],
+            [
+                {"campo": c, "valor_anterior": _valor_evento(a), "valor_nuevo": _valor_evento(n)}
+                for c, a, n in cambios
+            ],
+        )],
+    )
+    rows = _run(_fmt_tables(Q.UPDATE_GESTION, campos=campos_sql), cfg_upd, user, write=True)
+    if not rows or not rows[0]["afectados"]:
+        raise HTTPException(
+            status_code=409,
+            detail="La gestión cambió o fue eliminada mientras se editaba; recargá y volvé a intentar",
+        )
+
+    nuevos = {campo: valor for campo, _, valor in cambios}
+    replica.actualizar(id_gestion, {**nuevos, "updated_at": now_dt, "updated_by": actor})
+    fecha_estado = g.get("fecha_estado")
+    dias = (datetime.now(timezone.utc) - fecha_estado).days if fecha_estado else None
+    _publicar("actualizada", id_gestion, {**g, **nuevos, "dias_transcurridos": dias})
+
+    return {
+        "ok": True,
+        "id_gestion": id_gestion,
+        "cambios": [
+            {"campo": c, "valor_anterior": _valor_evento(a), "valor_nuevo": _valor_evento(n)}
+            for c, a, n in cambios
+        ],
+    }
 
 
 @router.delete("/{id_gestion}")
@@ -285,6 +933,7 @@ def delete_gestion(
     id_gestion: str,
     user=Depends(require_roles("Admin", "Supervisor")),
 ):
+    _sin_pendientes(id_gestion)
     now_dt = datetime.utcnow()
     actor = user.get("email") or user.get("usuario") or ""
     rol = user.get("rol")
@@ -294,7 +943,8 @@ def delete_gestion(
         ("updated_at", "TIMESTAMP", now_dt),
         ("updated_by", "STRING", actor),
     ])
-    _run(_fmt_tables(Q.DELETE_GESTION), cfg_del)
+    _run(_fmt_tables(Q.DELETE_GESTION), cfg_del, user, write=True)
+    replica.eliminar(id_gestion)
 
     cfg_ev = qparams([
         ("id_evento", "STRING", str(uuid4())),
@@ -311,6 +961,8 @@ def delete_gestion(
         ("comentario", "STRING", "Borrado lógico desde UI"),
         ("metadata_json", "STRING", json_dumps_safe({})),
     ])
-    _run(_fmt_tables(Q.INSERT_EVENTO), cfg_ev)
+    _run(_fmt_tables(Q.INSERT_EVENTO), cfg_ev, user, write=True)
+
+    _publicar("eliminada", id_gestion)
 
     return {"ok": True}
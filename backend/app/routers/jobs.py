@@ -0,0 +1,192 @@
+# app/routers/jobs.py
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
+from pydantic import BaseModel, Field, ValidationError
+from datetime import date
+from typing import Any, Dict, Optional
+import csv
+import json
+
+from ..archivo import archivar_gestiones
+from ..auditor_consistencia import auditar
+from ..bq import fqtn, run_query
+from ..catalogos_cache import catalogos
+from ..deps import current_user, qparams
+from ..jobs import Contexto, runner
+from .. import sql_gestiones as QG
+from .reportes import refrescar_tiempos_estado
+from .usuarios import _parse_bulk, aplicar_bulk, validar_bulk
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+
+class ExportGestionesParams(BaseModel):
+    estado: Optional[str] = None
+    ministerio: Optional[str] = None
+    categoria: Optional[str] = None
+    departamento: Optional[str] = None
+    localidad: Optional[str] = None
+    q: Optional[str] = None
+    tipo_gestion: Optional[str] = None
+    canal_origen: Optional[str] = None
+
+
+class TiemposEstadoParams(BaseModel):
+    desde: Optional[date] = None
+
+
+class ArchivarGestionesParams(BaseModel):
+    dias: Optional[int] = Field(None, ge=1)
+
+
+class ConsistenciaParams(BaseModel):
+    rangos: Optional[int] = Field(None, ge=1, le=1024)
+
+
+_EXPORT_COLS = (
+    "id_gestion", "departamento", "localidad", "estado", "urgencia",
+    "ministerio_agencia_id", "ministerio_nombre", "categoria_general_id", "categoria_nombre",
+    "tipo_gestion", "tipo_gestion_nombre", "canal_origen", "canal_origen_nombre",
+    "detalle", "costo_estimado", "costo_moneda", "nro_expediente", "fecha_ingreso",
+    "dias_transcurridos",
+)
+
+
+# -------------------------
+# handlers
+# -------------------------
+def _export_gestiones(ctx: Contexto, params: Dict[str, Any]) -> Dict[str, Any]:
+    ctx.progreso(0, mensaje="consultando")
+    filtros = [(k, "STRING", v) for k, v in params.items()]
+    rows = run_query(
+        QG.EXPORT_GESTIONES.format(gestiones=fqtn("infra_gestion.gestiones")),
+        qparams(filtros),
+        user=ctx.user,
+    )
+    ctx.verificar()
+
+    total = len(rows)
+    ruta = ctx.archivo("gestiones.csv", "text/csv")
+    with ruta.open("w", newline="", encoding="utf-8-sig") as f:
+        w = csv.writer(f)
+        w.writerow(_EXPORT_COLS)
+        for i in range(0, total, 1000):
+            lote = [dict(r) for r in rows[i:i + 1000]]
+            catalogos.enriquecer(lote)
+            w.writerows([[r.get(c) for c in _EXPORT_COLS] for r in lote])
+            ctx.progreso(min(i + 1000, total), total, "escribiendo")
+            ctx.verificar()
+    return {"filas": total}
+
+
+def _usuarios_bulk(ctx: Contexto, params: Dict[str, Any]) -> Dict[str, Any]:
+    ctx.progreso(0, len(params["usuarios"]), "aplicando")
+    res = aplicar_bulk(params["usuarios"], ctx.user)
+    ctx.progreso(len(params["usuarios"]), len(params["usuarios"]))
+    return res
+
+
+def _tiempos_estado_refresh(ctx: Contexto, params: Dict[str, Any]) -> Dict[str, Any]:
+    ctx.progreso(0, mensaje="recalculando")
+    return refrescar_tiempos_estado(ctx.user, params.get("desde"))
+
+
+def _archivar_gestiones(ctx: Contexto, params: Dict[str, Any]) -> Dict[str, Any]:
+    ctx.progreso(0, mensaje="archivando")
+    return archivar_gestiones(ctx.user, params.get("dias"))
+
+
+def _consistencia(ctx: Contexto, params: Dict[str, Any]) -> Dict[str, Any]:
+    ctx.progreso(0, mensaje="leyendo")
+    reporte = auditar(
+        params.get("rangos"),
+        progreso=lambda hechos, total: ctx.progreso(hechos, total, "comparando"),
+        verificar=ctx.verificar,
+    )
+    with ctx.archivo("consistencia.json", "application/json").open("w", encoding="utf-8") as f:
+        json.dump(reporte, f, ensure_ascii=False, indent=2)
+    return reporte["resumen"]
+
+
+runner.registrar("export_gestiones", _export_gestiones)
+runner.registrar("usuarios_bulk", _usuarios_bulk)
+runner.registrar("tiempos_estado_refresh", _tiempos_estado_refresh)
+runner.registrar("archivar_gestiones", _archivar_gestiones)
+runner.registrar("consistencia", _consistencia)
+
+_ROLES = {
+    "export_gestiones": ("Admin", "Supervisor", "Operador", "Consulta"),
+    "usuarios_bulk": ("Admin",),
+    "tiempos_estado_refresh": ("Admin",),
+    "archivar_gestiones": ("Admin",),
+    "consistencia": ("Admin",),
+}
+
+_MODELOS = {
+    "export_gestiones": ExportGestionesParams,
+    "tiempos_estado_refresh": TiemposEstadoParams,
+    "archivar_gestiones": ArchivarGestionesParams,
+    "consistencia": ConsistenciaParams,
+}
+
+
+async def _params(tipo: str, request: Request) -> Dict[str, Any]:
+    """Valida los parámetros al encolar: los errores vuelven en el mismo request."""
+    raw = await request.body()
+    if tipo == "usuarios_bulk":
+        return {"usuarios": validar_bulk(_parse_bulk(raw, request.headers.get("content-type", "")))}
+
+    try:
+        data = json.loads(raw) if raw.strip() else {}
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body inválido: se espera JSON")
+    try:
+        return _MODELOS[tipo].model_validate(data).model_dump()
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+
+
+# -------------------------
+# endpoints
+# -------------------------
+@router.get("")
+@router.get("/")
+def list_jobs(todos: bool = False, user=Depends(current_user)):
+    """Jobs del usuario, más nuevos primero. Admin con `todos=true` ve los de todos."""
+    return {"items": runner.listar(user, todos)}
+
+
+@router.post("/{tipo}", status_code=202)
+async def submit_job(tipo: str, request: Request, user=Depends(current_user)):
+    """
+    Encola un job. Body según tipo:
+    - export_gestiones: JSON con los filtros de la grilla -> CSV descargable.
+    - usuarios_bulk: igual que POST /usuarios/bulk (JSON o CSV).
+    - tiempos_estado_refresh: JSON {"desde": "YYYY-MM-DD"} opcional.
+    - archivar_gestiones: JSON {"dias": N} opcional (default ARCHIVO_DIAS).
+    - consistencia: JSON {"rangos": N} opcional; el detalle se descarga como JSON.
+    """
+    if tipo not in _ROLES:
+        raise HTTPException(status_code=404, detail=f"Tipo de job desconocido: {tipo}")
+    if user.get("rol") not in _ROLES[tipo]:
+        raise HTTPException(status_code=403, detail="Sin permiso")
+    params = await _params(tipo, request)
+    # enviar escribe el estado a disco: fuera del event loop
+    return await run_in_threadpool(runner.enviar, tipo, params, user)
+
+
+@router.get("/{id_job}")
+def get_job(id_job: str, user=Depends(current_user)):
+    return runner.obtener(id_job, user)
+
+
+@router.get("/{id_job}/resultado")
+def download_job(id_job: str, user=Depends(current_user)):
+    ruta, media_type = runner.archivo_resultado(id_job, user)
+    return FileResponse(ruta, media_type=media_type, filename=ruta.name)
+
+
+@router.post("/{id_job}/cancelar")
+def cancel_job(id_job: str, user=Depends(current_user)):
+    return runner.cancelar(id_job, user)
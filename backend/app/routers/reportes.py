@@ -0,0 +1,109 @@
+# app/routers/reportes.py
+from fastapi import APIRouter, Depends, HTTPException, Query
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from google.api_core.exceptions import NotFound
+
+from ..bq import fqtn, run_query
+from ..config import settings
+from ..deps import qparams, require_roles
+from .. import sql_gestiones as QG
+from .. import sql_reportes as Q
+
+router = APIRouter(prefix="/reportes", tags=["reportes"])
+
+
+def _fmt_tables(sql_text: str) -> str:
+    return sql_text.format(
+        gestiones=fqtn("infra_gestion.gestiones"),
+        eventos=fqtn("infra_gestion.gestiones_eventos"),
+        tiempos=fqtn("infra_gestion.gestiones_tiempos_estado"),
+        archivo=fqtn("infra_gestion.gestiones_archivo"),
+    )
+
+
+def _utc(dt: datetime) -> datetime:
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt
+
+
+def refrescar_tiempos_estado(user: Optional[Dict[str, Any]] = None, desde: Optional[date] = None) -> Dict[str, Any]:
+    """
+    Materializa gestiones_tiempos_estado de forma incremental (un solo job).
+    Sin `desde`, recalcula solo desde la última partición materializada.
+    Ministerio/departamento salen también del archivo: las transiciones de una
+    gestión ya archivada no quedan sin dimensiones al recalcular.
+    """
+    sql_text = Q.REFRESH_TIEMPOS_ESTADO.replace("`{gestiones}`", QG.GESTIONES_CON_ARCHIVO)
+    try:
+        run_query(_fmt_tables("SELECT 1 FROM `{archivo}` LIMIT 0"), user=user)
+    except NotFound:
+        # todavía no corrió ningún archivo: solo la tabla caliente
+        sql_text = Q.REFRESH_TIEMPOS_ESTADO
+    rows = run_query(
+        _fmt_tables(sql_text),
+        qparams([("desde", "DATE", desde)]),
+        user=user,
+        write=True,
+    )
+    r = rows[0] if rows else {}
+    return {"desde": r.get("desde"), "filas": int(r.get("filas") or 0)}
+
+
+@router.get("/tiempos-estado")
+def tiempos_estado(
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    ministerio: Optional[str] = None,
+    departamento: Optional[str] = None,
+    por_ministerio: bool = False,
+    por_departamento: bool = False,
+    user=Depends(require_roles("Admin", "Supervisor")),
+):
+    """
+    Duración (días) de cada transición de estado: cantidad, promedio, p50, p90 y máximo.
+    Ventana por fecha de salida del estado (default: últimos 90 días).
+    `por_ministerio` / `por_departamento` desagregan por esa dimensión.
+    Lee la tabla materializada; se actualiza con POST /reportes/tiempos-estado/refresh.
+    """
+    hasta = _utc(hasta) if hasta else datetime.now(timezone.utc)
+    desde = _utc(desde) if desde else hasta - timedelta(days=90)
+    if hasta <= desde:
+        raise HTTPException(status_code=400, detail="'hasta' debe ser posterior a 'desde'")
+    if (hasta - desde).days > settings.reportes_max_dias:
+        raise HTTPException(
+            status_code=400,
+            detail=f"La ventana no puede superar {settings.reportes_max_dias} días",
+        )
+
+    cfg = qparams([
+        ("desde", "TIMESTAMP", desde),
+        ("hasta", "TIMESTAMP", hasta),
+        ("ministerio", "STRING", ministerio),
+        ("departamento", "STRING", departamento),
+        ("por_ministerio", "BOOL", por_ministerio),
+        ("por_departamento", "BOOL", por_departamento),
+    ])
+    try:
+        items = [dict(r) for r in run_query(_fmt_tables(Q.TIEMPOS_ESTADO), cfg, user=user)]
+        ultimo = run_query(_fmt_tables(Q.ULTIMO_CALCULO_TIEMPOS), user=user)
+    except NotFound:
+        raise HTTPException(
+            status_code=409,
+            detail="Reporte no materializado todavía: correr POST /reportes/tiempos-estado/refresh",
+        )
+
+    return {
+        "items": items,
+        "desde": desde,
+        "hasta": hasta,
+        "calculado_at": ultimo[0]["calculado_at"] if ultimo else None,
+    }
+
+
+@router.post("/tiempos-estado/refresh")
+def refresh_tiempos_estado(
+    desde: Optional[date] = Query(None, description="Forzar recálculo desde esta fecha"),
+    user=Depends(require_roles("Admin")),
+):
+    return {"ok": True, **refrescar_tiempos_estado(user, desde)}
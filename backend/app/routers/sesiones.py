@@ -0,0 +1,45 @@
+# app/routers/sesiones.py
+import time
+
+from fastapi import APIRouter, Depends
+
+from ..auth import require_google_user, require_session, require_session_refresh, usuario_autorizado
+from .. import sessions
+
+router = APIRouter(prefix="/auth", tags=["auth"])
+
+
+def _respuesta(token: str, claims: dict) -> dict:
+    return {
+        "token": token,
+        "exp": claims["exp"],
+        "expira_en_s": max(0, int(claims["exp"] - time.time())),
+        "usuario": {"email": claims["email"], "nombre": claims.get("nombre"), "rol": claims["rol"]},
+    }
+
+
+@router.post("/session")
+def crear_sesion(user=Depends(require_google_user)):
+    """
+    Canjea el id_token de Google (Authorization: Bearer) por un token de sesión
+    de la API. Usarlo como Bearer en el resto de los endpoints.
+    """
+    return _respuesta(*sessions.emitir(user))
+
+
+@router.post("/refresh")
+def refrescar_sesion(claims=Depends(require_session_refresh)):
+    """
+    Nuevo token para una sesión vigente. Re-lee usuarios_roles: si cambió el rol
+    o se dio de baja, el token nuevo lo refleja (o 403). Acepta tokens revocados
+    por ese cambio: es como el cliente se entera del rol nuevo.
+    """
+    # el token anterior sigue valiendo hasta su exp: requests en vuelo no fallan
+    user = usuario_autorizado(claims["email"])
+    return _respuesta(*sessions.emitir(user, auth_time=claims["auth_time"]))
+
+
+@router.post("/logout")
+def cerrar_sesion(claims=Depends(require_session)):
+    sessions.revocar_token(claims)
+    return {"ok": True}
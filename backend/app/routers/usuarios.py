@@ -1,17 +1,24 @@
 # app/routers/usuarios.py
-from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel, EmailStr
-from typing import Optional, Literal
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, EmailStr, ValidationError
+from typing import Any, Dict, List, Optional, Literal
 from uuid import uuid4
+import csv
+import io
 import json
 
-from ..bq import bq_client
-from ..deps import qparams, require_roles
+from ..bq import fqtn, run_query
+from ..deps import qparams, qstructs, require_roles
+from .. import sessions
+from .. import sql_usuarios as Q
 
 Rol = Literal["Admin", "Operador", "Supervisor", "Consulta"]
 
 router = APIRouter(prefix="/usuarios", tags=["usuarios"])
 
+_BULK_MAX = 2000
+
 
 class UsuarioCreate(BaseModel):
     email: EmailStr
@@ -20,130 +27,203 @@ class UsuarioCreate(BaseModel):
     activo: bool = True
 
 
+class UsuarioBulk(UsuarioCreate):
+    # sin valor (columna ausente o vacía en el CSV) no se toca: re-subir un padrón
+    # no rehabilita usuarios dados de baja. Las altas nuevas quedan activas.
+    activo: Optional[bool] = None
+
+
 class UsuarioUpdate(BaseModel):
     nombre: Optional[str] = None
     rol: Optional[Rol] = None
     activo: Optional[bool] = None
 
 
-def _insert_usuario_evento(actor_email: str, tipo_evento: str, usuario_email: str, payload: dict):
-    """
-    Inserta evento de auditoría en infra_gestion.usuarios_eventos.
-    Requiere que exista esa tabla (vos la creas con DDL).
-    """
-    q = """
-    INSERT INTO `infra_gestion.usuarios_eventos`
-    (id_evento, ts_evento, actor_email, tipo_evento, usuario_email, payload_json)
-    VALUES
-    (@id_evento, CURRENT_TIMESTAMP(), @actor_email, @tipo_evento, @usuario_email, @payload_json)
-    """
-    bq_client().query(
-        q,
-        job_config=qparams([
-            ("id_evento", "STRING", str(uuid4())),
-            ("actor_email", "STRING", actor_email),
-            ("tipo_evento", "STRING", tipo_evento),
-            ("usuario_email", "STRING", usuario_email.lower()),
-            ("payload_json", "STRING", json.dumps(payload, ensure_ascii=False)),
-        ])
-    ).result()
+def _fmt_tables(sql_text: str) -> str:
+    return sql_text.format(
+        usuarios_roles=fqtn("infra_gestion.usuarios_roles"),
+        usuarios_eventos=fqtn("infra_gestion.usuarios_eventos"),
+    )
+
+
+def _afectados(rows) -> int:
+    return int(rows[0]["afectados"]) if rows else 0
 
 
 @router.get("/")
-def list_usuarios(user=Depends(require_roles("Admin"))):
-    """
-    Lista usuarios desde infra_gestion.usuarios_roles.
-    """
-    q = """
-    SELECT
-      email, nombre, rol, activo,
-      created_at, created_by, updated_at, updated_by
-    FROM `infra_gestion.usuarios_roles`
-    ORDER BY activo DESC, rol, email
-    """
-    return [dict(r) for r in bq_client().query(q).result()]
+def list_usuarios(
+    q: Optional[str] = None,
+    rol: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    user=Depends(require_roles("Admin")),
+):
+    """
+    Lista usuarios desde infra_gestion.usuarios_roles (paginado, búsqueda por email/nombre).
+    """
+    filtros = [("q", "STRING", q), ("rol", "STRING", rol)]
+    rows = run_query(
+        _fmt_tables(Q.LIST_USUARIOS),
+        qparams(filtros + [("limit", "INT64", limit), ("offset", "INT64", offset)]),
+        user=user,
+    )
+    items = [dict(r) for r in rows]
+    for it in items:
+        it.pop("total", None)
+
+    if rows:
+        total = int(rows[0]["total"])
+    elif offset == 0:
+        total = 0
+    else:
+        # página fuera de rango: el total no viene en la ventana
+        total = int(run_query(_fmt_tables(Q.COUNT_USUARIOS), qparams(filtros), user=user)[0]["total"])
+
+    return {"items": items, "total": total, "limit": limit, "offset": offset}
 
 
 @router.post("/")
 def create_usuario(payload: UsuarioCreate, user=Depends(require_roles("Admin"))):
     """
-    Crea usuario en usuarios_roles.
+    Crea usuario en usuarios_roles (MERGE + evento en un solo job).
     Si ya existe, devuelve 409.
     """
-    q_exists = """
-    SELECT COUNT(1) AS c
-    FROM `infra_gestion.usuarios_roles`
-    WHERE LOWER(email) = LOWER(@email)
-    """
-    c = list(
-        bq_client().query(
-            q_exists,
-            job_config=qparams([("email", "STRING", payload.email.lower())])
-        ).result()
-    )[0]["c"]
-
-    if c > 0:
-        raise HTTPException(status_code=409, detail="El usuario ya existe")
-
-    q = """
-    INSERT INTO `infra_gestion.usuarios_roles`
-    (email, nombre, rol, activo, created_at, created_by, updated_at, updated_by)
-    VALUES
-    (@email, @nombre, @rol, @activo, CURRENT_TIMESTAMP(), @actor, CURRENT_TIMESTAMP(), @actor)
-    """
-    bq_client().query(
-        q,
-        job_config=qparams([
+    rows = run_query(
+        _fmt_tables(Q.CREATE_USUARIO),
+        qparams([
             ("email", "STRING", payload.email.lower()),
             ("nombre", "STRING", payload.nombre),
             ("rol", "STRING", payload.rol),
             ("activo", "BOOL", payload.activo),
             ("actor", "STRING", user["email"]),
-        ])
-    ).result()
-
-    _insert_usuario_evento(
-        actor_email=user["email"],
-        tipo_evento="CREACION",
-        usuario_email=payload.email,
-        payload=payload.model_dump(),
+            ("id_evento", "STRING", str(uuid4())),
+            ("payload_json", "STRING", json.dumps(payload.model_dump(), ensure_ascii=False)),
+        ]),
+        user=user,
+        write=True,
     )
+    if _afectados(rows) == 0:
+        raise HTTPException(status_code=409, detail="El usuario ya existe")
 
     return {"ok": True}
 
 
+def _parse_bulk(raw: bytes, content_type: str) -> List[Dict[str, Any]]:
+    """
+    Acepta JSON (lista o {"usuarios": [...]}) o CSV con encabezado
+    email,nombre,rol[,activo]. Devuelve dicts crudos (se validan después).
+    """
+    text = raw.decode("utf-8-sig")
+    if "csv" in content_type or "text/plain" in content_type:
+        rows = []
+        for r in csv.DictReader(io.StringIO(text)):
+            r = {(k or "").strip().lower(): (v or "").strip() for k, v in r.items()}
+            activo = r.get("activo", "")
+            rows.append({
+                "email": r.get("email", ""),
+                "nombre": r.get("nombre") or None,
+                "rol": r.get("rol", ""),
+                "activo": None if activo == "" else activo.lower() in ("true", "1", "si", "sí", "x"),
+            })
+        return rows
+
+    try:
+        data = json.loads(text)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body inválido: se espera JSON o CSV")
+    if isinstance(data, dict):
+        data = data.get("usuarios")
+    if not isinstance(data, list):
+        raise HTTPException(status_code=400, detail="Se espera una lista de usuarios")
+    return data
+
+
+def validar_bulk(crudos: List[Any]) -> List[UsuarioBulk]:
+    if not crudos:
+        raise HTTPException(status_code=400, detail="La lista de usuarios está vacía")
+    if len(crudos) > _BULK_MAX:
+        raise HTTPException(status_code=413, detail=f"Máximo {_BULK_MAX} usuarios por carga")
+
+    usuarios, errores, vistos = [], [], {}
+    for i, c in enumerate(crudos, start=1):
+        try:
+            u = UsuarioBulk.model_validate(c)
+        except ValidationError as e:
+            errores.append({"fila": i, "error": "; ".join(
+                f"{'.'.join(str(x) for x in err['loc'])}: {err['msg']}" for err in e.errors()
+            )})
+            continue
+        email = u.email.lower()
+        if email in vistos:
+            errores.append({"fila": i, "error": f"email repetido (fila {vistos[email]})"})
+            continue
+        vistos[email] = i
+        usuarios.append(u)
+
+    if errores:
+        raise HTTPException(status_code=422, detail={"errores": errores})
+    return usuarios
+
+
+def aplicar_bulk(usuarios: List[UsuarioBulk], actor: Dict[str, Any]) -> Dict[str, int]:
+    """Upsert de todos los usuarios en un único job (MERGE + INSERT de eventos)."""
+    rows = run_query(
+        _fmt_tables(Q.BULK_UPSERT_USUARIOS),
+        qparams(
+            [("actor", "STRING", actor["email"])],
+            arrays=[qstructs(
+                "usuarios",
+                [("email", "STRING"), ("nombre", "STRING"), ("rol", "STRING"), ("activo", "BOOL")],
+                [{**u.model_dump(), "email": u.email.lower()} for u in usuarios],
+            )],
+        ),
+        user=actor,
+        write=True,
+    )
+    # rol/activo pudieron cambiar: el próximo request da 401 y el cliente pasa por
+    # /auth/refresh, que re-lee el rol (o 403 si quedó inactivo)
+    for u in usuarios:
+        sessions.revocar_usuario(u.email)
+    r = rows[0] if rows else {}
+    return {"creados": int(r.get("creados") or 0), "actualizados": int(r.get("actualizados") or 0)}
+
+
+@router.post("/bulk")
+async def bulk_usuarios(request: Request, user=Depends(require_roles("Admin"))):
+    """
+    Alta/actualización masiva. Body JSON (lista de usuarios) o CSV
+    (Content-Type: text/csv, encabezado email,nombre,rol,activo).
+    Si alguna fila es inválida no se aplica nada (422 con el detalle por fila).
+    """
+    crudos = _parse_bulk(await request.body(), request.headers.get("content-type", ""))
+    usuarios = validar_bulk(crudos)
+    res = await run_in_threadpool(aplicar_bulk, usuarios, user)
+    return {"ok": True, **res}
+
+
 @router.put("/{email}")
 def update_usuario(email: str, payload: UsuarioUpdate, user=Depends(require_roles("Admin"))):
     """
-    Actualiza nombre/rol/activo en usuarios_roles.
+    Actualiza nombre/rol/activo en usuarios_roles (MERGE + evento en un solo job).
     """
-    q = """
-    UPDATE `infra_gestion.usuarios_roles`
-    SET
-      nombre = COALESCE(@nombre, nombre),
-      rol = COALESCE(@rol, rol),
-      activo = COALESCE(@activo, activo),
-      updated_at = CURRENT_TIMESTAMP(),
-      updated_by = @actor
-    WHERE LOWER(email) = LOWER(@email)
-    """
-    bq_client().query(
-        q,
-        job_config=qparams([
+    rows = run_query(
+        _fmt_tables(Q.UPDATE_USUARIO),
+        qparams([
             ("email", "STRING", email.lower()),
             ("nombre", "STRING", payload.nombre),
             ("rol", "STRING", payload.rol),
             ("activo", "BOOL", payload.activo),
             ("actor", "STRING", user["email"]),
-        ])
-    ).result()
-
-    _insert_usuario_evento(
-        actor_email=user["email"],
-        tipo_evento="EDICION",
-        usuario_email=email,
-        payload=payload.model_dump(),
+            ("id_evento", "STRING", str(uuid4())),
+            ("payload_json", "STRING", json.dumps(payload.model_dump(), ensure_ascii=False)),
+        ]),
+        user=user,
+        write=True,
     )
+    if _afectados(rows) == 0:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    if payload.rol is not None or payload.activo is not None:
+        sessions.revocar_usuario(email)
 
     return {"ok": True}
 
@@ -153,27 +233,19 @@ def disable_usuario(email: str, user=Depends(require_roles("Admin"))):
     """
     Deshabilita usuario (activo = FALSE) en usuarios_roles.
     """
-    q = """
-    UPDATE `infra_gestion.usuarios_roles`
-    SET
-      activo = FALSE,
-      updated_at = CURRENT_TIMESTAMP(),
-      updated_by = @actor
-    WHERE LOWER(email) = LOWER(@email)
-    """
-    bq_client().query(
-        q,
-        job_config=qparams([
+    rows = run_query(
+        _fmt_tables(Q.DISABLE_USUARIO),
+        qparams([
             ("email", "STRING", email.lower()),
             ("actor", "STRING", user["email"]),
-        ])
-    ).result()
-
-    _insert_usuario_evento(
-        actor_email=user["email"],
-        tipo_evento="DESHABILITAR",
-        usuario_email=email,
-        payload={"activo": False},
+            ("id_evento", "STRING", str(uuid4())),
+            ("payload_json", "STRING", json.dumps({"activo": False}, ensure_ascii=False)),
+        ]),
+        user=user,
+        write=True,
     )
+    if _afectados(rows) == 0:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    sessions.revocar_usuario(email)
 
     return {"ok": True}
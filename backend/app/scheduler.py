@@ -0,0 +1,134 @@
+# app/scheduler.py
+"""
+Limitador de concurrencia para jobs de BigQuery.
+
+- Cupo global de jobs simultáneos (`bq_max_concurrentes`).
+- Cupo de lecturas corriendo a la vez por usuario (`bq_max_por_usuario`): las
+  que lo exceden esperan en la cola (no se rechazan) y mientras tanto pasan
+  las de otros usuarios.
+- Orden de la cola: primero los prioritarios (escrituras y las lecturas que
+  las preceden), después las lecturas, y entre lecturas gana el usuario con
+  menos jobs propios en curso o en espera (fair queueing). Empates por orden
+  de llegada.
+- Nadie espera más de `bq_espera_max_s`: ahí sí 429 con Retry-After.
+"""
+import itertools
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from fastapi import HTTPException
+
+from .config import settings
+
+
+def _demasiados(retry_after: float, detail: str) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+class Scheduler:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._activos = 0
+        self._lecturas: Dict[str, int] = {}  # en curso + en espera, por usuario
+        self._corriendo: Dict[str, int] = {}  # solo en curso
+        self._cola: list = []
+        self._seq = itertools.count()
+        self._duracion_media = 1.0  # EWMA en segundos, para estimar Retry-After
+
+        self.esperas_por_cupo_usuario = 0
+        self.rechazos_espera = 0
+        self.espera_max_observada = 0.0
+
+    @contextmanager
+    def turno(self, user: Optional[Dict[str, Any]] = None, prioritario: bool = False) -> Iterator[None]:
+        email = ((user or {}).get("email") or "").lower()
+        lectura = bool(email) and not prioritario
+        t_cola = time.monotonic()
+
+        with self._cond:
+            if lectura:
+                n = self._lecturas.get(email, 0)
+                if self._corriendo.get(email, 0) >= settings.bq_max_por_usuario:
+                    self.esperas_por_cupo_usuario += 1
+                self._lecturas[email] = n + 1
+            else:
+                n = 0
+
+            entrada = (0 if prioritario else 1, n, next(self._seq), email if lectura else "")
+            self._cola.append(entrada)
+            limite = t_cola + settings.bq_espera_max_s
+
+            while self._siguiente() is not entrada:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    self._cola.remove(entrada)
+                    if lectura:
+                        self._liberar(self._lecturas, email)
+                    self.rechazos_espera += 1
+                    self._cond.notify_all()
+                    espera = self._duracion_media * (len(self._cola) / settings.bq_max_concurrentes + 1)
+                    raise _demasiados(espera, "BigQuery saturado, reintentar en unos segundos")
+                self._cond.wait(restante)
+
+            self._cola.remove(entrada)
+            self._activos += 1
+            if lectura:
+                self._corriendo[email] = self._corriendo.get(email, 0) + 1
+            self.espera_max_observada = max(self.espera_max_observada, time.monotonic() - t_cola)
+            self._cond.notify_all()
+
+        t0 = time.monotonic()
+        try:
+            yield
+        finally:
+            dur = time.monotonic() - t0
+            with self._cond:
+                self._activos -= 1
+                if lectura:
+                    self._liberar(self._corriendo, email)
+                    self._liberar(self._lecturas, email)
+                self._duracion_media = 0.8 * self._duracion_media + 0.2 * dur
+                self._cond.notify_all()
+
+    def _siguiente(self) -> Optional[tuple]:
+        """Primera entrada en orden de la cola que puede correr ya (saltea usuarios en su cupo)."""
+        if self._activos >= settings.bq_max_concurrentes:
+            return None
+        for entrada in sorted(self._cola):
+            email = entrada[3]
+            if not email or self._corriendo.get(email, 0) < settings.bq_max_por_usuario:
+                return entrada
+        return None
+
+    @staticmethod
+    def _liberar(cuenta: Dict[str, int], email: str) -> None:
+        n = cuenta.get(email, 0) - 1
+        if n > 0:
+            cuenta[email] = n
+        else:
+            cuenta.pop(email, None)
+
+    def estado(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "max_concurrentes": settings.bq_max_concurrentes,
+                "max_por_usuario": settings.bq_max_por_usuario,
+                "activos": self._activos,
+                "en_cola": len(self._cola),
+                "lecturas_por_usuario": dict(self._lecturas),
+                "corriendo_por_usuario": dict(self._corriendo),
+                "duracion_media_s": round(self._duracion_media, 3),
+                "espera_max_observada_s": round(self.espera_max_observada, 3),
+                "esperas_por_cupo_usuario": self.esperas_por_cupo_usuario,
+                "rechazos_espera": self.rechazos_espera,
+            }
+
+
+scheduler = Scheduler()
@@ -0,0 +1,191 @@
+# app/sessions.py
+"""
+Tokens de sesión propios de la API, firmados con HMAC-SHA256.
+
+POST /auth/session canjea un id_token de Google ya verificado (más el lookup en
+usuarios_roles) por un token corto que lleva email, nombre y rol. Después cada
+request se autoriza verificando la firma en memoria: sin certs de Google ni
+BigQuery por request.
+
+Formato: "s1.<payload base64url>.<firma base64url>".
+- `exp`: vence a los `session_ttl_s`; /auth/refresh re-lee el rol y emite uno
+  nuevo, hasta `session_max_s` desde el login (`auth_time`).
+- Revocación: por usuario (todo token emitido antes de un cambio de rol / baja)
+  y por token (logout). La revocación por usuario no corta la sesión: el token
+  deja de autorizar requests pero /auth/refresh lo sigue aceptando (firma, exp
+  y jti) y emite uno con el rol re-leído, o 403 si hubo baja.
+- IMPORTANTE con varios workers: las revocaciones se comparten solo si
+  SESSION_REVOCACIONES_PATH apunta a un SQLite común (cada worker lo relee como
+  mucho una vez por segundo). Sin eso son por proceso: en los demás workers un
+  usuario dado de baja sigue entrando hasta el `exp` de su token (SESSION_TTL_S).
+"""
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import secrets
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from .config import settings
+
+log = logging.getLogger(__name__)
+
+PREFIJO = "s1."
+
+_secret = settings.session_secret.encode("utf-8")
+if not _secret:
+    # sin secreto configurado cada proceso firma con el suyo: con varios workers
+    # o tras un reinicio el cliente vuelve a canjear el token de Google
+    log.warning("SESSION_SECRET vacío: se usa un secreto aleatorio por proceso")
+    _secret = secrets.token_bytes(32)
+
+_lock = threading.Lock()
+_revocado_usuario: Dict[str, float] = {}   # email -> tokens con iat anterior no valen
+_revocado_jti: Dict[str, float] = {}       # jti -> exp (se purga al vencer)
+
+# revocaciones de los demás workers (SESSION_REVOCACIONES_PATH)
+_db_local = threading.local()
+_visto = 0          # último id leído
+_sincronizado = 0.0  # monotonic de la última lectura
+
+
+def _b64(b: bytes) -> str:
+    return base64.urlsafe_b64encode(b).decode("ascii").rstrip("=")
+
+
+def _unb64(s: str) -> bytes:
+    return base64.urlsafe_b64decode(s + "=" * (-len(s) % 4))
+
+
+def _firma(payload_b64: str) -> str:
+    return _b64(hmac.new(_secret, payload_b64.encode("ascii"), hashlib.sha256).digest())
+
+
+def es_token_sesion(token: str) -> bool:
+    return token.startswith(PREFIJO)
+
+
+def emitir(user: Dict[str, Any], auth_time: Optional[float] = None) -> Tuple[str, Dict[str, Any]]:
+    ahora = time.time()
+    auth_time = auth_time or ahora
+    claims = {
+        "email": user["email"].lower(),
+        "nombre": user.get("nombre"),
+        "rol": user["rol"],
+        "iat": ahora,
+        "exp": int(min(ahora + settings.session_ttl_s, auth_time + settings.session_max_s)),
+        "auth_time": auth_time,
+        "jti": secrets.token_urlsafe(12),
+    }
+    payload = _b64(json.dumps(claims, separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
+    return f"{PREFIJO}{payload}.{_firma(payload)}", claims
+
+
+def _db() -> Optional[sqlite3.Connection]:
+    if not settings.session_revocaciones_path:
+        return None
+    conn = getattr(_db_local, "conn", None)
+    if conn is None:
+        path = Path(settings.session_revocaciones_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS revocaciones ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, tipo TEXT NOT NULL, clave TEXT NOT NULL, ts REAL NOT NULL)"
+        )
+        _db_local.conn = conn
+    return conn
+
+
+def _aplicar(tipo: str, clave: str, ts: float) -> None:
+    # con el lock tomado
+    if tipo == "usuario":
+        _revocado_usuario[clave] = max(ts, _revocado_usuario.get(clave, 0.0))
+    else:
+        _revocado_jti[clave] = ts
+
+
+def _sincronizar() -> None:
+    """Trae las revocaciones de los otros workers (como mucho una vez por segundo)."""
+    global _visto, _sincronizado
+    conn = _db()
+    if conn is None:
+        return
+    ahora = time.monotonic()
+    with _lock:
+        if ahora - _sincronizado < 1.0:
+            return
+        _sincronizado = ahora
+        desde = _visto
+    try:
+        rows = conn.execute(
+            "SELECT id, tipo, clave, ts FROM revocaciones WHERE id > ? ORDER BY id", (desde,)
+        ).fetchall()
+    except sqlite3.Error as e:
+        log.warning("sesiones: no se pudieron leer las revocaciones: %s", e)
+        return
+    with _lock:
+        for id_, tipo, clave, ts in rows:
+            _aplicar(tipo, clave, ts)
+            _visto = max(_visto, id_)
+
+
+def _compartir(tipo: str, clave: str, ts: float) -> None:
+    conn = _db()
+    if conn is None:
+        return
+    conn.execute("INSERT INTO revocaciones (tipo, clave, ts) VALUES (?, ?, ?)", (tipo, clave, ts))
+    # pasado session_max_s ninguna revocación sigue haciendo falta
+    conn.execute("DELETE FROM revocaciones WHERE ts < ?", (time.time() - settings.session_max_s,))
+
+
+def verificar(token: str, refresh: bool = False) -> Dict[str, Any]:
+    """
+    Claims del token o ValueError (firma, vencimiento o revocación).
+    Con refresh=True no aplica la revocación por usuario (ver docstring del módulo).
+    """
+    try:
+        payload, firma = token[len(PREFIJO):].split(".", 1)
+    except ValueError:
+        raise ValueError("formato")
+    # en bytes: compare_digest con str no-ASCII tira TypeError
+    if not hmac.compare_digest(firma.encode("utf-8"), _firma(payload).encode("ascii")):
+        raise ValueError("firma")
+    claims = json.loads(_unb64(payload))
+    if not isinstance(claims, dict):
+        raise ValueError("formato")
+    if claims["exp"] <= time.time():
+        raise ValueError("vencido")
+    _sincronizar()
+    with _lock:
+        if not refresh and claims["iat"] < _revocado_usuario.get(claims["email"], 0.0):
+            raise ValueError("revocado")
+        if claims["jti"] in _revocado_jti:
+            raise ValueError("revocado")
+    return claims
+
+
+def revocar_usuario(email: str) -> None:
+    """Invalida las sesiones vigentes del usuario (cambio de rol, baja)."""
+    ahora = time.time()
+    _compartir("usuario", email.lower(), ahora)
+    with _lock:
+        _aplicar("usuario", email.lower(), ahora)
+        # pasado session_max_s ya no queda ningún token emitido antes
+        for e in [e for e, ts in _revocado_usuario.items() if ts < ahora - settings.session_max_s]:
+            del _revocado_usuario[e]
+
+
+def revocar_token(claims: Dict[str, Any]) -> None:
+    ahora = time.time()
+    _compartir("jti", claims["jti"], claims["exp"])
+    with _lock:
+        _aplicar("jti", claims["jti"], claims["exp"])
+        for jti in [j for j, exp in _revocado_jti.items() if exp <= ahora]:
+            del _revocado_jti[jti]
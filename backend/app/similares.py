@@ -0,0 +1,237 @@
+# app/similares.py
+"""
+Índice en memoria para detectar gestiones duplicadas (el mismo bache cargado
+por distintos canales de origen).
+
+- Bloqueo por localidad: solo se comparan gestiones de la misma
+  departamento/localidad (normalizadas).
+- Dentro de cada localidad, índice invertido trigrama -> ids sobre el detalle
+  normalizado (texto.trigramas). Una consulta cuenta, por candidato, cuántos
+  trigramas comparte (suma de postings) y de ahí sale el Jaccard exacto:
+  |A ∩ B| / (|A| + |B| - |A ∩ B|). Sin LIKE sobre toda la tabla.
+- Se carga con las gestiones de los últimos `similares_dias` (SIMILARES_SEED) y
+  se mantiene con los eventos del bus (alta, cambio de estado, borrado). Las
+  altas de otros workers entran con la re-carga cada `similares_ttl_s`.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple
+
+from .config import settings
+from .pubsub import bus
+from .texto import normalizar, trigramas
+
+log = logging.getLogger(__name__)
+
+# lo que se devuelve de cada candidato (además de id y similitud)
+_RESUMEN = ("departamento", "localidad", "estado", "fecha_ingreso", "canal_origen", "detalle")
+
+_Doc = Tuple[str, FrozenSet[str], Dict[str, Any]]  # (clave localidad, trigramas, resumen)
+
+
+def _clave(departamento: Optional[str], localidad: Optional[str]) -> str:
+    return f"{normalizar(departamento)}|{normalizar(localidad)}"
+
+
+class IndiceSimilares:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._docs: Dict[str, _Doc] = {}
+        self._postings: Dict[str, Dict[str, Set[str]]] = {}
+        self._cargado: Optional[float] = None
+        self._cargando = False
+        self._fallo: Optional[float] = None  # monotonic de la última carga fallida
+        # eventos que llegan mientras corre la carga: se re-aplican sobre el índice nuevo
+        self._durante_carga: List[Dict[str, Any]] = []
+        self.consultas = 0
+        self.errores = 0
+        self.ultimo_error: Optional[str] = None
+
+    # -------------------------
+    # mantenimiento
+    # -------------------------
+    @staticmethod
+    def _agregar(docs: Dict[str, _Doc], postings: Dict[str, Dict[str, Set[str]]], fila: Dict[str, Any]) -> None:
+        id_gestion = fila["id_gestion"]
+        IndiceSimilares._quitar(docs, postings, id_gestion)
+        grams = trigramas(fila.get("detalle"))
+        if not grams:
+            return
+        clave = _clave(fila.get("departamento"), fila.get("localidad"))
+        docs[id_gestion] = (clave, grams, {c: fila.get(c) for c in _RESUMEN})
+        loc = postings.setdefault(clave, {})
+        for g in grams:
+            loc.setdefault(g, set()).add(id_gestion)
+
+    @staticmethod
+    def _quitar(docs: Dict[str, _Doc], postings: Dict[str, Dict[str, Set[str]]], id_gestion: str) -> None:
+        doc = docs.pop(id_gestion, None)
+        if doc is None:
+            return
+        clave, grams, _ = doc
+        loc = postings.get(clave, {})
+        for g in grams:
+            ids = loc.get(g)
+            if ids is not None:
+                ids.discard(id_gestion)
+                if not ids:
+                    del loc[g]
+        if not loc:
+            postings.pop(clave, None)
+
+    def _aplicar(self, evento: Dict[str, Any]) -> None:
+        # con el lock tomado
+        if evento.get("tipo") == "eliminada":
+            self._quitar(self._docs, self._postings, evento["id_gestion"])
+        elif evento.get("gestion"):
+            self._agregar(self._docs, self._postings, evento["gestion"])
+
+    def _oyente(self, evento: Dict[str, Any]) -> None:
+        if not settings.similares_enabled:
+            return
+        with self._lock:
+            self._aplicar(evento)
+            if self._cargando:
+                self._durante_carga.append(evento)
+
+    def cargar(self) -> None:
+        from .bq import fqtn, run_query
+        from .deps import qparams
+        from . import sql_gestiones as Q
+
+        with self._lock:
+            if self._cargando:
+                return
+            self._cargando = True
+            self._durante_carga = []
+        try:
+            t0 = time.perf_counter()
+            rows = run_query(
+                Q.SIMILARES_SEED.format(gestiones=fqtn("infra_gestion.gestiones")),
+                qparams([("dias", "INT64", settings.similares_dias)]),
+            )
+            docs: Dict[str, _Doc] = {}
+            postings: Dict[str, Dict[str, Set[str]]] = {}
+            for r in rows:
+                self._agregar(docs, postings, dict(r))
+            with self._lock:
+                self._docs, self._postings = docs, postings
+                for evento in self._durante_carga:
+                    self._aplicar(evento)
+                self._cargado = time.monotonic()
+                self._fallo = None
+            log.info("similares: %d gestiones indexadas en %.0f ms", len(docs), (time.perf_counter() - t0) * 1000)
+        except Exception as e:
+            self.errores += 1
+            self.ultimo_error = str(e)
+            self._fallo = time.monotonic()
+            raise
+        finally:
+            with self._lock:
+                self._cargando = False
+                self._durante_carga = []
+
+    def _recargar_en_background(self) -> None:
+        def _correr():
+            try:
+                self.cargar()
+            except Exception as e:
+                log.warning("similares: re-carga falló: %s", e)
+
+        threading.Thread(target=_correr, name="similares", daemon=True).start()
+
+    def _asegurar(self) -> bool:
+        """
+        Primera vez carga en línea; si quedó viejo re-carga en background y sigue con
+        el actual. Si una carga falló, los reintentos van en background y recién
+        pasados `similares_reintento_s`: un BigQuery caído no frena cada alta.
+        """
+        with self._lock:
+            cargado, cargando, fallo = self._cargado, self._cargando, self._fallo
+        reintentar = fallo is None or time.monotonic() - fallo > settings.similares_reintento_s
+        if cargado is None:
+            if fallo is not None:
+                if reintentar and not cargando:
+                    self._recargar_en_background()
+                return False
+            try:
+                self.cargar()
+            except Exception as e:
+                log.warning("similares: carga falló: %s", e)
+                return False
+            return self._cargado is not None
+        if not cargando and reintentar and time.monotonic() - cargado > settings.similares_ttl_s:
+            self._recargar_en_background()
+        return True
+
+    # -------------------------
+    # consultas
+    # -------------------------
+    def resumen(self, id_gestion: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            doc = self._docs.get(id_gestion)
+        return dict(doc[2]) if doc else None
+
+    def buscar(
+        self,
+        departamento: Optional[str],
+        localidad: Optional[str],
+        detalle: Optional[str],
+        excluir: Optional[str] = None,
+        limit: Optional[int] = None,
+        umbral: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        """Gestiones de la misma localidad con Jaccard de trigramas >= umbral, más parecidas primero."""
+        if not settings.similares_enabled or not self._asegurar():
+            return []
+        grams = trigramas(detalle)
+        if not grams:
+            return []
+        limit = limit or settings.similares_max
+        umbral = settings.similares_umbral if umbral is None else umbral
+
+        with self._lock:
+            loc = self._postings.get(_clave(departamento, localidad))
+            if not loc:
+                return []
+            comunes: Counter = Counter()
+            for g in grams:
+                ids = loc.get(g)
+                if ids:
+                    comunes.update(ids)
+            comunes.pop(excluir, None)
+
+            candidatos = []
+            for id_gestion, inter in comunes.items():
+                _, otros, resumen = self._docs[id_gestion]
+                sim = inter / (len(grams) + len(otros) - inter)
+                if sim >= umbral:
+                    candidatos.append((sim, id_gestion, resumen))
+            self.consultas += 1
+
+        candidatos.sort(key=lambda c: (-c[0], c[1]))
+        return [
+            {"id_gestion": id_gestion, "similitud": round(sim, 3), **resumen}
+            for sim, id_gestion, resumen in candidatos[:limit]
+        ]
+
+    def estado(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "habilitado": settings.similares_enabled,
+                "gestiones": len(self._docs),
+                "localidades": len(self._postings),
+                "trigramas": sum(len(p) for p in self._postings.values()),
+                "cargado_hace_s": round(time.monotonic() - self._cargado, 1) if self._cargado else None,
+                "cargando": self._cargando,
+                "consultas": self.consultas,
+                "errores": self.errores,
+                "ultimo_error": self.ultimo_error,
+                "fallo_hace_s": round(time.monotonic() - self._fallo, 1) if self._fallo else None,
+            }
+
+
+similares = IndiceSimilares()
+bus.escuchar(similares._oyente)
@@ -0,0 +1,87 @@
+# app/singleflight.py
+"""
+Single-flight: lecturas idénticas concurrentes (mismo SQL y mismos valores de
+parámetros) comparten un único job de BigQuery y su resultado.
+Solo para lecturas: las escrituras nunca se coalescen.
+"""
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from google.cloud import bigquery
+
+
+def clave(query: str, cfg: Optional[bigquery.QueryJobConfig]) -> Tuple[Hashable, ...]:
+    params = tuple(
+        (p.name, getattr(p, "type_", None), repr(getattr(p, "value", None)))
+        for p in ((cfg.query_parameters if cfg else None) or [])
+    )
+    return query, params
+
+
+class _Llamada:
+    __slots__ = ("evento", "resultado", "error")
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._en_vuelo: Dict[Hashable, _Llamada] = {}
+        self.lideres = 0
+        self.coalescidas = 0
+
+    def do(
+        self,
+        key: Hashable,
+        fn: Callable[[], Any],
+        reintentar_si: Callable[[BaseException], bool] = lambda _e: False,
+    ) -> Any:
+        """
+        Ejecuta fn() una sola vez por key en vuelo; las llamadas concurrentes
+        esperan y reciben el mismo resultado (o la misma excepción).
+        Si el error del líder es propio de él (`reintentar_si`, ej. un 429 por
+        su cupo de usuario), cada seguidor ejecuta fn() por su cuenta.
+        """
+        with self._lock:
+            llamada = self._en_vuelo.get(key)
+            lider = llamada is None
+            if lider:
+                llamada = _Llamada()
+                self._en_vuelo[key] = llamada
+                self.lideres += 1
+
+        if not lider:
+            llamada.evento.wait()
+            if llamada.error is None:
+                with self._lock:
+                    self.coalescidas += 1
+                return llamada.resultado
+            if reintentar_si(llamada.error):
+                return fn()
+            raise llamada.error
+
+        try:
+            llamada.resultado = fn()
+            return llamada.resultado
+        except BaseException as e:
+            llamada.error = e
+            raise
+        finally:
+            with self._lock:
+                self._en_vuelo.pop(key, None)
+            llamada.evento.set()
+
+    def estado(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "jobs_ejecutados": self.lideres,
+                "jobs_ahorrados": self.coalescidas,
+                "en_vuelo": len(self._en_vuelo),
+            }
+
+
+singleflight = SingleFlight()
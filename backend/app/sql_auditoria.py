@@ -0,0 +1,59 @@
+# app/sql_auditoria.py
+# Búsqueda de auditoría sobre gestiones_eventos y usuarios_eventos.
+# Cada rama filtra primero por la ventana de tiempo (poda por timestamp del evento)
+# y aplica el keyset (@cursor_ts, @cursor_id) ahí mismo, antes del UNION.
+
+AUDITORIA_GESTIONES = """
+SELECT
+  'gestion' AS entidad,
+  id_gestion AS entidad_id,
+  id_evento,
+  fecha_evento AS ts,
+  usuario AS actor,
+  tipo_evento,
+  TO_JSON_STRING(STRUCT(
+    rol_usuario,
+    estado_anterior,
+    estado_nuevo,
+    campo_modificado,
+    valor_anterior,
+    valor_nuevo,
+    comentario,
+    metadata_json
+  )) AS detalle_json
+FROM `{eventos}`
+WHERE fecha_evento >= @desde
+  AND fecha_evento < @hasta
+  AND (@cursor_ts IS NULL OR fecha_evento < @cursor_ts OR (fecha_evento = @cursor_ts AND id_evento < @cursor_id))
+  AND (@actor IS NULL OR @actor = '' OR LOWER(usuario) = LOWER(@actor))
+  AND (@tipo_evento IS NULL OR @tipo_evento = '' OR tipo_evento = @tipo_evento)
+  AND (@entidad_id IS NULL OR @entidad_id = '' OR id_gestion = @entidad_id)
+"""
+
+AUDITORIA_USUARIOS = """
+SELECT
+  'usuario' AS entidad,
+  usuario_email AS entidad_id,
+  id_evento,
+  ts_evento AS ts,
+  actor_email AS actor,
+  tipo_evento,
+  payload_json AS detalle_json
+FROM `{usuarios_eventos}`
+WHERE ts_evento >= @desde
+  AND ts_evento < @hasta
+  AND (@cursor_ts IS NULL OR ts_evento < @cursor_ts OR (ts_evento = @cursor_ts AND id_evento < @cursor_id))
+  AND (@actor IS NULL OR @actor = '' OR LOWER(actor_email) = LOWER(@actor))
+  AND (@tipo_evento IS NULL OR @tipo_evento = '' OR tipo_evento = @tipo_evento)
+  AND (@entidad_id IS NULL OR @entidad_id = '' OR LOWER(usuario_email) = LOWER(@entidad_id))
+"""
+
+# {ramas}: una o ambas ramas de arriba unidas con UNION ALL
+BUSCAR_AUDITORIA = """
+SELECT *
+FROM (
+{ramas}
+)
+ORDER BY ts DESC, id_evento DESC
+LIMIT @limit
+"""
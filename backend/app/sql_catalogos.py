@@ -0,0 +1,59 @@
+# app/sql_catalogos.py
+# Queries de catálogos (se cargan completos y se sirven desde memoria)
+
+CAT_ESTADOS = """
+SELECT id, nombre, orden, activo
+FROM `{cat_estado}`
+WHERE activo = TRUE
+ORDER BY orden, nombre
+"""
+
+CAT_URGENCIAS = """
+SELECT id, nombre, orden, activo
+FROM `{cat_urgencia}`
+WHERE activo = TRUE
+ORDER BY orden, nombre
+"""
+
+CAT_MINISTERIOS = """
+SELECT id, nombre, activo, orden
+FROM `{cat_ministerio_agencia}`
+WHERE activo = TRUE
+ORDER BY orden, nombre
+"""
+
+CAT_CATEGORIAS = """
+SELECT id, nombre, activo, orden, descripcion
+FROM `{cat_categoria_general}`
+WHERE activo = TRUE
+ORDER BY orden, nombre
+"""
+
+# ✅ NUEVO: Tipos de gestión
+CAT_TIPOS_GESTION = """
+SELECT id, nombre, activo, orden, descripcion
+FROM `{cat_tipo_gestion}`
+WHERE activo = TRUE
+ORDER BY orden, nombre
+"""
+
+# ✅ NUEVO: Canales de origen
+CAT_CANALES_ORIGEN = """
+SELECT id, nombre, activo, orden, descripcion
+FROM `{cat_canal_origen}`
+WHERE activo = TRUE
+ORDER BY orden, nombre
+"""
+
+# geo_localidades completa (activas e inactivas): departamentos/localidades no
+# filtran por activo, el lookup de geo sí.
+GEO_LOCALIDADES = """
+SELECT
+  id_geo,
+  departamento,
+  localidad,
+  lat_centro AS lat,
+  lon_centro AS lon,
+  activo
+FROM `{geo_localidades}`
+"""
@@ -0,0 +1,47 @@
+# app/sql_consistencia.py
+# Auditor de consistencia gestiones vs gestiones_eventos (app/auditor_consistencia.py).
+# {gestiones} puede ser la tabla caliente o GESTIONES_CON_ARCHIVO.
+#
+# Dos formas de partir el historial:
+# - por rangos de id_gestion [@desde, @hasta) (NULL = sin cota): solo si TODAS las
+#   tablas están clusterizadas por id_gestion (primer campo), así cada rango lee
+#   solo sus bloques. El auditor lo verifica en la metadata antes de usarlo; para
+#   clusterizar una tabla existente:
+#       bq update --clustering_fields=id_gestion infra_gestion.gestiones
+#   (ídem gestiones_eventos y gestiones_archivo; aplica a lo que se escriba
+#   después, lo ya escrito se reagrupa con el re-clustering automático).
+# - si no: un único scan por tabla, cada fila con su rango por FARM_FINGERPRINT,
+#   y se reparte en memoria. Sin clustering el filtro por rango no poda nada y N
+#   rangos serían N scans completos.
+
+# Cotas de los rangos: cuantiles aproximados de id_gestion (un solo job barato).
+LIMITES_RANGOS = """
+SELECT APPROX_QUANTILES(id_gestion, @rangos) AS limites
+FROM `{gestiones}`
+"""
+
+GESTIONES_RANGO = """
+SELECT id_gestion, estado, is_deleted
+FROM `{gestiones}`
+WHERE (@desde IS NULL OR id_gestion >= @desde)
+  AND (@hasta IS NULL OR id_gestion < @hasta)
+"""
+
+EVENTOS_RANGO = """
+SELECT id_gestion, id_evento, fecha_evento, tipo_evento, estado_nuevo
+FROM `{eventos}`
+WHERE (@desde IS NULL OR id_gestion >= @desde)
+  AND (@hasta IS NULL OR id_gestion < @hasta)
+"""
+
+# Scan único: el mismo id_gestion cae en el mismo rango en ambas tablas.
+GESTIONES_HASH = """
+SELECT ABS(MOD(FARM_FINGERPRINT(id_gestion), @rangos)) AS rango, id_gestion, estado, is_deleted
+FROM `{gestiones}`
+"""
+
+EVENTOS_HASH = """
+SELECT ABS(MOD(FARM_FINGERPRINT(id_gestion), @rangos)) AS rango,
+       id_gestion, id_evento, fecha_evento, tipo_evento, estado_nuevo
+FROM `{eventos}`
+"""
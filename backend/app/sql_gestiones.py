@@ -5,11 +5,9 @@
 # GESTIONES
 # -------------------------
 
-COUNT_GESTIONES = """
-SELECT COUNT(1) AS total
-FROM `{gestiones}`
-WHERE is_deleted = FALSE
-  AND (@estado IS NULL OR @estado = '' OR estado = @estado)
+# Filtros compartidos por COUNT / LIST / CHANGES (mismos parámetros en los tres)
+FILTROS_GESTIONES = """
+  (@estado IS NULL OR @estado = '' OR estado = @estado)
   AND (@ministerio IS NULL OR @ministerio = '' OR ministerio_agencia_id = @ministerio)
   AND (@categoria IS NULL OR @categoria = '' OR categoria_general_id = @categoria)
   AND (@departamento IS NULL OR @departamento = '' OR UPPER(TRIM(departamento)) = UPPER(TRIM(@departamento)))
@@ -39,8 +37,8 @@ WHERE is_deleted = FALSE
   )
 """
 
-LIST_GESTIONES = """
-SELECT
+# Columnas de la grilla (LIST_GESTIONES y CHANGES_GESTIONES)
+COLUMNAS_LISTA = """
   id_gestion,
   departamento,
   localidad,
@@ -59,38 +57,116 @@ SELECT
   nro_expediente,
   fecha_ingreso,
   TIMESTAMP_DIFF(CURRENT_TIMESTAMP(), fecha_estado, DAY) AS dias_transcurridos
+"""
+
+COUNT_GESTIONES = """
+SELECT COUNT(1) AS total
 FROM `{gestiones}`
 WHERE is_deleted = FALSE
-  AND (@estado IS NULL OR @estado = '' OR estado = @estado)
-  AND (@ministerio IS NULL OR @ministerio = '' OR ministerio_agencia_id = @ministerio)
-  AND (@categoria IS NULL OR @categoria = '' OR categoria_general_id = @categoria)
-  AND (@departamento IS NULL OR @departamento = '' OR UPPER(TRIM(departamento)) = UPPER(TRIM(@departamento)))
-  AND (@localidad IS NULL OR @localidad = '' OR UPPER(TRIM(localidad)) = UPPER(TRIM(@localidad)))
-
-  -- ✅ NUEVOS (filtros opcionales)
-  AND (@tipo_gestion IS NULL OR @tipo_gestion = '' OR tipo_gestion = @tipo_gestion)
-  AND (@canal_origen IS NULL OR @canal_origen = '' OR canal_origen = @canal_origen)
+  AND""" + FILTROS_GESTIONES
 
-  AND (
-    @q IS NULL OR @q = '' OR (
-      CONTAINS_SUBSTR(LOWER(CAST(id_gestion AS STRING)), LOWER(@q)) OR
-      CONTAINS_SUBSTR(LOWER(COALESCE(departamento, '')), LOWER(@q)) OR
-      CONTAINS_SUBSTR(LOWER(COALESCE(localidad, '')), LOWER(@q)) OR
-      CONTAINS_SUBSTR(LOWER(COALESCE(estado, '')), LOWER(@q)) OR
-      CONTAINS_SUBSTR(LOWER(COALESCE(urgencia, '')), LOWER(@q)) OR
-      CONTAINS_SUBSTR(LOWER(COALESCE(detalle, '')), LOWER(@q)) OR
-      CONTAINS_SUBSTR(LOWER(COALESCE(subtipo_detalle, '')), LOWER(@q)) OR
-      CONTAINS_SUBSTR(LOWER(COALESCE(nro_expediente, '')), LOWER(@q)) OR
-      CONTAINS_SUBSTR(LOWER(CAST(COALESCE(costo_estimado, 0) AS STRING)), LOWER(@q)) OR
-      CONTAINS_SUBSTR(LOWER(COALESCE(costo_moneda, '')), LOWER(@q)) OR
-      CONTAINS_SUBSTR(LOWER(COALESCE(tipo_gestion, '')), LOWER(@q)) OR
-      CONTAINS_SUBSTR(LOWER(COALESCE(canal_origen, '')), LOWER(@q))
-    )
-  )
+LIST_GESTIONES = """
+SELECT""" + COLUMNAS_LISTA + """
+FROM `{gestiones}`
+WHERE is_deleted = FALSE
+  AND""" + FILTROS_GESTIONES + """
 ORDER BY fecha_ingreso DESC, fecha_estado DESC
 LIMIT @limit OFFSET @offset
 """
 
+# Export completo (job export_gestiones): mismas columnas y filtros que la grilla, sin paginar.
+EXPORT_GESTIONES = """
+SELECT""" + COLUMNAS_LISTA + """
+FROM `{gestiones}`
+WHERE is_deleted = FALSE
+  AND""" + FILTROS_GESTIONES + """
+ORDER BY fecha_ingreso DESC, fecha_estado DESC
+"""
+
+# Delta sync: filas con updated_at posterior al watermark (keyset por updated_at, id_gestion).
+# El rango sobre updated_at va solo en el WHERE para que BigQuery pode particiones/bloques.
+# vigente = FALSE -> el cliente la trata como tombstone (borrada o ya no entra en el filtro).
+_CHANGES_CALIENTE = """
+SELECT""" + COLUMNAS_LISTA + """,
+  updated_at,
+  (is_deleted = FALSE AND""" + FILTROS_GESTIONES + """) AS vigente
+FROM `{gestiones}`
+WHERE updated_at >= @since
+  AND updated_at <= @hasta
+  AND (updated_at > @since OR id_gestion > @since_id)
+"""
+
+# Las archivadas salen de la tabla caliente sin tocar updated_at: van como tombstone
+# con archivado_at como clave del keyset (poda por la partición del archivo).
+_CHANGES_ARCHIVADAS = """
+SELECT""" + COLUMNAS_LISTA + """,
+  archivado_at AS updated_at,
+  FALSE AS vigente
+FROM `{archivo}`
+WHERE archivado_at >= @since
+  AND archivado_at <= @hasta
+  AND (archivado_at > @since OR id_gestion > @since_id)
+"""
+
+CHANGES_GESTIONES = _CHANGES_CALIENTE + """ORDER BY updated_at, id_gestion
+LIMIT @limit
+"""
+
+CHANGES_GESTIONES_CON_ARCHIVO = """
+SELECT * FROM (""" + _CHANGES_CALIENTE + """  UNION ALL""" + _CHANGES_ARCHIVADAS + """)
+ORDER BY updated_at, id_gestion
+LIMIT @limit
+"""
+
+# Mapa: agregados por celda de grilla (lat/lon en grados, tamaño @celda) dentro del bbox.
+# Mismos filtros que LIST_GESTIONES.
+MAPA_CLUSTERS = """
+SELECT
+  CAST(FLOOR(lon_f / @celda) AS INT64) AS cx,
+  CAST(FLOOR(lat_f / @celda) AS INT64) AS cy,
+  COUNT(1) AS cantidad,
+  AVG(lat_f) AS lat,
+  AVG(lon_f) AS lon,
+  APPROX_TOP_COUNT(estado, 1)[SAFE_OFFSET(0)].value AS estado_dominante,
+  APPROX_TOP_COUNT(urgencia, 1)[SAFE_OFFSET(0)].value AS urgencia_dominante
+FROM (
+  SELECT
+    CAST(lat AS FLOAT64) AS lat_f,
+    CAST(lon AS FLOAT64) AS lon_f,
+    estado,
+    urgencia
+  FROM `{gestiones}`
+  WHERE is_deleted = FALSE
+    AND lat IS NOT NULL AND lon IS NOT NULL
+    AND lat BETWEEN @min_lat AND @max_lat
+    AND lon BETWEEN @min_lon AND @max_lon
+    AND""" + FILTROS_GESTIONES + """
+)
+GROUP BY cx, cy
+ORDER BY cantidad DESC
+LIMIT @limit
+"""
+
+MAPA_PUNTOS = """
+SELECT
+  id_gestion,
+  CAST(lat AS FLOAT64) AS lat,
+  CAST(lon AS FLOAT64) AS lon,
+  estado,
+  urgencia,
+  departamento,
+  localidad,
+  SUBSTR(detalle, 1, 140) AS detalle
+FROM `{gestiones}`
+WHERE is_deleted = FALSE
+  AND lat IS NOT NULL AND lon IS NOT NULL
+  AND lat BETWEEN @min_lat AND @max_lat
+  AND lon BETWEEN @min_lon AND @max_lon
+  AND""" + FILTROS_GESTIONES + """
+ORDER BY fecha_ingreso DESC
+LIMIT @limit
+"""
+
 GET_GESTION = """
 SELECT
   id_gestion,
@@ -142,6 +218,39 @@ WHERE id_gestion = @id_gestion
 LIMIT 1
 """
 
+# Réplica local (app/replica.py): mismas columnas que GET_GESTION.
+COLUMNAS_REPLICA = """
+  id_gestion, nro_expediente, origen,
+  estado, fecha_ingreso, fecha_estado, fecha_finalizacion,
+  urgencia,
+  ministerio_agencia_id, organismo_id, derivado_a_id,
+  categoria_general_id, subcategoria_id, tipo_demanda_principal_id, subtipo_detalle,
+  detalle, observaciones,
+  geo_id, departamento, localidad, direccion, lat, lon,
+  costo_estimado, costo_moneda,
+  created_at, created_by, updated_at, updated_by,
+  tipo_gestion, canal_origen
+"""
+
+# Carga inicial: todas las vigentes (sin watermark: filas viejas pueden no tener updated_at).
+REPLICA_SEED = """
+SELECT""" + COLUMNAS_REPLICA + """
+FROM `{gestiones}`
+WHERE is_deleted = FALSE
+"""
+
+# Tail: mismo keyset que CHANGES_GESTIONES, incluye borradas para aplicarlas.
+REPLICA_CAMBIOS = """
+SELECT""" + COLUMNAS_REPLICA + """,
+  is_deleted
+FROM `{gestiones}`
+WHERE updated_at >= @since
+  AND updated_at <= @hasta
+  AND (updated_at > @since OR id_gestion > @since_id)
+ORDER BY updated_at, id_gestion
+LIMIT @limit
+"""
+
 LIST_EVENTOS = """
 SELECT
   id_evento,
@@ -159,7 +268,9 @@ SELECT
   metadata_json
 FROM `{eventos}`
 WHERE id_gestion = @id_gestion
-ORDER BY fecha_evento DESC
+  AND (@cursor_ts IS NULL OR fecha_evento < @cursor_ts OR (fecha_evento = @cursor_ts AND id_evento < @cursor_id))
+ORDER BY fecha_evento DESC, id_evento DESC
+LIMIT @limit
 """
 
 GET_GEO = """
@@ -281,6 +392,124 @@ WHERE id_gestion = @id_gestion
   AND is_deleted = FALSE
 """
 
+# Journal de escrituras (JOURNAL_ENABLED): el committer aplica un lote de altas y
+# cambios de estado en un solo script y una transacción. Cada sentencia es
+# idempotente (NOT EXISTS por id_gestion / id_evento): reintentar un lote que
+# sí se aplicó (timeout del lado del cliente) no duplica nada. El script se arma
+# solo con las sentencias que tienen filas (UNNEST de un array vacío no tipa).
+# @desde = fecha_evento más vieja del lote: poda particiones de eventos.
+# updated_at se fija al aplicar, no al encolar: una entrada que esperó reintentos
+# no puede quedar detrás del watermark de /gestiones/changes (ni de la réplica).
+JOURNAL_LOTE = """
+BEGIN TRANSACTION;
+{sentencias}
+COMMIT TRANSACTION;
+"""
+
+JOURNAL_ALTAS = """
+INSERT INTO `{gestiones}` (
+  id_gestion, nro_expediente, origen,
+  estado, fecha_ingreso, fecha_estado, fecha_finalizacion,
+  urgencia,
+  ministerio_agencia_id, organismo_id, derivado_a_id,
+  categoria_general_id, subcategoria_id, tipo_demanda_principal_id, subtipo_detalle,
+  detalle, observaciones,
+  geo_id, departamento, localidad, direccion, lat, lon,
+  costo_estimado, costo_moneda,
+  created_at, created_by, updated_at, updated_by,
+  is_deleted,
+  tipo_gestion, canal_origen
+)
+SELECT
+  a.id_gestion, a.nro_expediente, a.origen,
+  a.estado, a.fecha_ingreso, a.fecha_estado, a.fecha_finalizacion,
+  a.urgencia,
+  a.ministerio_agencia_id, a.organismo_id, a.derivado_a_id,
+  a.categoria_general_id, a.subcategoria_id, a.tipo_demanda_principal_id, a.subtipo_detalle,
+  a.detalle, a.observaciones,
+  a.geo_id, a.departamento, a.localidad, a.direccion, a.lat, a.lon,
+  a.costo_estimado, a.costo_moneda,
+  a.created_at, a.created_by, CURRENT_TIMESTAMP(), a.updated_by,
+  FALSE,
+  a.tipo_gestion, a.canal_origen
+FROM UNNEST(@altas) a
+WHERE NOT EXISTS (SELECT 1 FROM `{gestiones}` g WHERE g.id_gestion = a.id_gestion);
+"""
+
+# Un cambio por gestión (el último del lote; los eventos van todos). Se salta si
+# su evento ya está: el lote se aplicó antes y la fila pudo cambiar después.
+JOURNAL_ESTADOS = """
+UPDATE `{gestiones}` g
+SET
+  estado = c.nuevo_estado,
+  fecha_estado = c.fecha_estado,
+  derivado_a_id = c.derivado_a_id,
+  updated_at = CURRENT_TIMESTAMP(),
+  updated_by = c.updated_by
+FROM (
+  SELECT c.*
+  FROM UNNEST(@estados) c
+  WHERE NOT EXISTS (
+    SELECT 1 FROM `{eventos}` x
+    WHERE x.fecha_evento >= @desde AND x.id_evento = c.id_evento
+  )
+) c
+WHERE g.id_gestion = c.id_gestion
+  AND g.is_deleted = FALSE;
+"""
+
+JOURNAL_EVENTOS = """
+INSERT INTO `{eventos}` (
+  id_evento, id_gestion, fecha_evento, usuario, rol_usuario, tipo_evento,
+  estado_anterior, estado_nuevo, campo_modificado, valor_anterior, valor_nuevo,
+  comentario, metadata_json
+)
+SELECT
+  e.id_evento, e.id_gestion, e.fecha_evento, e.usuario, e.rol_usuario, e.tipo_evento,
+  e.estado_anterior, e.estado_nuevo, e.campo_modificado, e.valor_anterior, e.valor_nuevo,
+  e.comentario, PARSE_JSON(e.metadata_json)
+FROM UNNEST(@eventos) e
+WHERE NOT EXISTS (
+  SELECT 1 FROM `{eventos}` x
+  WHERE x.fecha_evento >= @desde AND x.id_evento = e.id_evento
+);
+"""
+
+# Edición (PATCH): un solo job. {campos} = "col = @v_col, ..." solo con las
+# columnas que cambiaron (nombres de una lista fija en el router, nunca del
+# cliente). Control optimista por updated_at: si alguien escribió entre la
+# lectura y este UPDATE no se toca nada y afectados = 0.
+# @cambios: ARRAY<STRUCT<campo, valor_anterior, valor_nuevo>>, un evento por campo.
+UPDATE_GESTION = """
+DECLARE afectados INT64 DEFAULT 0;
+
+UPDATE `{gestiones}`
+SET
+  {campos},
+  updated_at = @updated_at,
+  updated_by = @updated_by
+WHERE id_gestion = @id_gestion
+  AND is_deleted = FALSE
+  AND (updated_at = @updated_at_leido OR (updated_at IS NULL AND @updated_at_leido IS NULL));
+
+SET afectados = @@row_count;
+
+IF afectados > 0 THEN
+  INSERT INTO `{eventos}` (
+    id_evento, id_gestion, fecha_evento, usuario, rol_usuario, tipo_evento,
+    estado_anterior, estado_nuevo, campo_modificado, valor_anterior, valor_nuevo,
+    comentario, metadata_json
+  )
+  SELECT
+    GENERATE_UUID(), @id_gestion, @updated_at, @usuario, @rol_usuario, 'EDICION',
+    NULL, NULL, c.campo, c.valor_anterior, c.valor_nuevo,
+    NULL, PARSE_JSON(@metadata_json)
+  FROM UNNEST(@cambios) AS c;
+END IF;
+
+SELECT afectados;
+"""
+
 DELETE_GESTION = """
 UPDATE `{gestiones}`
 SET
@@ -333,3 +562,111 @@ VALUES (
   PARSE_JSON(@metadata_json)
 )
 """
+
+# Índice de similares (detalle por localidad) para detectar duplicados
+SIMILARES_SEED = """
+SELECT
+  id_gestion,
+  departamento,
+  localidad,
+  detalle,
+  estado,
+  fecha_ingreso,
+  canal_origen
+FROM `{gestiones}`
+WHERE is_deleted = FALSE
+  AND fecha_ingreso >= DATE_SUB(CURRENT_DATE(), INTERVAL @dias DAY)
+"""
+
+# Índice de sugerencias del buscador (type-ahead)
+SUGERENCIAS_SEED = """
+SELECT
+  id_gestion,
+  nro_expediente,
+  departamento,
+  localidad,
+  detalle
+FROM `{gestiones}`
+WHERE is_deleted = FALSE
+"""
+
+# -------------------------
+# ARCHIVO (gestiones terminadas / borradas)
+# -------------------------
+
+# Columnas de gestiones que se copian al archivo y se leen con GESTIONES_CON_ARCHIVO.
+# Por nombre, no por posición: una columna nueva en gestiones no corre las demás.
+# Si la columna nueva se tiene que archivar: agregarla acá y en el archivo
+# (ALTER TABLE gestiones_archivo ADD COLUMN ...).
+COLUMNAS_ARCHIVO = """
+  id_gestion, nro_expediente, origen,
+  estado, fecha_ingreso, fecha_estado, fecha_finalizacion,
+  urgencia,
+  ministerio_agencia_id, organismo_id, derivado_a_id,
+  categoria_general_id, subcategoria_id, tipo_demanda_principal_id, subtipo_detalle,
+  detalle, observaciones,
+  geo_id, departamento, localidad, direccion, lat, lon,
+  costo_estimado, costo_moneda,
+  created_at, created_by, updated_at, updated_by,
+  is_deleted,
+  tipo_gestion, canal_origen
+"""
+
+# Mueve a gestiones_archivo, en lotes de @lote ids (cada lote en su transacción),
+# las gestiones en @estados o borradas sin cambios desde hace @dias días (sin
+# updated_at, datos viejos: cuenta el alta).
+# Los eventos quedan en gestiones_eventos: el timeline sigue funcionando.
+# La tabla se crea con COLUMNAS_ARCHIVO + archivado_at (partición).
+ARCHIVAR_GESTIONES = """
+DECLARE corte TIMESTAMP DEFAULT TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL @dias DAY);
+DECLARE lote ARRAY<STRING>;
+DECLARE movidas INT64 DEFAULT 0;
+DECLARE lotes INT64 DEFAULT 0;
+
+CREATE TABLE IF NOT EXISTS `{archivo}`
+PARTITION BY DATE(archivado_at)
+AS SELECT""" + COLUMNAS_ARCHIVO + """, CURRENT_TIMESTAMP() AS archivado_at FROM `{gestiones}` WHERE FALSE;
+
+LOOP
+  SET lote = ARRAY(
+    SELECT id_gestion
+    FROM `{gestiones}`
+    WHERE (is_deleted = TRUE OR estado IN UNNEST(@estados))
+      AND COALESCE(updated_at, created_at, TIMESTAMP(fecha_ingreso)) < corte
+    ORDER BY id_gestion
+    LIMIT @lote
+  );
+  IF ARRAY_LENGTH(lote) = 0 OR lotes >= @max_lotes THEN
+    LEAVE;
+  END IF;
+
+  BEGIN TRANSACTION;
+  INSERT INTO `{archivo}` (""" + COLUMNAS_ARCHIVO + """, archivado_at)
+  SELECT""" + COLUMNAS_ARCHIVO + """, CURRENT_TIMESTAMP()
+  FROM `{gestiones}`
+  WHERE id_gestion IN UNNEST(lote);
+  DELETE FROM `{gestiones}` WHERE id_gestion IN UNNEST(lote);
+  COMMIT TRANSACTION;
+
+  SET movidas = movidas + ARRAY_LENGTH(lote);
+  SET lotes = lotes + 1;
+END LOOP;
+
+SELECT movidas, lotes, corte;
+"""
+
+# incluir_archivo=true: reemplaza a FROM `{gestiones}` en COUNT/LIST/GET.
+# Columnas explícitas en ambas ramas: el UNION ALL empareja por posición.
+GESTIONES_CON_ARCHIVO = """(
+  SELECT""" + COLUMNAS_ARCHIVO + """FROM `{gestiones}`
+  UNION ALL
+  SELECT""" + COLUMNAS_ARCHIVO + """FROM `{archivo}`
+)"""
+
+# Réplica: ids archivados desde el último chequeo (salen de la réplica).
+REPLICA_ARCHIVADAS = """
+SELECT id_gestion, archivado_at
+FROM `{archivo}`
+WHERE archivado_at > @since
+ORDER BY archivado_at
+"""
@@ -0,0 +1,122 @@
+# app/sql_reportes.py
+# Tiempo en cada estado, a partir de gestiones_eventos.
+#
+# gestiones_tiempos_estado tiene una fila por permanencia en un estado: desde el
+# evento que lo fijó (CREACION o CAMBIO_ESTADO) hasta el CAMBIO_ESTADO que lo dejó.
+# Está particionada por fecha de salida, así el refresco incremental solo borra y
+# recalcula las particiones desde la última materializada.
+
+# Un solo job (script). Crea la tabla si no existe, recalcula desde @desde o, si
+# viene NULL, desde el último día materializado (inclusive: puede estar a medias).
+REFRESH_TIEMPOS_ESTADO = """
+DECLARE desde DATE;
+DECLARE filas INT64 DEFAULT 0;
+
+CREATE TABLE IF NOT EXISTS `{tiempos}` (
+  id_gestion STRING,
+  estado STRING,
+  estado_siguiente STRING,
+  fecha_entrada TIMESTAMP,
+  fecha_salida TIMESTAMP,
+  duracion_s INT64,
+  ministerio_agencia_id STRING,
+  departamento STRING,
+  id_evento_salida STRING,
+  calculado_at TIMESTAMP
+)
+PARTITION BY DATE(fecha_salida)
+CLUSTER BY ministerio_agencia_id, departamento;
+
+SET desde = COALESCE(
+  @desde,
+  (SELECT MAX(DATE(fecha_salida)) FROM `{tiempos}`),
+  DATE '1970-01-01'
+);
+
+DELETE FROM `{tiempos}` WHERE DATE(fecha_salida) >= desde;
+
+INSERT INTO `{tiempos}` (
+  id_gestion, estado, estado_siguiente, fecha_entrada, fecha_salida, duracion_s,
+  ministerio_agencia_id, departamento, id_evento_salida, calculado_at
+)
+WITH afectadas AS (
+  SELECT DISTINCT id_gestion
+  FROM `{eventos}`
+  WHERE tipo_evento = 'CAMBIO_ESTADO'
+    AND fecha_evento >= TIMESTAMP(desde)
+),
+secuencia AS (
+  SELECT
+    e.id_gestion,
+    e.id_evento,
+    e.tipo_evento,
+    e.fecha_evento,
+    e.estado_anterior,
+    e.estado_nuevo,
+    LAG(e.fecha_evento) OVER w AS fecha_entrada,
+    LAG(e.estado_nuevo) OVER w AS estado_previo
+  FROM `{eventos}` e
+  JOIN afectadas a ON a.id_gestion = e.id_gestion
+  WHERE e.tipo_evento IN ('CREACION', 'CAMBIO_ESTADO')
+  WINDOW w AS (PARTITION BY e.id_gestion ORDER BY e.fecha_evento, e.id_evento)
+)
+SELECT
+  s.id_gestion,
+  COALESCE(s.estado_anterior, s.estado_previo) AS estado,
+  s.estado_nuevo AS estado_siguiente,
+  s.fecha_entrada,
+  s.fecha_evento AS fecha_salida,
+  TIMESTAMP_DIFF(s.fecha_evento, s.fecha_entrada, SECOND) AS duracion_s,
+  g.ministerio_agencia_id,
+  g.departamento,
+  s.id_evento AS id_evento_salida,
+  CURRENT_TIMESTAMP() AS calculado_at
+FROM secuencia s
+LEFT JOIN `{gestiones}` g ON g.id_gestion = s.id_gestion
+WHERE s.tipo_evento = 'CAMBIO_ESTADO'
+  AND s.fecha_entrada IS NOT NULL
+  AND s.fecha_evento >= TIMESTAMP(desde);
+
+SET filas = @@row_count;
+
+SELECT desde, filas;
+"""
+
+# Distribución de duraciones por transición (en días). El filtro por
+# fecha_salida poda particiones; ministerio/departamento usan el clustering.
+# @por_ministerio / @por_departamento agregan esa dimensión al agrupamiento.
+TIEMPOS_ESTADO = """
+SELECT
+  estado,
+  estado_siguiente,
+  ministerio_agencia_id,
+  departamento,
+  cantidad,
+  ROUND(promedio_s / 86400, 2) AS dias_promedio,
+  ROUND(q[OFFSET(50)] / 86400, 2) AS dias_p50,
+  ROUND(q[OFFSET(90)] / 86400, 2) AS dias_p90,
+  ROUND(max_s / 86400, 2) AS dias_max
+FROM (
+  SELECT
+    estado,
+    estado_siguiente,
+    IF(@por_ministerio, ministerio_agencia_id, NULL) AS ministerio_agencia_id,
+    IF(@por_departamento, departamento, NULL) AS departamento,
+    COUNT(1) AS cantidad,
+    AVG(duracion_s) AS promedio_s,
+    APPROX_QUANTILES(duracion_s, 100) AS q,
+    MAX(duracion_s) AS max_s
+  FROM `{tiempos}`
+  WHERE fecha_salida >= @desde
+    AND fecha_salida < @hasta
+    AND (@ministerio IS NULL OR @ministerio = '' OR ministerio_agencia_id = @ministerio)
+    AND (@departamento IS NULL OR @departamento = '' OR UPPER(TRIM(departamento)) = UPPER(TRIM(@departamento)))
+  GROUP BY 1, 2, 3, 4
+)
+ORDER BY cantidad DESC
+"""
+
+ULTIMO_CALCULO_TIEMPOS = """
+SELECT MAX(calculado_at) AS calculado_at, MAX(fecha_salida) AS ultima_salida
+FROM `{tiempos}`
+"""
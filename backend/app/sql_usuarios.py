@@ -1,49 +1,164 @@
 # app/sql_usuarios.py
 
+# Lookup de autorización (cada request autenticada).
+# Normalizamos 'activo' a BOOL:
+# - si activo ya es BOOL -> SAFE_CAST(activo AS BOOL) funciona
+# - si activo es STRING ("true"/"false") -> SAFE_CAST da NULL, entonces usamos LOWER(...) = "true"
+GET_USUARIO_AUTH = """
+SELECT
+  email,
+  nombre,
+  rol,
+  CASE
+    WHEN SAFE_CAST(activo AS BOOL) IS NOT NULL THEN SAFE_CAST(activo AS BOOL)
+    WHEN LOWER(CAST(activo AS STRING)) = "true" THEN TRUE
+    ELSE FALSE
+  END AS activo
+FROM `{usuarios_roles}`
+WHERE LOWER(email) = LOWER(@email)
+LIMIT 1
+"""
+
 LIST_USUARIOS = """
 SELECT
   email, nombre, rol, activo,
-  created_at, created_by, updated_at, updated_by
+  created_at, created_by, updated_at, updated_by,
+  COUNT(1) OVER () AS total
 FROM `{usuarios_roles}`
+WHERE (
+    @q IS NULL OR @q = '' OR
+    CONTAINS_SUBSTR(LOWER(email), LOWER(@q)) OR
+    CONTAINS_SUBSTR(LOWER(COALESCE(nombre, '')), LOWER(@q))
+  )
+  AND (@rol IS NULL OR @rol = '' OR rol = @rol)
 ORDER BY activo DESC, rol, email
+LIMIT @limit OFFSET @offset
 """
 
-EXISTS_USUARIO = """
-SELECT COUNT(1) AS c
+COUNT_USUARIOS = """
+SELECT COUNT(1) AS total
 FROM `{usuarios_roles}`
-WHERE LOWER(email) = LOWER(@email)
+WHERE (
+    @q IS NULL OR @q = '' OR
+    CONTAINS_SUBSTR(LOWER(email), LOWER(@q)) OR
+    CONTAINS_SUBSTR(LOWER(COALESCE(nombre, '')), LOWER(@q))
+  )
+  AND (@rol IS NULL OR @rol = '' OR rol = @rol)
 """
 
-INSERT_USUARIO = """
-INSERT INTO `{usuarios_roles}`
-(email, nombre, rol, activo, created_at, created_by, updated_at, updated_by)
-VALUES
-(@email, @nombre, @rol, @activo, CURRENT_TIMESTAMP(), @actor, CURRENT_TIMESTAMP(), @actor)
+# Alta: un solo job (script). Si el email ya existe no inserta nada -> afectados = 0.
+CREATE_USUARIO = """
+DECLARE afectados INT64 DEFAULT 0;
+
+MERGE `{usuarios_roles}` T
+USING (SELECT LOWER(@email) AS email) S
+ON LOWER(T.email) = S.email
+WHEN NOT MATCHED THEN
+  INSERT (email, nombre, rol, activo, created_at, created_by, updated_at, updated_by)
+  VALUES (S.email, @nombre, @rol, @activo, CURRENT_TIMESTAMP(), @actor, CURRENT_TIMESTAMP(), @actor);
+
+SET afectados = @@row_count;
+
+IF afectados > 0 THEN
+  INSERT INTO `{usuarios_eventos}`
+  (id_evento, ts_evento, actor_email, tipo_evento, usuario_email, payload_json)
+  VALUES
+  (@id_evento, CURRENT_TIMESTAMP(), @actor, 'CREACION', LOWER(@email), @payload_json);
+END IF;
+
+SELECT afectados;
 """
 
+# Edición: un solo job (script). afectados = 0 -> el usuario no existe.
 UPDATE_USUARIO = """
-UPDATE `{usuarios_roles}`
-SET
-  nombre = COALESCE(@nombre, nombre),
-  rol = COALESCE(@rol, rol),
-  activo = COALESCE(@activo, activo),
+DECLARE afectados INT64 DEFAULT 0;
+
+MERGE `{usuarios_roles}` T
+USING (SELECT LOWER(@email) AS email) S
+ON LOWER(T.email) = S.email
+WHEN MATCHED THEN UPDATE SET
+  nombre = COALESCE(@nombre, T.nombre),
+  rol = COALESCE(@rol, T.rol),
+  activo = COALESCE(@activo, T.activo),
   updated_at = CURRENT_TIMESTAMP(),
-  updated_by = @actor
-WHERE LOWER(email) = LOWER(@email)
+  updated_by = @actor;
+
+SET afectados = @@row_count;
+
+IF afectados > 0 THEN
+  INSERT INTO `{usuarios_eventos}`
+  (id_evento, ts_evento, actor_email, tipo_evento, usuario_email, payload_json)
+  VALUES
+  (@id_evento, CURRENT_TIMESTAMP(), @actor, 'EDICION', LOWER(@email), @payload_json);
+END IF;
+
+SELECT afectados;
 """
 
 DISABLE_USUARIO = """
+DECLARE afectados INT64 DEFAULT 0;
+
 UPDATE `{usuarios_roles}`
 SET
   activo = FALSE,
   updated_at = CURRENT_TIMESTAMP(),
   updated_by = @actor
-WHERE LOWER(email) = LOWER(@email)
+WHERE LOWER(email) = LOWER(@email);
+
+SET afectados = @@row_count;
+
+IF afectados > 0 THEN
+  INSERT INTO `{usuarios_eventos}`
+  (id_evento, ts_evento, actor_email, tipo_evento, usuario_email, payload_json)
+  VALUES
+  (@id_evento, CURRENT_TIMESTAMP(), @actor, 'DESHABILITAR', LOWER(@email), @payload_json);
+END IF;
+
+SELECT afectados;
 """
 
-INSERT_USUARIO_EVENTO = """
+# Alta masiva: un MERGE (upsert) + un único INSERT con todos los eventos.
+# @usuarios: ARRAY<STRUCT<email, nombre, rol, activo>> sin emails repetidos.
+# activo NULL = sin cambios (como UPDATE_USUARIO); en altas nuevas, TRUE.
+BULK_UPSERT_USUARIOS = """
+CREATE TEMP TABLE entrada AS
+SELECT
+  LOWER(TRIM(u.email)) AS email,
+  u.nombre,
+  u.rol,
+  u.activo,
+  EXISTS(
+    SELECT 1 FROM `{usuarios_roles}` r
+    WHERE LOWER(r.email) = LOWER(TRIM(u.email))
+  ) AS existia
+FROM UNNEST(@usuarios) AS u;
+
+MERGE `{usuarios_roles}` T
+USING entrada S
+ON LOWER(T.email) = S.email
+WHEN MATCHED THEN UPDATE SET
+  nombre = COALESCE(S.nombre, T.nombre),
+  rol = S.rol,
+  activo = COALESCE(S.activo, T.activo),
+  updated_at = CURRENT_TIMESTAMP(),
+  updated_by = @actor
+WHEN NOT MATCHED THEN
+  INSERT (email, nombre, rol, activo, created_at, created_by, updated_at, updated_by)
+  VALUES (S.email, S.nombre, S.rol, COALESCE(S.activo, TRUE), CURRENT_TIMESTAMP(), @actor, CURRENT_TIMESTAMP(), @actor);
+
 INSERT INTO `{usuarios_eventos}`
 (id_evento, ts_evento, actor_email, tipo_evento, usuario_email, payload_json)
-VALUES
-(@id_evento, CURRENT_TIMESTAMP(), @actor_email, @tipo_evento, @usuario_email, @payload_json)
+SELECT
+  GENERATE_UUID(),
+  CURRENT_TIMESTAMP(),
+  @actor,
+  IF(existia, 'EDICION', 'CREACION'),
+  email,
+  TO_JSON_STRING(STRUCT(email, nombre, rol, IF(existia, activo, COALESCE(activo, TRUE)) AS activo))
+FROM entrada;
+
+SELECT
+  COUNTIF(NOT existia) AS creados,
+  COUNTIF(existia) AS actualizados
+FROM entrada;
 """
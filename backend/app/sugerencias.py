@@ -0,0 +1,213 @@
+# app/sugerencias.py
+"""
+Índice de prefijos en memoria para el type-ahead del buscador de gestiones.
+
+Arreglo ordenado de claves normalizadas (texto.normalizar) con búsqueda por
+bisect: un prefijo es el rango [bisect_left(p), primera clave que no empieza
+con p). Entran nro_expediente, id_gestion, localidades y los términos del
+detalle, cada uno con su frecuencia (cuántas gestiones vigentes lo aportan).
+
+- Carga completa con SUGERENCIAS_SEED (warm-up o primer uso), re-carga en
+  background cada `sugerencias_ttl_s` para traer lo de otros workers.
+- Cambios incrementales por los eventos del bus: cada gestión recuerda sus
+  aportes; al cambiar o borrarse se descuentan y una clave que llega a cero
+  sale del arreglo (insort / del: sin reordenar todo).
+"""
+import bisect
+import logging
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .config import settings
+from .pubsub import bus
+from .texto import normalizar
+
+log = logging.getLogger(__name__)
+
+# orden de aparición a igual coincidencia
+TIPOS = ("expediente", "id", "localidad", "termino")
+
+_PALABRA = re.compile(r"\w+")
+_STOPWORDS = frozenset("""
+    para pero como este esta estos estas desde hasta entre sobre tiene tienen
+    hace hacen donde cuando porque sino tambien muy solo luego falta mismo misma
+    calle frente altura
+""".split())
+
+_Entrada = Tuple[str, int, str]  # (clave normalizada, índice en TIPOS, texto a mostrar)
+
+
+def _aportes(fila: Dict[str, Any]) -> List[_Entrada]:
+    out: List[_Entrada] = []
+    for tipo, valor in (("expediente", fila.get("nro_expediente")), ("id", fila.get("id_gestion"))):
+        if valor:
+            out.append((normalizar(str(valor)), TIPOS.index(tipo), str(valor)))
+    if fila.get("localidad"):
+        out.append((normalizar(fila["localidad"]), TIPOS.index("localidad"), fila["localidad"].strip()))
+
+    vistos = set()
+    for palabra in _PALABRA.findall((fila.get("detalle") or "").casefold()):
+        clave = normalizar(palabra)
+        if len(clave) < 4 or clave.isdigit() or clave in _STOPWORDS or clave in vistos:
+            continue
+        vistos.add(clave)
+        out.append((clave, TIPOS.index("termino"), palabra))
+    return [e for e in out if e[0]]
+
+
+class IndiceSugerencias:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._claves: List[_Entrada] = []
+        self._conteo: Dict[_Entrada, int] = {}
+        self._por_gestion: Dict[str, List[_Entrada]] = {}
+        self._cargado: Optional[float] = None
+        self._cargando = False
+        self._durante_carga: List[Dict[str, Any]] = []
+        self.consultas = 0
+        self.errores = 0
+        self.ultimo_error: Optional[str] = None
+
+    # -------------------------
+    # mantenimiento
+    # -------------------------
+    def _sumar(self, entrada: _Entrada, n: int) -> None:
+        # con el lock tomado
+        antes = self._conteo.get(entrada, 0)
+        despues = antes + n
+        if despues > 0:
+            self._conteo[entrada] = despues
+            if antes == 0:
+                bisect.insort(self._claves, entrada)
+        elif antes > 0:
+            del self._conteo[entrada]
+            i = bisect.bisect_left(self._claves, entrada)
+            if i < len(self._claves) and self._claves[i] == entrada:
+                del self._claves[i]
+
+    def _quitar(self, id_gestion: str) -> None:
+        for e in self._por_gestion.pop(id_gestion, ()):
+            self._sumar(e, -1)
+
+    def _agregar(self, fila: Dict[str, Any]) -> None:
+        self._quitar(fila["id_gestion"])
+        aportes = _aportes(fila)
+        self._por_gestion[fila["id_gestion"]] = aportes
+        for e in aportes:
+            self._sumar(e, 1)
+
+    def _aplicar(self, evento: Dict[str, Any]) -> None:
+        if evento.get("tipo") == "eliminada":
+            self._quitar(evento["id_gestion"])
+        elif evento.get("gestion"):
+            self._agregar(evento["gestion"])
+
+    def _oyente(self, evento: Dict[str, Any]) -> None:
+        with self._lock:
+            self._aplicar(evento)
+            if self._cargando:
+                self._durante_carga.append(evento)
+
+    def cargar(self) -> None:
+        from .bq import fqtn, run_query
+        from . import sql_gestiones as Q
+
+        with self._lock:
+            if self._cargando:
+                return
+            self._cargando = True
+            self._durante_carga = []
+        try:
+            t0 = time.perf_counter()
+            rows = run_query(Q.SUGERENCIAS_SEED.format(gestiones=fqtn("infra_gestion.gestiones")))
+            conteo: Dict[_Entrada, int] = {}
+            por_gestion: Dict[str, List[_Entrada]] = {}
+            for r in rows:
+                aportes = _aportes(dict(r))
+                por_gestion[r["id_gestion"]] = aportes
+                for e in aportes:
+                    conteo[e] = conteo.get(e, 0) + 1
+            claves = sorted(conteo)
+            with self._lock:
+                self._claves, self._conteo, self._por_gestion = claves, conteo, por_gestion
+                for evento in self._durante_carga:
+                    self._aplicar(evento)
+                self._cargado = time.monotonic()
+            log.info("sugerencias: %d claves de %d gestiones en %.0f ms",
+                     len(claves), len(por_gestion), (time.perf_counter() - t0) * 1000)
+        except Exception as e:
+            self.errores += 1
+            self.ultimo_error = str(e)
+            raise
+        finally:
+            with self._lock:
+                self._cargando = False
+                self._durante_carga = []
+
+    def _asegurar(self) -> bool:
+        with self._lock:
+            cargado, cargando = self._cargado, self._cargando
+        if cargado is None:
+            try:
+                self.cargar()
+            except Exception as e:
+                log.warning("sugerencias: carga falló: %s", e)
+            return self._cargado is not None
+        if not cargando and time.monotonic() - cargado > settings.sugerencias_ttl_s:
+            def _correr():
+                try:
+                    self.cargar()
+                except Exception as e:
+                    log.warning("sugerencias: re-carga falló: %s", e)
+
+            threading.Thread(target=_correr, name="sugerencias", daemon=True).start()
+        return True
+
+    # -------------------------
+    # consultas
+    # -------------------------
+    def buscar(self, prefix: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Claves que empiezan con `prefix`: exactas primero, después por tipo y frecuencia."""
+        p = normalizar(prefix)
+        if len(p) < settings.sugerencias_min_chars or not self._asegurar():
+            return []
+
+        candidatos = []
+        with self._lock:
+            i = bisect.bisect_left(self._claves, (p,))
+            fin = min(len(self._claves), i + settings.sugerencias_max_escaneo)
+            while i < fin and self._claves[i][0].startswith(p):
+                e = self._claves[i]
+                candidatos.append((e, self._conteo[e]))
+                i += 1
+            self.consultas += 1
+
+        candidatos.sort(key=lambda c: (c[0][0] != p, c[0][1], -c[1], len(c[0][0]), c[0][2]))
+        out, vistos = [], set()
+        for (clave, tipo, texto), n in candidatos:
+            # mismo texto desde dos gestiones con distinta grafía: una sola sugerencia
+            if (clave, tipo) in vistos:
+                continue
+            vistos.add((clave, tipo))
+            out.append({"texto": texto, "tipo": TIPOS[tipo], "gestiones": n})
+            if len(out) >= limit:
+                break
+        return out
+
+    def estado(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "claves": len(self._claves),
+                "gestiones": len(self._por_gestion),
+                "cargado_hace_s": round(time.monotonic() - self._cargado, 1) if self._cargado else None,
+                "cargando": self._cargando,
+                "consultas": self.consultas,
+                "errores": self.errores,
+                "ultimo_error": self.ultimo_error,
+            }
+
+
+sugerencias = IndiceSugerencias()
+bus.escuchar(sugerencias._oyente)
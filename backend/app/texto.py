@@ -0,0 +1,68 @@
+# app/texto.py
+"""
+Normalización de texto libre para comparar y buscar sin importar mayúsculas,
+acentos ni puntuación ("Bache en Av. Belgrano" == "BACHE EN AV BELGRANO"),
+y distancia de edición para tolerar errores de tipeo.
+"""
+import re
+import unicodedata
+from typing import FrozenSet, List, Optional, Set
+
+_NO_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+def normalizar(s: Optional[str]) -> str:
+    """Minúsculas, sin acentos (ñ -> n), solo letras/dígitos separados por un espacio."""
+    if not s:
+        return ""
+    s = unicodedata.normalize("NFKD", s.casefold())
+    s = "".join(c for c in s if not unicodedata.combining(c))
+    return _NO_ALNUM.sub(" ", s).strip()
+
+
+def trigramas(s: Optional[str]) -> FrozenSet[str]:
+    """Trigramas de caracteres del texto normalizado (con borde en cada palabra)."""
+    t = normalizar(s)
+    if not t:
+        return frozenset()
+    t = f" {t} "
+    return frozenset(t[i:i + 3] for i in range(len(t) - 2))
+
+
+def borrados(s: str, max_distancia: int) -> Set[str]:
+    """Variantes de `s` con hasta `max_distancia` caracteres borrados (índice SymSpell), incluida `s`."""
+    out = {s}
+    nivel = {s}
+    for _ in range(max_distancia):
+        siguiente = set()
+        for t in nivel:
+            for i in range(len(t)):
+                siguiente.add(t[:i] + t[i + 1:])
+        siguiente -= out
+        out |= siguiente
+        nivel = siguiente
+    return out
+
+
+def distancia(a: str, b: str, maximo: int) -> int:
+    """
+    Distancia de edición con transposiciones (OSA / Damerau restringida).
+    Corta apenas supera `maximo` y devuelve maximo + 1.
+    """
+    if abs(len(a) - len(b)) > maximo:
+        return maximo + 1
+    if a == b:
+        return 0
+    previa2: List[int] = []
+    previa = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        actual = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            costo = 0 if a[i - 1] == b[j - 1] else 1
+            actual[j] = min(previa[j] + 1, actual[j - 1] + 1, previa[j - 1] + costo)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                actual[j] = min(actual[j], previa2[j - 2] + 1)
+        if min(actual) > maximo:
+            return maximo + 1
+        previa2, previa = previa, actual
+    return min(previa[-1], maximo + 1)
@@ -0,0 +1,208 @@
+# app/tracing.py
+"""
+Tiempos por fase de cada request.
+
+- `TracingMiddleware` (ASGI) abre una traza por request y agrega el header
+  `Server-Timing` con la duración acumulada de cada fase (auth_token,
+  auth_usuario, bq_costo, bq_cola, bq, replica, render) y el total.
+- `phase(nombre)` mide un bloque; `registrar(nombre, s)` suma una duración ya
+  medida. La traza viaja en un ContextVar, así que también se ve desde los
+  endpoints sync (threadpool).
+- OpenTelemetry es opcional (OTEL_ENABLED=true y el paquete instalado): cada
+  request es un span y cada fase un span hijo. Exporta por OTLP al collector
+  (OTEL_EXPORTER=otlp, endpoint según OTEL_EXPORTER_OTLP_ENDPOINT) o a un
+  archivo JSON por línea (OTEL_EXPORTER=archivo, OTEL_ARCHIVO).
+- `perfilar(segundos, hz)`: sampling de los stacks de todos los threads
+  (sys._current_frames) en formato "collapsed" para flame graphs
+  (flamegraph.pl, speedscope).
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from fastapi.responses import JSONResponse
+
+from .config import settings
+
+log = logging.getLogger(__name__)
+
+
+class Traza:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.fases: Dict[str, Tuple[float, int]] = {}
+
+    def sumar(self, nombre: str, segundos: float) -> None:
+        with self._lock:
+            total, n = self.fases.get(nombre, (0.0, 0))
+            self.fases[nombre] = (total + segundos, n + 1)
+
+
+_traza: ContextVar[Optional[Traza]] = ContextVar("traza", default=None)
+
+
+# -------------------------
+# OpenTelemetry (opcional)
+# -------------------------
+_tracer = None
+
+
+def _iniciar_otel() -> None:
+    global _tracer
+    if not settings.otel_enabled:
+        return
+    try:
+        from opentelemetry import trace
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    except ImportError:
+        log.warning("OTEL_ENABLED=true pero opentelemetry-sdk no está instalado: sin spans")
+        return
+
+    if settings.otel_exporter == "otlp":
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError:
+            log.warning("OTEL_EXPORTER=otlp requiere opentelemetry-exporter-otlp-proto-http: sin spans")
+            return
+        exporter = OTLPSpanExporter()
+    else:
+        archivo = open(settings.otel_archivo, "a", encoding="utf-8")
+        exporter = ConsoleSpanExporter(
+            out=archivo,
+            formatter=lambda span: span.to_json(indent=None) + os.linesep,
+        )
+
+    provider = TracerProvider(resource=Resource.create({"service.name": "infra-gestion-api"}))
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    _tracer = trace.get_tracer(__name__)
+
+
+_iniciar_otel()
+
+
+@contextmanager
+def _span(nombre: str, **atributos: Any) -> Iterator[None]:
+    if _tracer is None:
+        yield
+        return
+    with _tracer.start_as_current_span(nombre, attributes=atributos or None):
+        yield
+
+
+# -------------------------
+# fases
+# -------------------------
+@contextmanager
+def phase(nombre: str, **atributos: Any) -> Iterator[None]:
+    traza = _traza.get()
+    if traza is None and _tracer is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        with _span(nombre, **atributos):
+            yield
+    finally:
+        if traza is not None:
+            traza.sumar(nombre, time.perf_counter() - t0)
+
+
+def registrar(nombre: str, segundos: float) -> None:
+    traza = _traza.get()
+    if traza is not None:
+        traza.sumar(nombre, segundos)
+
+
+def _server_timing(traza: Traza, total_s: float) -> bytes:
+    with traza._lock:
+        fases = list(traza.fases.items())
+    partes = [
+        f'{n};dur={t * 1000:.1f}' + (f';desc="x{c}"' if c > 1 else "")
+        for n, (t, c) in fases
+    ]
+    partes.append(f"total;dur={total_s * 1000:.1f}")
+    return ", ".join(partes).encode("latin-1")
+
+
+class TracingMiddleware:
+    """ASGI puro (sin BaseHTTPMiddleware): no bufferiza el body ni rompe el streaming SSE."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.tracing_enabled:
+            await self.app(scope, receive, send)
+            return
+
+        traza = Traza()
+        token = _traza.set(traza)
+        t0 = time.perf_counter()
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", _server_timing(traza, time.perf_counter() - t0)))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            with _span(f"HTTP {scope['method']}", **{"http.method": scope["method"], "http.target": scope["path"]}):
+                await self.app(scope, receive, _send)
+        finally:
+            _traza.reset(token)
+
+
+class TimedJSONResponse(JSONResponse):
+    """default_response_class: mide la serialización a JSON como fase `render`."""
+
+    def render(self, content: Any) -> bytes:
+        with phase("render"):
+            return super().render(content)
+
+
+# -------------------------
+# profiler por muestreo
+# -------------------------
+_perfilando = threading.Lock()
+
+
+def _stack(frame) -> str:
+    partes = []
+    while frame is not None:
+        code = frame.f_code
+        partes.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(partes))
+
+
+def perfilar(segundos: float, hz: int) -> Optional[str]:
+    """
+    Muestrea los stacks de todos los threads (menos el propio) durante `segundos`.
+    Devuelve líneas "frame;frame;... cantidad" o None si ya hay otro perfilado en curso.
+    """
+    if not _perfilando.acquire(blocking=False):
+        return None
+    try:
+        propio = threading.get_ident()
+        muestras: Counter = Counter()
+        intervalo = 1.0 / hz
+        fin = time.monotonic() + segundos
+        while time.monotonic() < fin:
+            nombres = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != propio:
+                    muestras[f"{nombres.get(ident, ident)};{_stack(frame)}"] += 1
+            time.sleep(intervalo)
+        return "\n".join(f"{stack} {n}" for stack, n in muestras.most_common()) + "\n"
+    finally:
+        _perfilando.release()
@@ -0,0 +1,100 @@
+# app/warmup.py
+"""
+Warm-up al arrancar el worker: cliente BigQuery + conexiones HTTP, certs de
+Google, catálogos, geo e índices de similares y sugerencias en memoria.
+/ready responde 503 hasta que termina, así el balanceador no manda tráfico a
+un worker frío.
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+log = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_estado: Dict[str, Any] = {"listo": False, "pasos": {}, "duracion_ms": None}
+
+
+def _bq_client() -> None:
+    from .bq import bq_client
+    bq_client()
+
+
+def _bq_conexiones() -> None:
+    from .bq import bq_client
+    bq_client().query("SELECT 1").result()
+
+
+def _google_certs() -> None:
+    from .auth import google_certs
+    google_certs()
+
+
+def _catalogos() -> None:
+    from .catalogos_cache import catalogos
+    catalogos.precargar(incluir_geo=False)
+
+
+def _geo() -> None:
+    from .geo_matcher import geo_matcher
+    geo_matcher.precargar()  # carga geo en catalogos_cache y arma el índice
+
+
+def _similares() -> None:
+    from .config import settings
+    from .similares import similares
+    if settings.similares_enabled:
+        similares.cargar()
+
+
+def _sugerencias() -> None:
+    from .sugerencias import sugerencias
+    sugerencias.cargar()
+
+
+PASOS: List[Tuple[str, Callable[[], None]]] = [
+    ("bq_client", _bq_client),
+    ("bq_conexiones", _bq_conexiones),
+    ("google_certs", _google_certs),
+    ("catalogos", _catalogos),
+    ("geo", _geo),
+    ("similares", _similares),
+    ("sugerencias", _sugerencias),
+]
+
+
+def ejecutar() -> None:
+    """Corre todos los pasos; un paso que falla se registra y no bloquea el resto."""
+    t_total = time.perf_counter()
+    for nombre, fn in PASOS:
+        t0 = time.perf_counter()
+        try:
+            fn()
+            res = {"ok": True}
+        except Exception as e:
+            res = {"ok": False, "error": str(e)}
+            log.warning("warm-up %s falló: %s", nombre, e)
+        res["ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        log.info("warm-up %s: %.1f ms", nombre, res["ms"])
+        with _lock:
+            _estado["pasos"][nombre] = res
+
+    with _lock:
+        _estado["duracion_ms"] = round((time.perf_counter() - t_total) * 1000, 1)
+        _estado["listo"] = True
+    log.info("warm-up completo en %.1f ms", _estado["duracion_ms"])
+
+
+def marcar_listo() -> None:
+    with _lock:
+        _estado["listo"] = True
+
+
+def estado() -> Dict[str, Any]:
+    with _lock:
+        return {
+            "listo": _estado["listo"],
+            "pasos": dict(_estado["pasos"]),
+            "duracion_ms": _estado["duracion_ms"],
+        }
@@ -0,0 +1,37 @@
+import base64
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from app.deps import decode_cursor, encode_cursor
+
+
+def _b64(raw: str) -> str:
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def test_ida_y_vuelta():
+    ts = datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+    assert decode_cursor(encode_cursor(ts, "G-ñ-1")) == (ts, "G-ñ-1")
+
+
+@pytest.mark.parametrize("cursor", [
+    "",
+    "no-es-base64!",
+    "ñ",
+    _b64("no es json"),
+    base64.urlsafe_b64encode(b"\xff\xfe").decode("ascii"),
+    _b64("{}"),
+    _b64("[]"),
+    _b64('["2024-05-01T12:30:00"]'),
+    _b64('["2024-05-01T12:30:00", "a", "b"]'),
+    _b64('[1714566600, "a"]'),
+    _b64('["2024-05-01T12:30:00", 7]'),
+    _b64('["ayer", "a"]'),
+    _b64("null"),
+])
+def test_cursor_invalido_es_400(cursor):
+    with pytest.raises(HTTPException) as e:
+        decode_cursor(cursor)
+    assert e.value.status_code == 400
@@ -0,0 +1,132 @@
+import time
+from unittest import mock
+
+import pytest
+from google.api_core.exceptions import BadRequest, ServiceUnavailable
+
+from app.config import settings
+from app.journal import _DDL, Journal
+
+
+@pytest.fixture
+def j(tmp_path, monkeypatch):
+    """Journal sobre un archivo nuevo, sin el thread del committer y sin BigQuery."""
+    monkeypatch.setattr(settings, "journal_max_intentos", 2)
+    j = Journal()
+    j._path = tmp_path / "journal.db"
+    j._conn().executescript(_DDL)
+    j._revertidas_hasta = 0
+    j._ejecutar = mock.Mock()
+    return j
+
+
+def _encolar(j, tipo="alta", id_gestion="G1"):
+    fila = [("id_gestion", "STRING", id_gestion)]
+    evento = [("id_evento", "STRING", f"E-{time.monotonic_ns()}"), ("fecha_evento", "TIMESTAMP", None)]
+    return j.encolar(tipo, id_gestion, "u@x", fila, evento)
+
+
+def _estados(j):
+    return [tuple(r) for r in j._conn().execute("SELECT seq, estado FROM escrituras ORDER BY seq")]
+
+
+def _lease_de(j, duenio, vence_en):
+    j._conn().execute(
+        "INSERT OR REPLACE INTO lease (id, duenio, vence) VALUES (1, ?, ?)", (duenio, time.time() + vence_en)
+    )
+
+
+def test_lease_vigente_de_otro_worker(j):
+    _lease_de(j, "otro:1", 60)
+    assert not j._tomar_lease()
+    _lease_de(j, "otro:1", -1)
+    assert j._tomar_lease()
+    assert j._conn().execute("SELECT duenio FROM lease").fetchone()[0] == j._yo
+
+
+def test_aplica_el_lote_en_orden(j):
+    seqs = [_encolar(j, id_gestion=f"G{i}") for i in range(3)]
+    assert j._tomar_lease()
+    assert j._aplicar_lote()
+    assert [r["seq"] for r in j._ejecutar.call_args[0][0]] == seqs
+    assert _estados(j) == [(s, "aplicada") for s in seqs]
+    assert not j._aplicar_lote()
+
+
+def test_lote_sin_lease_no_se_marca(j):
+    seq = _encolar(j)
+    assert j._tomar_lease()
+    # el lote tarda más que journal_lease_s y otro worker toma el lease
+    j._ejecutar.side_effect = lambda filas: _lease_de(j, "otro:1", 60)
+    assert not j._aplicar_lote()
+    assert _estados(j) == [(seq, "pendiente")]
+    assert j.aplicadas == 0
+
+
+def test_loop_deja_de_aplicar_al_perder_el_lease(j, monkeypatch):
+    monkeypatch.setattr(settings, "journal_lote", 1)
+    monkeypatch.setattr(settings, "journal_espera_lote_s", 0)
+    seqs = [_encolar(j, id_gestion=f"G{i}") for i in range(3)]
+    j._tomar_lease()
+    # lo renueva al arrancar la vuelta y lo pierde después del primer lote
+    j._tomar_lease = mock.Mock(side_effect=[True, False])
+    # una sola vuelta del loop: se corta en el wait siguiente
+    j._despertar = mock.Mock(wait=mock.Mock(side_effect=[True, SystemExit]))
+    with pytest.raises(SystemExit):
+        j._loop()
+    assert j._ejecutar.call_count == 1
+    assert _estados(j) == [(seqs[0], "aplicada"), (seqs[1], "pendiente"), (seqs[2], "pendiente")]
+
+
+def test_error_transitorio_aisla_y_no_descarta(j):
+    a, b = _encolar(j, id_gestion="G1"), _encolar(j, id_gestion="G2")
+    assert j._tomar_lease()
+    j._ejecutar.side_effect = ServiceUnavailable("bq")
+    for _ in range(settings.journal_max_intentos + 1):
+        with pytest.raises(ServiceUnavailable):
+            j._aplicar_lote()
+    # después del lote fallido se reintenta de a una entrada
+    assert len(j._ejecutar.call_args[0][0]) == 1
+    assert _estados(j) == [(a, "pendiente"), (b, "pendiente")]
+
+
+def test_error_permanente_descarta_la_alta_y_lo_que_depende(j):
+    oyente = mock.Mock()
+    j.al_descartar(oyente)
+    alta = _encolar(j, "alta", "G1")
+    cambio = _encolar(j, "estado", "G1")
+    otra = _encolar(j, "alta", "G2")
+    assert j._tomar_lease()
+
+    def ejecutar(filas):
+        if any(r["seq"] == alta for r in filas):
+            raise BadRequest("campo inválido")
+
+    j._ejecutar.side_effect = ejecutar
+    with pytest.raises(BadRequest):
+        j._aplicar_lote()   # el lote entero falla (intento 1) -> se aísla
+    assert j._aplicar_lote()  # la alta sola, intento 2 = journal_max_intentos: queda fallida
+    assert _estados(j) == [(alta, "fallida"), (cambio, "fallida"), (otra, "pendiente")]
+
+    assert j._aplicar_lote()
+    assert _estados(j)[-1] == (otra, "aplicada")
+
+    j._revertir_descartadas()
+    oyente.assert_called_once_with("G1")
+    j._revertir_descartadas()
+    oyente.assert_called_once()
+
+
+def test_descarte_sin_lease_no_marca(j):
+    seq = _encolar(j)
+    fila = j._conn().execute("SELECT * FROM escrituras WHERE seq = ?", (seq,)).fetchone()
+    _lease_de(j, "otro:1", 60)
+    assert not j._descartar(fila, BadRequest("x"))
+    assert _estados(j) == [(seq, "pendiente")]
+
+
+def test_iniciar_exige_journal_path(monkeypatch):
+    monkeypatch.setattr(settings, "journal_enabled", True)
+    monkeypatch.setattr(settings, "journal_path", "")
+    with pytest.raises(RuntimeError, match="JOURNAL_PATH"):
+        Journal().iniciar()
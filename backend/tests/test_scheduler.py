@@ -0,0 +1,98 @@
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from app.config import settings
+from app.scheduler import Scheduler
+
+
+@pytest.fixture
+def cupos(monkeypatch):
+    monkeypatch.setattr(settings, "bq_max_concurrentes", 2)
+    monkeypatch.setattr(settings, "bq_max_por_usuario", 1)
+    monkeypatch.setattr(settings, "bq_espera_max_s", 2)
+
+
+def _ocupar(s, user, soltar, adentro, prioritario=False):
+    def correr():
+        with s.turno(user, prioritario=prioritario):
+            adentro.set()
+            soltar.wait(5)
+    t = threading.Thread(target=correr, daemon=True)
+    t.start()
+    assert adentro.wait(2)
+    return t
+
+
+def test_lectura_sobre_cupo_espera_y_pasan_otros_usuarios(cupos):
+    s = Scheduler()
+    a = {"email": "a@x"}
+    soltar, adentro = threading.Event(), threading.Event()
+    t = _ocupar(s, a, soltar, adentro)
+
+    orden = []
+
+    def segunda_de_a():
+        with s.turno(a):
+            orden.append("a")
+
+    segunda = threading.Thread(target=segunda_de_a, daemon=True)
+    segunda.start()
+    time.sleep(0.1)
+    with s.turno({"email": "b@x"}):
+        orden.append("b")
+    assert orden == ["b"]
+    assert s.estado()["esperas_por_cupo_usuario"] == 1
+
+    soltar.set()
+    t.join(2)
+    segunda.join(2)
+    assert orden == ["b", "a"]
+    assert s.estado()["activos"] == 0
+
+
+def test_prioritario_pasa_antes_que_las_lecturas(cupos, monkeypatch):
+    monkeypatch.setattr(settings, "bq_max_concurrentes", 1)
+    s = Scheduler()
+    soltar, adentro = threading.Event(), threading.Event()
+    t = _ocupar(s, None, soltar, adentro, prioritario=True)
+
+    orden = []
+
+    def entrar(nombre, user, prioritario):
+        with s.turno(user, prioritario=prioritario):
+            orden.append(nombre)
+
+    hilos = [threading.Thread(target=entrar, args=("lectura", {"email": "c@x"}, False), daemon=True)]
+    hilos[0].start()
+    time.sleep(0.05)
+    hilos.append(threading.Thread(target=entrar, args=("escritura", None, True), daemon=True))
+    hilos[1].start()
+    time.sleep(0.05)
+
+    soltar.set()
+    for h in [t, *hilos]:
+        h.join(2)
+    assert orden == ["escritura", "lectura"]
+
+
+def test_espera_maxima_responde_429_con_retry_after(cupos, monkeypatch):
+    monkeypatch.setattr(settings, "bq_max_concurrentes", 1)
+    monkeypatch.setattr(settings, "bq_espera_max_s", 0.1)
+    s = Scheduler()
+    soltar, adentro = threading.Event(), threading.Event()
+    t = _ocupar(s, None, soltar, adentro)
+
+    with pytest.raises(HTTPException) as e:
+        with s.turno({"email": "d@x"}):
+            pass
+    assert e.value.status_code == 429
+    assert int(e.value.headers["Retry-After"]) >= 1
+
+    soltar.set()
+    t.join(2)
+    estado = s.estado()
+    assert estado["rechazos_espera"] == 1
+    assert estado["en_cola"] == 0 and estado["lecturas_por_usuario"] == {}
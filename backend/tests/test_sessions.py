@@ -0,0 +1,115 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from app import auth, sessions
+from app.config import settings
+
+
+def _firmado(payload: bytes) -> str:
+    """Token con firma válida sobre un payload arbitrario."""
+    b64 = sessions._b64(payload)
+    return f"{sessions.PREFIJO}{b64}.{sessions._firma(b64)}"
+
+
+def _emitir(email: str, **kw):
+    return sessions.emitir({"email": email, "nombre": "N", "rol": "Admin"}, **kw)
+
+
+@pytest.fixture
+def revocaciones(tmp_path, monkeypatch):
+    """SQLite compartido nuevo, como si fuera el de todos los workers."""
+    path = tmp_path / "revocaciones.db"
+    monkeypatch.setattr(settings, "session_revocaciones_path", str(path))
+    monkeypatch.setattr(sessions, "_db_local", threading.local())
+    monkeypatch.setattr(sessions, "_visto", 0)
+    monkeypatch.setattr(sessions, "_sincronizado", 0.0)
+    return path
+
+
+def test_token_valido():
+    token, claims = _emitir("valido@x")
+    assert sessions.verificar(token)["email"] == "valido@x"
+    assert auth.require_user(f"Bearer {token}") == {"email": "valido@x", "nombre": "N", "rol": "Admin"}
+
+
+@pytest.mark.parametrize("token", [
+    "s1.",
+    "s1.sinpunto",
+    "s1.abc.def",
+    "s1.abc.fírma",                       # firma no-ASCII
+    "s1.pàyload.abc",                     # payload no-ASCII
+    _firmado(b"[1, 2]"),                  # JSON que no es objeto
+    _firmado(b"no es json"),
+    _firmado(b"\xff\xfe"),                # UTF-8 inválido
+    _firmado(b'{"email": "x@x"}'),        # faltan claims
+    _firmado(b'{"email": "x@x", "exp": "manana", "iat": 0, "jti": "j"}'),
+    "s1.%%%." + sessions._firma("%%%"),   # base64 inválido con firma válida
+])
+def test_token_malformado_es_401(token):
+    with pytest.raises(HTTPException) as e:
+        auth.require_session(f"Bearer {token}")
+    assert e.value.status_code == 401
+
+
+def test_firma_de_otro_payload():
+    token, _ = _emitir("firma@x")
+    otro, _ = _emitir("otro@x")
+    falso = token.rsplit(".", 1)[0] + "." + otro.rsplit(".", 1)[1]
+    with pytest.raises(ValueError, match="firma"):
+        sessions.verificar(falso)
+
+
+def test_vencido(monkeypatch):
+    monkeypatch.setattr(settings, "session_ttl_s", -1)
+    token, _ = _emitir("vencido@x")
+    with pytest.raises(ValueError, match="vencido"):
+        sessions.verificar(token)
+
+
+def test_revocar_usuario_no_corta_el_refresh():
+    token, _ = _emitir("rol@x")
+    time.sleep(0.01)
+    sessions.revocar_usuario("ROL@x")
+    with pytest.raises(ValueError, match="revocado"):
+        sessions.verificar(token)
+    assert sessions.verificar(token, refresh=True)["email"] == "rol@x"
+    nuevo, _ = _emitir("rol@x")
+    assert sessions.verificar(nuevo)["email"] == "rol@x"
+
+
+def test_revocar_token_corta_tambien_el_refresh():
+    token, claims = _emitir("logout@x")
+    sessions.revocar_token(claims)
+    with pytest.raises(ValueError, match="revocado"):
+        sessions.verificar(token, refresh=True)
+
+
+def test_revocacion_de_otro_worker(revocaciones):
+    token, claims = _emitir("baja@x")
+    assert sessions.verificar(token)
+    # otro worker escribe en el SQLite compartido
+    conn = sqlite3.connect(revocaciones)
+    with conn:
+        conn.execute(
+            "INSERT INTO revocaciones (tipo, clave, ts) VALUES ('usuario', ?, ?)",
+            ("baja@x", time.time()),
+        )
+    conn.close()
+    # se relee como mucho una vez por segundo
+    sessions._sincronizado = 0.0
+    with pytest.raises(ValueError, match="revocado"):
+        sessions.verificar(token)
+
+
+def test_revocar_escribe_en_el_compartido(revocaciones):
+    _, claims = _emitir("compartido@x")
+    sessions.revocar_token(claims)
+    sessions.revocar_usuario("compartido@x")
+    conn = sqlite3.connect(revocaciones)
+    filas = conn.execute("SELECT tipo, clave FROM revocaciones ORDER BY id").fetchall()
+    conn.close()
+    assert filas == [("jti", claims["jti"]), ("usuario", "compartido@x")]
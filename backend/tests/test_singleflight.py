@@ -0,0 +1,93 @@
+import threading
+
+import pytest
+from fastapi import HTTPException
+from google.cloud import bigquery
+
+from app.deps import qparams
+from app.singleflight import SingleFlight, clave
+
+
+def _concurrentes(sf, n, fn, key="k", **kw):
+    """n llamadas a sf.do(key, fn) a la vez; devuelve [(resultado | excepción)]."""
+    out = [None] * n
+    listos = threading.Barrier(n)
+
+    def correr(i):
+        listos.wait()
+        try:
+            out[i] = sf.do(key, fn, **kw)
+        except BaseException as e:
+            out[i] = e
+
+    hilos = [threading.Thread(target=correr, args=(i,)) for i in range(n)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join(5)
+    return out
+
+
+def _lento(resultado, liberar, llamadas):
+    def fn():
+        llamadas.append(1)
+        liberar.wait(2)
+        if isinstance(resultado, BaseException):
+            raise resultado
+        return resultado
+    return fn
+
+
+def test_llamadas_concurrentes_comparten_un_job():
+    sf, liberar, llamadas = SingleFlight(), threading.Event(), []
+    threading.Timer(0.2, liberar.set).start()
+    out = _concurrentes(sf, 5, _lento(["fila"], liberar, llamadas))
+    assert out == [["fila"]] * 5
+    assert len(llamadas) == 1
+    assert sf.estado() == {"jobs_ejecutados": 1, "jobs_ahorrados": 4, "en_vuelo": 0}
+
+
+def test_error_del_lider_se_propaga():
+    sf, liberar, llamadas = SingleFlight(), threading.Event(), []
+    threading.Timer(0.2, liberar.set).start()
+    out = _concurrentes(sf, 3, _lento(RuntimeError("bq"), liberar, llamadas))
+    assert all(isinstance(e, RuntimeError) for e in out)
+    assert len(llamadas) == 1
+
+
+def test_error_propio_del_lider_no_se_contagia():
+    sf, liberar, llamadas = SingleFlight(), threading.Event(), []
+    threading.Timer(0.2, liberar.set).start()
+
+    def fn():
+        llamadas.append(1)
+        if len(llamadas) == 1:
+            liberar.wait(2)
+            raise HTTPException(status_code=429)
+        return "ok"
+
+    out = _concurrentes(sf, 3, fn, reintentar_si=lambda e: isinstance(e, HTTPException))
+    assert sum(r == "ok" for r in out) == 2
+    assert sum(isinstance(r, HTTPException) for r in out) == 1
+    assert len(llamadas) == 3
+
+
+def test_clave_distingue_valores_de_parametros():
+    a = clave("SELECT @x", qparams([("x", "STRING", "a")]))
+    b = clave("SELECT @x", qparams([("x", "STRING", "b")]))
+    assert a != b
+    assert a == clave("SELECT @x", qparams([("x", "STRING", "a")]))
+    assert clave("SELECT 1", None) == clave("SELECT 1", bigquery.QueryJobConfig())
+
+
+def test_secuenciales_no_se_coalescen():
+    sf = SingleFlight()
+
+    def falla():
+        raise ValueError()
+
+    assert sf.do("k", lambda: 1) == 1
+    assert sf.do("k", lambda: 2) == 2
+    with pytest.raises(ValueError):
+        sf.do("k", falla)
+    assert sf.estado()["en_vuelo"] == 0
@@ -8,6 +8,15 @@ let CURRENT_TAB = "gestiones";
 // paginado
 const PAGE = { limit: 50, offset: 0, total: null };
 
+// páginas recientes (LRU por filtros + página); los eventos del stream la invalidan
+const GRID_CACHE = new Map();
+const GRID_CACHE_MAX = 20;
+const GRID_CACHE_TTL_MS = 60000;
+let GRID_CACHE_GEN = 0;
+// request en curso de la grilla y prefetch de la página siguiente
+const GRID_REQ = { ctrl: null, key: null, promise: null, seq: 0 };
+const PREFETCH = { ctrl: null, key: null, promise: null, timer: null };
+
 // cache UI
 let LAST_ROWS = [];
 let LAST_SEARCH = "";
@@ -86,9 +95,72 @@ function saveToken(token) {
   idToken = token;
   if (token) sessionStorage.setItem("idToken", token);
   else sessionStorage.removeItem("idToken");
+  if (!token) saveSessionExp(0);
 }
 function readToken() { return sessionStorage.getItem("idToken"); }
 
+// Sesión de la API: el id_token de Google se canjea una vez en /auth/session;
+// después se usa el token de sesión (se renueva con /auth/refresh antes de vencer).
+let SESSION_EXP = Number(sessionStorage.getItem("sessionExp") || 0);
+let SESSION_REFRESH = null;
+
+function saveSessionExp(exp) {
+  SESSION_EXP = exp || 0;
+  if (SESSION_EXP) sessionStorage.setItem("sessionExp", String(SESSION_EXP));
+  else sessionStorage.removeItem("sessionExp");
+}
+
+async function authPost(path, bearer) {
+  const res = await fetch(API_BASE + path, {
+    method: "POST",
+    headers: { Authorization: `Bearer ${bearer}` },
+    cache: "no-store",
+  });
+  const bodyText = await res.text();
+  if (!res.ok) {
+    const err = new Error(`HTTP ${res.status} ${res.statusText}: ${bodyText}`);
+    err.status = res.status;
+    throw err;
+  }
+  const s = JSON.parse(bodyText);
+  saveToken(s.token);
+  saveSessionExp(s.exp);
+  return s;
+}
+
+function exchangeGoogleToken(credential) {
+  return authPost("/auth/session", credential);
+}
+
+function refreshSession() {
+  if (!SESSION_REFRESH) {
+    SESSION_REFRESH = authPost("/auth/refresh", idToken)
+      .finally(() => { SESSION_REFRESH = null; });
+  }
+  return SESSION_REFRESH;
+}
+
+async function refreshSessionIfNeeded() {
+  if (!idToken || !SESSION_EXP) return;
+  if (SESSION_EXP - Date.now() / 1000 > 60) return;
+  try {
+    await refreshSession();
+  } catch (e) {
+    // 401/403: vencida o usuario dado de baja; api() lo lleva al login con el próximo 401
+    console.warn("No se pudo renovar la sesión:", e);
+  }
+}
+
+// La API ya no acepta la sesión y /auth/refresh tampoco: volver a ingresar con Google.
+function sessionExpired() {
+  logout();
+  setLoginError("La sesión expiró o cambiaron tus permisos. Ingresá de nuevo.");
+  const err = new Error("Sesión expirada");
+  err.status = 401;
+  err.__auth_error = true;
+  return err;
+}
+
 function isAdmin() { return String(CURRENT_USER?.rol || "").toLowerCase() === "admin"; }
 function isSupervisor() { return String(CURRENT_USER?.rol || "").toLowerCase() === "supervisor"; }
 
@@ -148,6 +220,16 @@ function fmtDateLike(v) {
 // ============================
 // Debounce (para búsqueda backend)
 // ============================
+function sleep(ms, signal) {
+  return new Promise((resolve, reject) => {
+    const t = setTimeout(resolve, ms);
+    signal?.addEventListener("abort", () => {
+      clearTimeout(t);
+      reject(new DOMException("Aborted", "AbortError"));
+    }, { once: true });
+  });
+}
+
 function debounce(fn, ms = 250) {
   let t = null;
   return (...args) => {
@@ -190,7 +272,13 @@ async function onGoogleSignIn(response) {
   setAppError("");
 
   try {
-    saveToken(response.credential);
+    try {
+      await exchangeGoogleToken(response.credential);
+    } catch (e) {
+      const authErr = new Error("No autorizado o error de autenticación. Detalle: " + (e?.message || String(e)));
+      authErr.__auth_error = true;
+      throw authErr;
+    }
 
     setAppAuthedUI(true);
     document.getElementById("userBox").innerText = "Validando usuario...";
@@ -214,6 +302,12 @@ async function onGoogleSignIn(response) {
 }
 
 function logout() {
+  stopStream();
+  cancelGridRequests();
+  invalidateGridCache();
+  if (idToken && SESSION_EXP) {
+    fetch(API_BASE + "/auth/logout", { method: "POST", headers: { Authorization: `Bearer ${idToken}` } }).catch(() => {});
+  }
   saveToken(null);
   CURRENT_USER = null;
   setAppAuthedUI(false);
@@ -233,7 +327,10 @@ function logout() {
 // ============================
 // API helper
 // ============================
+const API_RETRIES_429 = 2;
+
 async function api(path, opts = {}) {
+  await refreshSessionIfNeeded();
   opts.headers = opts.headers || {};
   if (idToken) opts.headers["Authorization"] = `Bearer ${idToken}`;
 
@@ -244,7 +341,25 @@ async function api(path, opts = {}) {
 
   opts.cache = "no-store";
 
-  const res = await fetch(API_BASE + path, opts);
+  let res = await fetch(API_BASE + path, opts);
+  // 429: la API no llegó a ejecutar nada (cola de BigQuery llena); se reintenta según Retry-After
+  for (let intento = 0; res.status === 429 && intento < API_RETRIES_429; intento++) {
+    const segundos = Math.min(10, Number(res.headers.get("Retry-After")) || 1);
+    await sleep(segundos * 1000, opts.signal);
+    res = await fetch(API_BASE + path, opts);
+  }
+  // 401 con sesión: revocada (cambio de rol, baja) o vencida. /auth/refresh re-lee el
+  // rol y emite una nueva; se reintenta una vez y, si tampoco sirve, se vuelve al login.
+  if (res.status === 401 && SESSION_EXP) {
+    try {
+      await refreshSession();
+      opts.headers["Authorization"] = `Bearer ${idToken}`;
+      res = await fetch(API_BASE + path, opts);
+    } catch (e) {
+      if (e?.name === "AbortError") throw e;
+    }
+    if (res.status === 401) throw sessionExpired();
+  }
   const ct = res.headers.get("content-type") || "";
   const bodyText = await res.text();
 
@@ -265,7 +380,34 @@ async function api(path, opts = {}) {
 // Boot / Wire
 // ============================
 let WIRED = false;
-const debouncedSearchReload = debounce(() => loadGestiones(true), 250);
+let SUGGEST_SEQ = 0;
+
+function submitSearch(value) {
+  if (String(value).trim() === String(LAST_SEARCH).trim()) return;
+  LAST_SEARCH = value;
+  loadGestiones(true);
+}
+
+async function loadSuggestions(prefix) {
+  const list = document.getElementById("searchSugerencias");
+  if (!list) return;
+  const seq = ++SUGGEST_SEQ;
+  let items = [];
+  if (prefix.trim().length >= 2) {
+    try {
+      const resp = await api(`/gestiones/sugerencias?prefix=${encodeURIComponent(prefix)}&limit=10`);
+      items = resp?.items || [];
+    } catch (e) {
+      console.warn("Sugerencias no disponibles:", e);
+    }
+  }
+  if (seq !== SUGGEST_SEQ) return; // llegó tarde: ya se pidió otro prefijo
+  list.innerHTML = items
+    .map((it) => `<option value="${escapeHtml(it.texto)}">${escapeHtml(it.tipo)} · ${it.gestiones}</option>`)
+    .join("");
+}
+
+const debouncedSuggest = debounce((value) => loadSuggestions(value), 120);
 
 function wireUI() {
   if (WIRED) return;
@@ -281,11 +423,24 @@ function wireUI() {
 
   document.getElementById("departamentoFilter")?.addEventListener("change", onDepartamentoFilterChange);
   document.getElementById("localidadFilter")?.addEventListener("change", () => loadGestiones(true));
-
-  // búsqueda server-side
-  document.getElementById("searchInput")?.addEventListener("input", (e) => {
-    LAST_SEARCH = e.target.value || "";
-    debouncedSearchReload();
+  document.getElementById("archivoFilter")?.addEventListener("change", () => loadGestiones(true));
+
+  // búsqueda server-side: al tipear solo sugerencias (en memoria en la API);
+  // la búsqueda completa corre con Enter, al elegir una sugerencia o al limpiar
+  const searchInput = document.getElementById("searchInput");
+  searchInput?.addEventListener("input", (e) => {
+    const value = e.target.value || "";
+    if (e.inputType === "insertReplacementText" || e.inputType === undefined || value === "") {
+      submitSearch(value);
+      return;
+    }
+    debouncedSuggest(value);
+  });
+  searchInput?.addEventListener("keydown", (e) => {
+    if (e.key === "Enter") {
+      e.preventDefault();
+      submitSearch(e.target.value || "");
+    }
   });
 
   document.getElementById("ng_departamento")?.addEventListener("change", onNewGestionDeptoChange);
@@ -296,9 +451,18 @@ function wireUI() {
 
   document.getElementById("btnPrev")?.addEventListener("click", () => pagePrev());
   document.getElementById("btnNext")?.addEventListener("click", () => pageNext());
+  document.getElementById("pageSizeSelect")?.addEventListener("change", (e) => {
+    PAGE.limit = Number(e.target.value) || 50;
+    loadGestiones(true);
+  });
+  document.getElementById("gridWrap")?.addEventListener("scroll", onGridScroll, { passive: true });
+  window.addEventListener("resize", onGridScroll);
 
   document.getElementById("btnLogout")?.addEventListener("click", logout);
 
+  const debouncedUsersReload = debounce(() => loadUsers(), 300);
+  document.getElementById("usersSearch")?.addEventListener("input", debouncedUsersReload);
+
   document.addEventListener("keydown", (e) => {
     if (e.key === "Escape") {
       closeModal("modalNewGestion");
@@ -612,14 +776,14 @@ function currentFilters() {
     canal_origen: document.getElementById("canalOrigenFilter")?.value || null,
 
     q: q || null,
+
+    // terminadas / borradas viejas que ya pasaron a gestiones_archivo
+    incluir_archivo: !!document.getElementById("archivoFilter")?.checked,
   };
 }
 
-async function loadGestiones(resetOffset = false) {
-  setAppError("");
-  if (resetOffset) PAGE.offset = 0;
-
-  const { estado, ministerio, categoria, departamento, localidad, q, tipo_gestion, canal_origen } = currentFilters();
+function gestionesQueryString(offset) {
+  const { estado, ministerio, categoria, departamento, localidad, q, tipo_gestion, canal_origen, incluir_archivo } = currentFilters();
 
   const qs = new URLSearchParams();
   if (estado) qs.set("estado", estado);
@@ -630,16 +794,327 @@ async function loadGestiones(resetOffset = false) {
   if (tipo_gestion) qs.set("tipo_gestion", tipo_gestion);
   if (canal_origen) qs.set("canal_origen", canal_origen);
   if (q) qs.set("q", q);
+  if (incluir_archivo) qs.set("incluir_archivo", "true");
 
   qs.set("limit", String(PAGE.limit));
-  qs.set("offset", String(PAGE.offset));
+  qs.set("offset", String(offset));
+  return qs.toString();
+}
+
+function cacheGet(key) {
+  const hit = GRID_CACHE.get(key);
+  if (!hit) return null;
+  GRID_CACHE.delete(key);
+  if (Date.now() - hit.at > GRID_CACHE_TTL_MS) return null;
+  GRID_CACHE.set(key, hit); // al final: más reciente
+  return hit.resp;
+}
+
+function cachePut(key, resp, gen) {
+  if (gen !== GRID_CACHE_GEN) return; // se pidió antes de una invalidación: puede estar vieja
+  GRID_CACHE.delete(key);
+  GRID_CACHE.set(key, { resp, at: Date.now() });
+  while (GRID_CACHE.size > GRID_CACHE_MAX) GRID_CACHE.delete(GRID_CACHE.keys().next().value);
+}
+
+function invalidateGridCache() {
+  GRID_CACHE_GEN++;
+  GRID_CACHE.clear();
+  GRID_REQ.key = null; // la que está en vuelo sigue, pero no se comparte con las nuevas
+  clearTimeout(PREFETCH.timer);
+  PREFETCH.ctrl?.abort();
+  PREFETCH.ctrl = PREFETCH.key = PREFETCH.promise = null;
+}
+
+// Clave de una página sin el offset: todas las páginas de un mismo juego de filtros.
+function filtersKey(key) {
+  const qs = new URLSearchParams(key);
+  qs.delete("offset");
+  return qs.toString();
+}
+
+// Un evento del stream solo invalida los juegos de filtros que puede cambiar: los que
+// tienen la fila en alguna página cacheada o, si puede entrar (alta, o cambio con filtros
+// activos), cuyos filtros la fila cumple. El resto del LRU y el prefetch siguen valiendo.
+const STREAM_FILTROS = ["estado", "ministerio", "categoria", "departamento", "localidad", "tipo_gestion", "canal_origen", "q"];
+
+function invalidateGridCacheFor(type, id, gestion) {
+  const puedeEntrar = (filtros) =>
+    !!gestion && (type === "creada" || STREAM_FILTROS.some((k) => filtros[k])) &&
+    rowMatchesFilters(gestion, { search: false, filters: filtros });
+
+  const afectados = new Set();
+  for (const [key, hit] of GRID_CACHE) {
+    const fk = filtersKey(key);
+    if (afectados.has(fk)) continue;
+    const tiene = (hit.resp?.items || []).some((r) => pick(r, "id_gestion") === id);
+    if (tiene || puedeEntrar(Object.fromEntries(new URLSearchParams(key)))) afectados.add(fk);
+  }
+  const actual = filtersKey(gestionesQueryString(PAGE.offset));
+  const enPantalla = LAST_ROWS.some((r) => pick(r, "id_gestion") === id);
+  if (enPantalla || puedeEntrar(currentFilters())) afectados.add(actual);
+  if (!afectados.size) return;
+
+  for (const key of [...GRID_CACHE.keys()]) {
+    if (afectados.has(filtersKey(key))) GRID_CACHE.delete(key);
+  }
+  if (afectados.has(actual)) {
+    // lo que está en vuelo para estos filtros se pidió antes del cambio: que no se cachee
+    GRID_CACHE_GEN++;
+    GRID_REQ.key = null;
+    clearTimeout(PREFETCH.timer);
+    PREFETCH.ctrl?.abort();
+    PREFETCH.ctrl = PREFETCH.key = PREFETCH.promise = null;
+  }
+}
+
+function cancelGridRequests() {
+  GRID_REQ.ctrl?.abort();
+  GRID_REQ.ctrl = GRID_REQ.key = GRID_REQ.promise = null;
+  GRID_REQ.seq++;
+}
+
+function isAbort(e) {
+  return e?.name === "AbortError";
+}
+
+function schedulePrefetch(resp, rows) {
+  clearTimeout(PREFETCH.timer);
+  const total = resp?.total ?? null;
+  const next = PAGE.offset + PAGE.limit;
+  if (total != null ? next >= total : rows.length < PAGE.limit) return;
+
+  const key = gestionesQueryString(next);
+  if (GRID_CACHE.has(key) || PREFETCH.key === key) return;
+
+  // después de pintar: la página actual tiene prioridad sobre la siguiente
+  PREFETCH.timer = setTimeout(() => {
+    PREFETCH.ctrl?.abort();
+    const ctrl = new AbortController();
+    const gen = GRID_CACHE_GEN;
+    const promise = api(`/gestiones/?${key}`, { signal: ctrl.signal })
+      .then((r) => { cachePut(key, r, gen); return r; })
+      .finally(() => {
+        if (PREFETCH.ctrl === ctrl) PREFETCH.ctrl = PREFETCH.key = PREFETCH.promise = null;
+      });
+    promise.catch((e) => { if (!isAbort(e)) console.warn("Prefetch de gestiones falló:", e); });
+    Object.assign(PREFETCH, { ctrl, key, promise });
+  }, 300);
+}
+
+async function fetchGestionesPage(key) {
+  const cached = cacheGet(key);
+  if (cached) return cached;
+
+  // la pidió el prefetch y todavía no llegó: esperamos esa en vez de repetirla
+  if (PREFETCH.key === key && PREFETCH.promise) {
+    try { return await PREFETCH.promise; } catch (e) { if (!isAbort(e)) throw e; }
+  }
+
+  // la misma página ya está en vuelo (doble click): se comparte
+  if (GRID_REQ.key === key && GRID_REQ.promise) return GRID_REQ.promise;
+
+  GRID_REQ.ctrl?.abort(); // la anterior quedó vieja: que no pise esta
+  const ctrl = new AbortController();
+  const gen = GRID_CACHE_GEN;
+  const promise = api(`/gestiones/?${key}`, { signal: ctrl.signal })
+    .then((resp) => { cachePut(key, resp, gen); return resp; })
+    .finally(() => {
+      if (GRID_REQ.ctrl === ctrl) GRID_REQ.ctrl = GRID_REQ.key = GRID_REQ.promise = null;
+    });
+  Object.assign(GRID_REQ, { ctrl, key, promise });
+  return promise;
+}
+
+async function loadGestiones(resetOffset = false) {
+  setAppError("");
+  if (resetOffset) PAGE.offset = 0;
+
+  const key = gestionesQueryString(PAGE.offset);
+  const seq = ++GRID_REQ.seq;
+  if (PREFETCH.key && PREFETCH.key !== key) {
+    clearTimeout(PREFETCH.timer);
+    PREFETCH.ctrl?.abort();
+  }
+
+  let resp;
+  try {
+    resp = await fetchGestionesPage(key);
+  } catch (e) {
+    if (isAbort(e)) return;
+    throw e;
+  }
+  if (seq !== GRID_REQ.seq) return; // llegó tarde: ya se pidió otra página/filtros
 
-  const resp = await api(`/gestiones/?${qs.toString()}`);
-  const rows = normalizeRows(resp);
+  // copia: el stream edita LAST_ROWS en el lugar y la página cacheada no debe cambiar
+  const rows = normalizeRows(resp).slice();
 
   LAST_ROWS = rows;
   updatePagerInfo(resp, rows);
-  renderGrid(rows);
+  renderGrid(rows, { resetScroll: true });
+  ensureStream();
+  schedulePrefetch(resp, rows);
+}
+
+// ============================
+// Cambios en vivo (SSE /gestiones/stream)
+// ============================
+// EventSource no permite el header Authorization: leemos el stream con fetch.
+const STREAM = { ctrl: null, key: null, connected: false, retryTimer: null };
+
+function streamQueryString() {
+  const { estado, ministerio, categoria, departamento, localidad, tipo_gestion, canal_origen } = currentFilters();
+  const qs = new URLSearchParams();
+  if (estado) qs.set("estado", estado);
+  if (ministerio) qs.set("ministerio", ministerio);
+  if (categoria) qs.set("categoria", categoria);
+  if (departamento) qs.set("departamento", departamento);
+  if (localidad) qs.set("localidad", localidad);
+  if (tipo_gestion) qs.set("tipo_gestion", tipo_gestion);
+  if (canal_origen) qs.set("canal_origen", canal_origen);
+  return qs.toString();
+}
+
+function stopStream() {
+  clearTimeout(STREAM.retryTimer);
+  STREAM.retryTimer = null;
+  STREAM.ctrl?.abort();
+  STREAM.ctrl = null;
+  STREAM.key = null;
+  STREAM.connected = false;
+}
+
+function ensureStream() {
+  if (!idToken || !window.ReadableStream) return;
+  const key = streamQueryString();
+  if (STREAM.ctrl && STREAM.key === key) return;
+
+  stopStream();
+  const ctrl = new AbortController();
+  STREAM.ctrl = ctrl;
+  STREAM.key = key;
+
+  runStream(ctrl, key).catch((e) => {
+    if (ctrl.signal.aborted) return;
+    console.warn("Stream de gestiones cortado:", e);
+  }).finally(() => {
+    if (STREAM.ctrl !== ctrl) return;
+    STREAM.connected = false;
+    STREAM.ctrl = null;
+    STREAM.key = null;
+    // reconectar y resincronizar (pudimos perder eventos mientras estuvo caído)
+    STREAM.retryTimer = setTimeout(() => {
+      if (!idToken) return;
+      invalidateGridCache();
+      loadGestiones(false).catch(() => {});
+    }, 5000);
+  });
+}
+
+async function runStream(ctrl, key) {
+  const res = await fetch(`${API_BASE}/gestiones/stream${key ? "?" + key : ""}`, {
+    headers: { Authorization: `Bearer ${idToken}` },
+    cache: "no-store",
+    signal: ctrl.signal,
+  });
+  if (!res.ok || !res.body) throw new Error(`HTTP ${res.status}`);
+  STREAM.connected = true;
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buf = "";
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buf += decoder.decode(value, { stream: true });
+
+    let sep;
+    while ((sep = buf.indexOf("\n\n")) >= 0) {
+      const chunk = buf.slice(0, sep);
+      buf = buf.slice(sep + 2);
+
+      let type = "message";
+      const data = [];
+      chunk.split("\n").forEach((line) => {
+        if (line.startsWith("event:")) type = line.slice(6).trim();
+        else if (line.startsWith("data:")) data.push(line.slice(5).trim());
+      });
+      if (!data.length) continue;
+
+      try { applyStreamEvent(type, JSON.parse(data.join("\n"))); }
+      catch (e) { console.warn("Evento inválido:", e); }
+    }
+  }
+}
+
+function rowMatchesSearch(row) {
+  const q = String(LAST_SEARCH || "").trim().toLowerCase();
+  if (!q) return true;
+  return Object.values(row || {}).some((v) => v != null && String(v).toLowerCase().includes(q));
+}
+
+// Mismo criterio que el filtro del stream / LIST_GESTIONES: exactos, depto/localidad sin mayúsculas.
+function rowMatchesFilters(row, { search = true, filters = null } = {}) {
+  const f = filters || currentFilters();
+  const exactos = {
+    estado: "estado",
+    ministerio: "ministerio_agencia_id",
+    categoria: "categoria_general_id",
+    tipo_gestion: "tipo_gestion",
+    canal_origen: "canal_origen",
+  };
+  for (const [k, col] of Object.entries(exactos)) {
+    if (f[k] && pick(row, col) !== f[k]) return false;
+  }
+  for (const k of ["departamento", "localidad"]) {
+    if (f[k] && String(pick(row, k) ?? "").trim().toUpperCase() !== f[k].trim().toUpperCase()) return false;
+  }
+  return !search || rowMatchesSearch(row);
+}
+
+function applyStreamEvent(type, ev) {
+  if (type === "resync") {
+    invalidateGridCache();
+    loadGestiones(false).catch(() => {});
+    return;
+  }
+
+  const id = ev?.id_gestion;
+  if (!id) return;
+  invalidateGridCacheFor(type, id, ev.gestion);
+  const idx = LAST_ROWS.findIndex((r) => pick(r, "id_gestion") === id);
+
+  if (type === "creada") {
+    if (idx >= 0 || !ev.gestion || !rowMatchesFilters(ev.gestion)) return;
+    if (PAGE.total != null) PAGE.total += 1;
+    if (PAGE.offset === 0) {
+      LAST_ROWS.unshift(ev.gestion);
+      if (LAST_ROWS.length > PAGE.limit) LAST_ROWS.length = PAGE.limit;
+    }
+  } else if (type === "estado" || type === "actualizada") {
+    if (idx < 0) return;
+    // el server manda los cambios sin filtrar: si la fila dejó de cumplir los filtros, sale.
+    // La búsqueda `q` no: el server busca también en campos que la grilla no tiene.
+    const fila = { ...LAST_ROWS[idx], ...(ev.gestion || {}) };
+    if (!rowMatchesFilters(fila, { search: false })) {
+      LAST_ROWS.splice(idx, 1);
+      if (PAGE.total != null) PAGE.total = Math.max(0, PAGE.total - 1);
+    } else {
+      LAST_ROWS[idx] = fila;
+    }
+  } else if (type === "eliminada") {
+    if (idx < 0) return;
+    LAST_ROWS.splice(idx, 1);
+    if (PAGE.total != null) PAGE.total = Math.max(0, PAGE.total - 1);
+  } else {
+    return;
+  }
+
+  updatePagerInfo({ total: PAGE.total, limit: PAGE.limit, offset: PAGE.offset }, LAST_ROWS);
+  // sin prefetch acá: con muchos clientes cada escritura dispararía un GET por grilla abierta;
+  // la página siguiente se pide al navegar o en el próximo load
+  renderGrid(LAST_ROWS);
 }
 
 function pagePrev() {
@@ -651,103 +1126,167 @@ function pageNext() {
   loadGestiones(false);
 }
 
-function renderGrid(rows) {
+// Grilla virtualizada: solo se crean los <tr> visibles (más un margen) y dos
+// filas espaciadoras mantienen el alto total, así el scroll es el real.
+const GRID_COLS = [
+  { key: "id_gestion", label: "ID" },
+  { key: "departamento", label: "Departamento" },
+  { key: "localidad", label: "Localidad" },
+  { key: "estado", label: "Estado" },
+  { key: "urgencia", label: "Urgencia" },
+  { key: "ministerio_agencia_id", label: "Ministerio/Agencia" },
+  { key: "categoria_general_id", label: "Categoría" },
+
+  // ✅ nuevos
+  { key: "tipo_gestion", label: "Tipo" },
+  { key: "canal_origen", label: "Canal" },
+
+  { key: "detalle", label: "Detalle" },
+  { key: "costo_estimado", label: "Costo" },
+  { key: "fecha_ingreso", label: "Ingreso" },
+  { key: "dias_transcurridos", label: "Días" },
+];
+const GRID_OVERSCAN = 10;
+const GRID = { rows: [], maps: null, rowHeight: 41, start: -1, end: -1, raf: null };
+
+function renderGrid(rows, { resetScroll = false } = {}) {
   if (!Array.isArray(rows)) rows = [];
 
   const table = document.getElementById("grid");
   if (!table) return;
-  table.innerHTML = "";
-
-  const minMap = new Map((CATALOGOS.ministerios || []).map((m) => [m.id, m.nombre]));
-  const catMap = new Map((CATALOGOS.categorias || []).map((c) => [c.id, c.nombre]));
-  const tipoMap = new Map((CATALOGOS.tiposGestion || []).map((t) => [t.id, t.nombre]));
-  const canalMap = new Map((CATALOGOS.canalesOrigen || []).map((c) => [c.id, c.nombre]));
 
-  const cols = [
-    { key: "id_gestion", label: "ID" },
-    { key: "departamento", label: "Departamento" },
-    { key: "localidad", label: "Localidad" },
-    { key: "estado", label: "Estado" },
-    { key: "urgencia", label: "Urgencia" },
-    { key: "ministerio_agencia_id", label: "Ministerio/Agencia" },
-    { key: "categoria_general_id", label: "Categoría" },
+  if (!table.tHead) {
+    const thead = document.createElement("thead");
+    const trh = document.createElement("tr");
+    GRID_COLS.forEach((c) => {
+      const th = document.createElement("th");
+      th.textContent = c.label;
+      trh.appendChild(th);
+    });
+    const thA = document.createElement("th");
+    thA.textContent = "Acciones";
+    trh.appendChild(thA);
+    thead.appendChild(trh);
+    table.appendChild(thead);
+    table.appendChild(document.createElement("tbody"));
+  }
 
-    // ✅ nuevos
-    { key: "tipo_gestion", label: "Tipo" },
-    { key: "canal_origen", label: "Canal" },
+  GRID.rows = rows;
+  GRID.maps = {
+    min: new Map((CATALOGOS.ministerios || []).map((m) => [m.id, m.nombre])),
+    cat: new Map((CATALOGOS.categorias || []).map((c) => [c.id, c.nombre])),
+    tipo: new Map((CATALOGOS.tiposGestion || []).map((t) => [t.id, t.nombre])),
+    canal: new Map((CATALOGOS.canalesOrigen || []).map((c) => [c.id, c.nombre])),
+  };
+  GRID.canDelete = isAdmin() || isSupervisor();
 
-    { key: "detalle", label: "Detalle" },
-    { key: "costo_estimado", label: "Costo" },
-    { key: "fecha_ingreso", label: "Ingreso" },
-    { key: "dias_transcurridos", label: "Días" },
-  ];
+  const wrap = document.getElementById("gridWrap");
+  if (resetScroll && wrap) wrap.scrollTop = 0;
+  paintGridRows(true);
+}
 
-  const thead = document.createElement("thead");
-  const trh = document.createElement("tr");
-  cols.forEach((c) => {
-    const th = document.createElement("th");
-    th.textContent = c.label;
-    trh.appendChild(th);
+function onGridScroll() {
+  if (GRID.raf) return;
+  GRID.raf = requestAnimationFrame(() => {
+    GRID.raf = null;
+    paintGridRows(false);
   });
-  const thA = document.createElement("th");
-  thA.textContent = "Acciones";
-  trh.appendChild(thA);
-  thead.appendChild(trh);
-  table.appendChild(thead);
-
-  const tbody = document.createElement("tbody");
-
-  rows.forEach((r) => {
-    const tr = document.createElement("tr");
-
-    cols.forEach((c) => {
-      const td = document.createElement("td");
-
-      if (c.key === "ministerio_agencia_id") {
-        const id = pick(r, "ministerio_agencia_id");
-        td.textContent = id ? (minMap.get(id) || id) : "";
-      } else if (c.key === "categoria_general_id") {
-        const id = pick(r, "categoria_general_id");
-        td.textContent = id ? (catMap.get(id) || id) : "";
-      } else if (c.key === "tipo_gestion") {
-        const id = pick(r, "tipo_gestion");
-        td.textContent = id ? (tipoMap.get(id) || id) : "";
-      } else if (c.key === "canal_origen") {
-        const id = pick(r, "canal_origen");
-        td.textContent = id ? (canalMap.get(id) || id) : "";
-      } else if (c.key === "detalle") {
-        const txt = String(pick(r, "detalle") ?? "");
-        td.innerHTML = `<div class="cell-wrap" title="${escapeHtml(txt)}">${escapeHtml(txt)}</div>`;
-      } else if (c.key === "costo_estimado") {
-        const v = pick(r, "costo_estimado");
-        const m = pick(r, "costo_moneda");
-        td.textContent = (v === null || v === undefined || v === "") ? "" : `${v}${m ? " " + m : ""}`;
-      } else {
-        td.textContent = pick(r, c.key) ?? "";
-      }
+}
 
-      tr.appendChild(td);
-    });
+function gridSpacer(height) {
+  const tr = document.createElement("tr");
+  tr.className = "grid-spacer";
+  const td = document.createElement("td");
+  td.colSpan = GRID_COLS.length + 1;
+  td.style.height = `${height}px`;
+  tr.appendChild(td);
+  return tr;
+}
 
-    const tdA = document.createElement("td");
-    tdA.className = "actions";
-    const canDelete = isAdmin() || isSupervisor();
+function paintGridRows(force, measure = force) {
+  const table = document.getElementById("grid");
+  const tbody = table?.tBodies[0];
+  if (!tbody) return;
+
+  const rows = GRID.rows;
+  const wrap = document.getElementById("gridWrap");
+  const headH = table.tHead?.offsetHeight || 0;
+  const viewH = wrap?.clientHeight || window.innerHeight;
+  const top = Math.max(0, (wrap?.scrollTop || 0) - headH);
+
+  // inicio par: así el zebra (nth-child) no titila al scrollear
+  let start = Math.max(0, Math.floor(top / GRID.rowHeight) - GRID_OVERSCAN);
+  start -= start % 2;
+  const end = Math.min(rows.length, Math.ceil((top + viewH) / GRID.rowHeight) + GRID_OVERSCAN);
+  if (!force && start === GRID.start && end === GRID.end) return;
+  GRID.start = start;
+  GRID.end = end;
+
+  const frag = document.createDocumentFragment();
+  frag.appendChild(gridSpacer(start * GRID.rowHeight));
+  for (let i = start; i < end; i++) frag.appendChild(buildGridRow(rows[i]));
+  frag.appendChild(gridSpacer((rows.length - end) * GRID.rowHeight));
+  tbody.replaceChildren(frag);
+
+  // alto real de fila (depende de fuente/zoom): si cambió, se recalcula la ventana
+  const first = tbody.rows[1];
+  if (measure && end > start && first?.offsetHeight && Math.abs(first.offsetHeight - GRID.rowHeight) > 1) {
+    GRID.rowHeight = first.offsetHeight;
+    paintGridRows(true, false);
+  }
+}
 
-    const id = pick(r, "id_gestion") ?? "";
-    tdA.innerHTML = `
-      <div class="actions-wrap">
-        <button class="btn" type="button" onclick="openDetalle('${escapeHtml(id)}')">Ver</button>
-        <button class="btn" type="button" onclick="openChangeState('${escapeHtml(id)}')">Modificar Estado</button>
-        <button class="btn" type="button" onclick="openEventos('${escapeHtml(id)}')">Eventos</button>
-        ${canDelete ? `<button class="btn btn-danger" type="button" onclick="deleteGestion('${escapeHtml(id)}')">Eliminar</button>` : ``}
-      </div>
-    `;
-    tr.appendChild(tdA);
+function buildGridRow(r) {
+  const { min: minMap, cat: catMap, tipo: tipoMap, canal: canalMap } = GRID.maps;
+  const tr = document.createElement("tr");
+
+  GRID_COLS.forEach((c) => {
+    const td = document.createElement("td");
+
+    if (c.key === "ministerio_agencia_id") {
+      const id = pick(r, "ministerio_agencia_id");
+      td.textContent = id ? (pick(r, "ministerio_nombre") || minMap.get(id) || id) : "";
+    } else if (c.key === "categoria_general_id") {
+      const id = pick(r, "categoria_general_id");
+      td.textContent = id ? (pick(r, "categoria_nombre") || catMap.get(id) || id) : "";
+    } else if (c.key === "tipo_gestion") {
+      const id = pick(r, "tipo_gestion");
+      td.textContent = id ? (pick(r, "tipo_gestion_nombre") || tipoMap.get(id) || id) : "";
+    } else if (c.key === "canal_origen") {
+      const id = pick(r, "canal_origen");
+      td.textContent = id ? (pick(r, "canal_origen_nombre") || canalMap.get(id) || id) : "";
+    } else if (c.key === "detalle") {
+      const txt = String(pick(r, "detalle") ?? "");
+      const div = document.createElement("div");
+      div.className = "cell-wrap";
+      div.title = txt;
+      div.textContent = txt;
+      td.appendChild(div);
+    } else if (c.key === "costo_estimado") {
+      const v = pick(r, "costo_estimado");
+      const m = pick(r, "costo_moneda");
+      td.textContent = (v === null || v === undefined || v === "") ? "" : `${v}${m ? " " + m : ""}`;
+    } else {
+      td.textContent = pick(r, c.key) ?? "";
+    }
 
-    tbody.appendChild(tr);
+    tr.appendChild(td);
   });
 
-  table.appendChild(tbody);
+  const tdA = document.createElement("td");
+  tdA.className = "actions";
+
+  const id = pick(r, "id_gestion") ?? "";
+  tdA.innerHTML = `
+    <div class="actions-wrap">
+      <button class="btn" type="button" onclick="openDetalle('${escapeHtml(id)}')">Ver</button>
+      <button class="btn" type="button" onclick="openChangeState('${escapeHtml(id)}')">Modificar Estado</button>
+      <button class="btn" type="button" onclick="openEventos('${escapeHtml(id)}')">Eventos</button>
+      ${GRID.canDelete ? `<button class="btn btn-danger" type="button" onclick="deleteGestion('${escapeHtml(id)}')">Eliminar</button>` : ``}
+    </div>
+  `;
+  tr.appendChild(tdA);
+  return tr;
 }
 
 // ============================
@@ -767,7 +1306,7 @@ async function openDetalle(id) {
 
   try {
     const [g, ev] = await Promise.all([
-      api(`/gestiones/${encodeURIComponent(id)}`),
+      api(`/gestiones/${encodeURIComponent(id)}${currentFilters().incluir_archivo ? "?incluir_archivo=true" : ""}`),
       api(`/gestiones/${encodeURIComponent(id)}/eventos`).catch(() => []),
     ]);
 
@@ -782,13 +1321,13 @@ async function openDetalle(id) {
 
     const ministerioId = pick(g, "ministerio_agencia_id");
     const categoriaId = pick(g, "categoria_general_id");
-    const ministerioNombre = ministerioId ? (minMap.get(ministerioId) || ministerioId) : "";
-    const categoriaNombre = categoriaId ? (catMap.get(categoriaId) || categoriaId) : "";
+    const ministerioNombre = ministerioId ? (pick(g, "ministerio_nombre") || minMap.get(ministerioId) || ministerioId) : "";
+    const categoriaNombre = categoriaId ? (pick(g, "categoria_nombre") || catMap.get(categoriaId) || categoriaId) : "";
 
     const tipoId = pick(g, "tipo_gestion");
     const canalId = pick(g, "canal_origen");
-    const tipoNombre = tipoId ? (tipoMap.get(tipoId) || tipoId) : "";
-    const canalNombre = canalId ? (canalMap.get(canalId) || canalId) : "";
+    const tipoNombre = tipoId ? (pick(g, "tipo_gestion_nombre") || tipoMap.get(tipoId) || tipoId) : "";
+    const canalNombre = canalId ? (pick(g, "canal_origen_nombre") || canalMap.get(canalId) || canalId) : "";
 
     const costo = pick(g, "costo_estimado");
     const moneda = pick(g, "costo_moneda");
@@ -817,7 +1356,7 @@ async function openDetalle(id) {
         .map(([k, v]) => kvRow(k, String(v)))
         .join("");
 
-    const arr = Array.isArray(ev) ? ev : [];
+    const arr = normalizeRows(ev);
     arr.sort((a, b) => {
       const ta = new Date(pick(a, "fecha_evento") || 0).getTime();
       const tb = new Date(pick(b, "fecha_evento") || 0).getTime();
@@ -877,7 +1416,7 @@ async function openDetalle(id) {
 async function openEventos(id) {
   const ev = await api(`/gestiones/${encodeURIComponent(id)}/eventos`);
   document.getElementById("ev_title").textContent = `Eventos · ${id}`;
-  document.getElementById("ev_body").textContent = JSON.stringify(ev, null, 2);
+  document.getElementById("ev_body").textContent = JSON.stringify(normalizeRows(ev), null, 2);
   openModal("modalEventos");
 }
 
@@ -891,8 +1430,9 @@ async function deleteGestion(id) {
 
   try {
     await api(`/gestiones/${encodeURIComponent(id)}`, { method: "DELETE" });
+    invalidateGridCache();
     alert("Gestión eliminada correctamente.");
-    await loadGestiones(true);
+    if (!STREAM.connected) await loadGestiones(true);
   } catch (e) {
     alert("No se pudo eliminar la gestión.\n\nDetalle: " + (e?.message || String(e)));
   }
@@ -933,9 +1473,10 @@ async function submitChangeState() {
     method: "POST",
     body: { nuevo_estado: nuevo, comentario, derivado_a, acciones_implementadas },
   });
+  invalidateGridCache();
 
   closeModal("modalChangeState");
-  await loadGestiones(false);
+  if (!STREAM.connected) await loadGestiones(false);
 }
 
 // ============================
@@ -1000,8 +1541,7 @@ async function submitNewGestion() {
     if (!localidad) return alert("Seleccioná una localidad");
     if (!detalle || detalle.trim() === "") return alert("Detalle es obligatorio");
 
-    await api(`/catalogos/geo?departamento=${encodeURIComponent(departamento)}&localidad=${encodeURIComponent(localidad)}`);
-
+    // el alta valida departamento/localidad (y sugiere si no coinciden): sin pre-chequeo aparte
     const payload = {
       ministerio_agencia_id: ministerio,
       categoria_general_id: categoria,
@@ -1024,11 +1564,20 @@ async function submitNewGestion() {
     };
 
     const resp = await api(`/gestiones`, { method: "POST", body: payload });
+    invalidateGridCache();
 
     closeModal("modalNewGestion");
-    await loadGestiones(true);
-
-    if (resp?.id_gestion) alert(`Gestión creada: ${resp.id_gestion}`);
+    if (!STREAM.connected || PAGE.offset !== 0) await loadGestiones(true);
+
+    if (resp?.id_gestion) {
+      const dups = resp.posibles_duplicados || [];
+      const aviso = dups.length
+        ? "\n\nPosibles duplicados en la misma localidad:\n" +
+          dups.map((d) => `- ${d.id_gestion} (${Math.round(d.similitud * 100)}%, ${d.estado || "-"}): ${d.detalle || ""}`).join("\n")
+        : "";
+      const pendiente = resp.pendiente ? "\n\n(Registrada: se confirma en BigQuery en segundo plano.)" : "";
+      alert(`Gestión creada: ${resp.id_gestion}${pendiente}${aviso}`);
+    }
   } catch (e) {
     console.error(e);
     alert("No se pudo crear la gestión.\n\nDetalle: " + (e?.message || String(e)));
@@ -1080,10 +1629,15 @@ async function loadUsers() {
   setUsersHint("Cargando...");
 
   try {
-    const rows = await api(`/usuarios/`);
-    LAST_USERS = Array.isArray(rows) ? rows : [];
+    const qs = new URLSearchParams({ limit: "200", offset: "0" });
+    const q = String(document.getElementById("usersSearch")?.value || "").trim();
+    if (q) qs.set("q", q);
+
+    const resp = await api(`/usuarios/?${qs.toString()}`);
+    LAST_USERS = normalizeRows(resp);
     renderUsersGrid(LAST_USERS);
-    setUsersHint(`Usuarios: ${LAST_USERS.length}`);
+    const total = resp?.total ?? LAST_USERS.length;
+    setUsersHint(total > LAST_USERS.length ? `Usuarios: ${LAST_USERS.length} de ${total}` : `Usuarios: ${total}`);
   } catch (e) {
     console.error(e);
     setUsersHint("");